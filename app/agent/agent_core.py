@@ -1,34 +1,32 @@
+import asyncio
 import base64
-import os
 from typing import AsyncGenerator
-from agno.agent import Agent
-from agno.models.openrouter import OpenRouter
 from app.agent.tool_engine import ToolEngine
-from app.services.file_processor import extract_text_from_image_bytes, extract_text_from_pdf_bytes
+from app.services.extraction_service import extract_text_async
+from app.services.worker_pool import WorkerPoolSaturado, WorkerTimeout
 from app.services.municipal_info_tool import MunicipalInfoTool
 from app.agent.tool_engine import TrashScheduleTool
 from app.agent.pothole_report_tool import PotholeReportTool
 from app.agent.structured_output import build_structured_output
 from app.agent.municipal_form_tool import MunicipalFormTool
-from app.db.database import async_session
 from app.db.models import McpDocument
-from app.services.embedding_service import generate_embedding
+from app.services.hybrid_search import buscar_hibrido
 from app.agent.appointment_tool import AppointmentTool
-from sqlalchemy import text
+from app.services.tracing import span
+from app.agent.model_router import model_router, RAG_ANSWER, SHORT_ANSWER
+from app.services.response_cache import get_cached_response, set_cached_response, response_cache_version
+from app.services.session_memory import get_session_memory, with_history
+from app.config.settings import settings
 import re
+import time
+from app.services.metrics_service import log_stage_latency
 
 class MomostenangoAgent:
     def __init__(self):
         self.tools = [MunicipalFormTool(),PotholeReportTool(),TrashScheduleTool(),AppointmentTool()]
         self.tool_engine = ToolEngine(self.tools)
         print(f"🧪 Tools cargadas: {[tool.name for tool in self.tools]}")
-
-        self.agent = Agent(
-            model=OpenRouter(
-                id="qwen/qwen2.5-vl-32b-instruct:free",
-                api_key=os.getenv("OPENROUTER_API_KEY")
-            )
-        )
+        # Las llamadas al modelo van por app.services.openrouter (cliente HTTP compartido)
     @staticmethod
     def extraer_top_k(prompt: str, default: int = 4) -> int:
         matches = re.findall(r"top[\s-]?(\d{1,2})", prompt.lower())
@@ -45,74 +43,84 @@ class MomostenangoAgent:
         return any(trigger in prompt.lower() for trigger in triggers)
 
     async def buscar_en_mcp(self, query: str, top_k: int = 4) -> str:
-        query_embedding = generate_embedding(query)
-        vector_str = f"[{', '.join(map(str, query_embedding))}]"
-
-        sql = text("""
-            SELECT filename, content, embedding_pg <#> :query_vector AS distance
-            FROM mcpdocument
-            ORDER BY distance ASC
-            LIMIT :top_k
-        """)
-
-        async with async_session() as session:
-            result = await session.execute(sql, {"query_vector": vector_str, "top_k": top_k})
-            rows = result.mappings().all()
+        with span("mcp.search", top_k=top_k) as sp:
+            rows = await buscar_hibrido(query, top_k=top_k)
+            sp.set_attribute("results", len(rows))
 
         context_parts = []
         for row in rows:
-            snippet = row["content"][:800].strip().replace("\n", " ")
-            context_parts.append(f"[{row['filename']}]: {snippet}...")
+            if row["page"] is not None:
+                # Fragmento acotado por la ingesta: va completo
+                snippet = row["content"].strip().replace("\n", " ")
+                context_parts.append(f"[{row['filename']} p.{row['page']}]: {snippet}")
+            else:
+                snippet = row["content"][:800].strip().replace("\n", " ")
+                context_parts.append(f"[{row['filename']}]: {snippet}...")
 
         return "\n\n".join(context_parts)
 
-    async def responder(self, prompt: str, session_id: str = "default") -> dict:
+    async def _memoria(self, user_id: str, session_id: str):
+        if not settings.SESSION_MEMORY_ENABLED:
+            return None
+        return await get_session_memory(user_id, session_id)
+
+    async def responder(self, prompt: str, session_id: str = "default", user_id: str = "anon") -> dict:
         print(f"[AGENTE] Prompt recibido: {prompt}")
         used_tools = set()
 
         # Paso 1: Ejecutar tools antes del LLM
-        result = await self.tool_engine.run_tools_before_llm(prompt, used_tools)
+        with span("tools.before_llm"):
+            result = await self.tool_engine.run_tools_before_llm(prompt, used_tools, context={"session_id": session_id})
         if result:
-            return build_structured_output(
-                text=result["text"],
-                intent="tool_response",
-                source=result["used"][0],
-                session_id=session_id,
-                extra={"topic": result["topic"], "confidence": 0.95, "tools_called": result["used"]}
-            )
+            # run_tools_before_llm ya devuelve la salida estructurada de la tool
+            return result
+
+        # Historia acotada de la sesión (resumen + últimos turnos)
+        memoria = await self._memoria(user_id, session_id)
+        # Con historia, la respuesta depende de la conversación: no se usa el cache de respuestas.
+        # Tampoco si no se pudo cargar el historial (no se sabe si la sesión está vacía)
+        cacheable = memoria is None or (memoria.loaded and memoria.empty)
+
+        # Respuestas repetidas (impuestos, multas, trámites) salen del cache sin tocar MCP ni LLM
+        cache_version = response_cache_version()
+        if cacheable:
+            with span("response_cache.lookup") as s:
+                cached = await get_cached_response(prompt, session_id=session_id)
+                s.set_attribute("hit", cached is not None)
+            if cached is not None:
+                print(f"[AGENTE] Respuesta desde cache ({cached['structured_output']['cache']}).")
+                return cached
 
         # Verificar si el prompt corresponde a una consulta MCP
         if self.should_trigger_mcp_search(prompt):
             print("[AGENTE] Activando búsqueda en MCP...")
             top_k = MomostenangoAgent.extraer_top_k(prompt)
             context = await self.buscar_en_mcp(prompt, top_k=top_k)
-            contextual_prompt = f"""El usuario preguntó: "{prompt}"
-
-Aquí hay contexto recuperado desde el repositorio MCP:
-
-{context}
-
-Con base en este contexto, responde de forma clara y útil.
-"""
-            response = await self.agent.arun(contextual_prompt)
-            full_text = response.content
+            contextual_prompt = with_history(memoria, self._contextual_prompt(prompt, context))
+            with span("llm.openrouter", context="mcp"):
+                full_text = await model_router.complete(RAG_ANSWER, contextual_prompt)
             print(f"[AGENTE] LLM respondió con contexto MCP: {full_text}")
-            return build_structured_output(
+            reply = build_structured_output(
                 text=full_text,
                 intent="consulta_mcp",
                 source="mcp + openrouter",
                 session_id=session_id,
                 extra={"context_used": True, "confidence": 0.85}
             )
+            if cacheable:
+                await set_cached_response(prompt, reply, cache_version)
+            return reply
 
         # Paso 2: LLM responde sin contexto MCP
         print("[AGENTE] Usando LLM (OpenRouter).")
-        response = await self.agent.arun(prompt)
-        full_text = response.content
+        with span("llm.openrouter", context="none"):
+            full_text = await model_router.complete(SHORT_ANSWER, with_history(memoria, prompt))
         print(f"[AGENTE] LLM respondió: {full_text}")
 
         # Paso 3: Tools después del LLM
-        extras = await self.tool_engine.run_tools_after_llm(full_text, used_tools)
+        with span("tools.after_llm"):
+            timed_out, failed = set(), set()
+            extras = await self.tool_engine.run_tools_after_llm(full_text, used_tools, timed_out=timed_out, failed=failed)
 
         if extras:
             appended_text = "\n\nAdemás, encontré información útil:\n" + "\n".join(
@@ -123,85 +131,117 @@ Con base en este contexto, responde de forma clara y útil.
         else:
             sources = ["openrouter"]
 
-        return build_structured_output(
+        reply = build_structured_output(
             text=full_text,
             intent="respuesta_general" if not extras else "respuesta_compuesta",
             source=" + ".join(sources),
             session_id=session_id,
             extra={
                 "confidence": 0.75 if not extras else 0.9,
-                "tools_called": list(used_tools)
+                "tools_called": list(used_tools),
+                "tools_timed_out": sorted(timed_out),
+                "tools_failed": sorted(failed)
             }
         )
-    async def stream_responder(self, prompt: str, session_id: str = "default", filename: str = None, base64_file: str = None) -> AsyncGenerator[str, None]:
-            used_tools = set()
-            original_prompt = prompt
-            print("[DEBUG STREAM] filename:", filename)
-            print("[DEBUG STREAM] base64_file present:", bool(base64_file))
-            # 👇 Procesar archivo y enriquecer prompt
-            extracted_text = ""
+        if cacheable:
+            await set_cached_response(prompt, reply, cache_version)
+        return reply
+    @staticmethod
+    def _contextual_prompt(prompt: str, context: str) -> str:
+        return f"""El usuario preguntó: "{prompt}"
+
+Aquí hay contexto recuperado desde el repositorio MCP:
+
+{context}
+
+Con base en este contexto, responde de forma clara y útil.
+"""
+
+    async def stream_responder(self, prompt: str, session_id: str = "default", filename: str = None, base64_file: str = None, state: dict = None, user_id: str = "anon") -> AsyncGenerator[dict, None]:
+        """
+        Eventos de la respuesta en streaming, en orden:
+        {"type": "status", ...} mientras se procesa, {"type": "tool", ...} si una tool respondió,
+        {"type": "token", "token": ...} por cada delta del LLM y {"type": "error", ...} si algo falla.
+
+        La búsqueda MCP arranca de inmediato (solo depende del prompt original) y corre en
+        paralelo con la extracción del archivo y las tools previas. `state["prompt"]` queda
+        con el prompt final (enriquecido con el archivo) para guardar la sesión.
+        """
+        state = state if state is not None else {}
+        state["prompt"] = prompt
+        original_prompt = prompt
+        used_tools = set()
+
+        # La historia de la sesión se carga en paralelo con todo lo demás
+        memory_task = asyncio.create_task(self._memoria(user_id, session_id))
+        retrieval = None
+        if self.should_trigger_mcp_search(original_prompt):
+            top_k = MomostenangoAgent.extraer_top_k(original_prompt)
+            retrieval = asyncio.create_task(self.buscar_en_mcp(original_prompt, top_k=top_k))
+            yield {"type": "status", "status": "buscando_documentos", "message": "Buscando documentos..."}
+
+        try:
+            # Paso 1: extraer texto del archivo (una sola vez) y enriquecer el prompt
             if base64_file and filename:
+                yield {"type": "status", "status": "procesando_archivo", "message": "Procesando archivo..."}
                 try:
                     raw_bytes = base64.b64decode(base64_file)
-                    if filename.lower().endswith(".pdf"):
-                        extracted_text = extract_text_from_pdf_bytes(raw_bytes)
-                    elif filename.lower().endswith((".jpg", ".jpeg", ".png", ".bmp", ".tiff")):
-                        extracted_text = extract_text_from_image_bytes(raw_bytes)
-                    
-                    print("[DEBUG STREAM] Texto extraído:", extracted_text[:200])  # NUEVO
-
+                    extracted_text = await extract_text_async(raw_bytes, filename) or ""
                     if extracted_text:
                         prompt = f"Contenido visual: {extracted_text.strip()}\n\nUsuario dijo: {prompt}"
+                        state["prompt"] = prompt
                         print("[AGENTE STREAM] Prompt modificado con contenido visual.")
+                except (WorkerPoolSaturado, WorkerTimeout) as e:
+                    # Los encabezados ya se enviaron: el 503/504 se comunica como evento
+                    yield {"type": "error", "message": f"No se pudo procesar el archivo: {e}"}
+                    return
                 except Exception as e:
                     print(f"[STREAM] Error al procesar archivo base64: {e}")
 
-
-            # 🧪 Paso 1: ejecutar tools si corresponde
+            # Paso 2: tools previas (la búsqueda MCP sigue corriendo mientras tanto)
             context = {
                 "filename": filename,
                 "base64_file": base64_file,
                 "session_id": session_id
             }
-            result = await self.tool_engine.run_tools_before_llm(prompt, used_tools, context=context)
+            with span("tools.before_llm"):
+                result = await self.tool_engine.run_tools_before_llm(prompt, used_tools, context=context)
 
             if result:
-                print("[STREAM DEBUG] Resultado final:", result)
-                import json
-                structured_output = result.get("structured_output", {})
-                structured = structured_output.get("structured")
-                response = {
-                    "text": result["text"]
-                }
+                event = {"type": "tool", "text": result["text"]}
+                structured = result.get("structured_output", {}).get("structured")
                 if structured:
-                    response["structured"] = structured
-                yield f"data: {json.dumps(response)}\n\n"
+                    event["structured"] = structured
+                yield event
                 return
 
-            # 🧪 Paso 2: buscar en MCP si aplica
-            if self.should_trigger_mcp_search(original_prompt):
-                print("[AGENTE] Streaming con contexto MCP...")
-                top_k = MomostenangoAgent.extraer_top_k(original_prompt)
-                context = await self.buscar_en_mcp(original_prompt, top_k=top_k)
-                contextual_prompt = f"""El usuario preguntó: "{original_prompt}"
-
-        Aquí hay contexto recuperado desde el repositorio MCP:
-
-        {context}
-
-        Con base en este contexto, responde de forma clara y útil.
-        """
-                run_response = await self.agent.arun(contextual_prompt, stream=True)
+            # Paso 3: contexto MCP (normalmente ya listo)
+            if retrieval is not None:
+                with span("mcp.search.wait"):
+                    mcp_context = await retrieval
+                llm_prompt = self._contextual_prompt(original_prompt, mcp_context)
+                llm_task = RAG_ANSWER
             else:
-                print("[AGENTE] Streaming con prompt final:", prompt)
-                run_response = await self.agent.arun(prompt, stream=True)
-
-            # 🧪 Paso 3: emitir tokens uno a uno
-            previous = ""
-            async for chunk in run_response:
-                if chunk.content:
-                    token = chunk.content
-                    if previous and not token.startswith((" ", ".", ",", "!", "?", ":", ";", "\n")):
-                        token = " " + token
-                    yield token
-                    previous = token
+                llm_prompt = prompt
+                llm_task = SHORT_ANSWER
+
+            llm_prompt = with_history(await memory_task, llm_prompt)
+
+            # Paso 4: tokens del LLM tal como llegan
+            yield {"type": "status", "status": "generando", "message": "Generando respuesta..."}
+            # El bloque contiene yields: el span se registra pero no pasa a ser el actual
+            with span("llm.openrouter.stream", activate=False) as llm_span:
+                first_token = True
+                async for token in model_router.stream(llm_task, llm_prompt):
+                    if first_token:
+                        first_token = False
+                        llm_span.add_event("first_token")
+                        ttft_ms = (time.time_ns() - llm_span.start_ns) / 1e6
+                        llm_span.set_attribute("llm_ttft_ms", round(ttft_ms, 2))
+                        log_stage_latency("llm.openrouter.ttft", ttft_ms)
+                    # Los deltas SSE ya traen sus espacios: se reenvían tal cual
+                    yield {"type": "token", "token": token}
+        finally:
+            for task in (retrieval, memory_task):
+                if task is not None and not task.done():
+                    task.cancel()
@@ -7,17 +7,15 @@ class AppointmentTool(Tool):
     keywords = ["cita", "agendar", "identidad", "salud", "transporte"]
 
     async def __call__(self, query: str, context: dict = None) -> Dict:
-        text = query.lower()
+        match = self.dispatch_match(query, context)
+        text = match.normalized
 
         # Activación: debe tener al menos una keyword
-        if not any(k in text for k in self.keywords):
+        if not match.matched(self.keywords):
             return None
 
-        tipo = None
-        for word in ["identidad", "salud", "transporte"]:
-            if word in text:
-                tipo = word
-                break
+        tipos = match.matched(["identidad", "salud", "transporte"])
+        tipo = tipos[0] if tipos else None
 
         fecha_match = re.search(r"(lunes|martes|miércoles|jueves|viernes|sábado|domingo|\d{4}-\d{2}-\d{2})", text)
         hora_match = re.search(r"(\d{1,2}(:\d{2})?\s?(am|pm)?)", text)
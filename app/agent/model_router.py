@@ -0,0 +1,212 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from app.config.settings import settings
+from app.services.http_client import is_retryable_transport_error
+from app.services.metrics_service import registrar_latencia
+from app.services.openrouter import OpenRouterStreamError, llamar_modelo, stream_modelo
+from app.services.tracing import span
+
+# Tipos de tarea que sabe rutear el agente
+EXTRACTION = "extraction"      # extracción corta y barata (p. ej. ubicación de un reporte)
+SHORT_ANSWER = "short_answer"  # respuesta general sin contexto MCP
+RAG_ANSWER = "rag_answer"      # respuesta con contexto recuperado del MCP
+
+# Peso de la última observación en los promedios móviles exponenciales
+_EWMA_ALPHA = 0.2
+
+
+@dataclass
+class ModelStats:
+    requests: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    latency_ms: Optional[float] = None  # EWMA de las llamadas exitosas
+    error_rate: float = 0.0             # EWMA de 0/1 por llamada
+    consecutive_failures: int = 0
+    degraded_until: float = 0.0
+
+    def degraded(self, now: float) -> bool:
+        return now < self.degraded_until
+
+    def to_dict(self, now: float) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "latency_ms": round(self.latency_ms, 2) if self.latency_ms is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "consecutive_failures": self.consecutive_failures,
+            "degraded": self.degraded(now),
+            "degraded_for_s": round(max(0.0, self.degraded_until - now), 1),
+        }
+
+
+def es_fallo_del_modelo(error: BaseException) -> bool:
+    """
+    Fallos atribuibles al modelo/proveedor (timeout, 429/5xx, red, error dentro del stream):
+    se pasa al siguiente modelo y cuentan para degradarlo. Un 400/401 o un error local de
+    configuración fallaría igual con cualquier modelo, así que se propaga sin penalizar.
+    """
+    if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException, OpenRouterStreamError)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return is_retryable_transport_error(error)
+
+
+def _parse_route(value: str) -> List[str]:
+    return [m.strip() for m in value.split(",") if m.strip()]
+
+
+class ModelRouter:
+    """
+    Elige el modelo por tipo de tarea (rutas configurables) y hace failover al siguiente
+    ante timeout, rate limit, 5xx o error de red. Lleva latencia y tasa de error por modelo; un modelo
+    degradado pasa al final de la lista durante MODEL_COOLDOWN_S.
+    """
+
+    def __init__(self, routes: Dict[str, List[str]], timeouts: Dict[str, float]):
+        self.routes = routes
+        self.timeouts = timeouts
+        self._stats: Dict[str, ModelStats] = {}
+
+    @classmethod
+    def from_settings(cls) -> "ModelRouter":
+        default = [settings.OPENROUTER_MODEL]
+        return cls(
+            routes={
+                EXTRACTION: _parse_route(settings.MODEL_ROUTE_EXTRACTION) or default,
+                SHORT_ANSWER: _parse_route(settings.MODEL_ROUTE_SHORT_ANSWER) or default,
+                RAG_ANSWER: _parse_route(settings.MODEL_ROUTE_RAG_ANSWER) or default,
+            },
+            timeouts={
+                EXTRACTION: settings.MODEL_TIMEOUT_EXTRACTION_S,
+                SHORT_ANSWER: settings.MODEL_TIMEOUT_SHORT_ANSWER_S,
+                RAG_ANSWER: settings.MODEL_TIMEOUT_RAG_ANSWER_S,
+            },
+        )
+
+    def _model_stats(self, model: str) -> ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = ModelStats()
+        return stats
+
+    def candidates(self, task: str) -> List[str]:
+        """Modelos sanos en orden de preferencia; los degradados quedan de último recurso."""
+        route = self.routes.get(task)
+        if not route:
+            raise ValueError(f"Tipo de tarea sin ruta de modelos: {task}")
+        now = time.time()
+        sanos = [m for m in route if not self._model_stats(m).degraded(now)]
+        degradados = sorted(
+            (m for m in route if self._model_stats(m).degraded(now)),
+            key=lambda m: self._model_stats(m).degraded_until,
+        )
+        return sanos + degradados
+
+    def _registrar_exito(self, model: str, latency_ms: float):
+        stats = self._model_stats(model)
+        stats.requests += 1
+        stats.consecutive_failures = 0
+        stats.error_rate *= (1 - _EWMA_ALPHA)
+        stats.latency_ms = latency_ms if stats.latency_ms is None else (
+            _EWMA_ALPHA * latency_ms + (1 - _EWMA_ALPHA) * stats.latency_ms
+        )
+        registrar_latencia(f"model.{model}", latency_ms, kind="upstream")
+
+    def _registrar_fallo(self, model: str, error: BaseException):
+        stats = self._model_stats(model)
+        stats.requests += 1
+        stats.errors += 1
+        if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException)):
+            stats.timeouts += 1
+        stats.consecutive_failures += 1
+        stats.error_rate = _EWMA_ALPHA + (1 - _EWMA_ALPHA) * stats.error_rate
+
+        if (stats.consecutive_failures >= settings.MODEL_DEGRADED_CONSECUTIVE
+                or (stats.requests >= 5 and stats.error_rate >= settings.MODEL_DEGRADED_ERROR_RATE)):
+            if not stats.degraded(time.time()):
+                print(f"[MODEL_ROUTER] Modelo {model} degradado por {settings.MODEL_COOLDOWN_S}s "
+                      f"(error_rate={stats.error_rate:.2f}, fallos seguidos={stats.consecutive_failures})")
+            stats.degraded_until = time.time() + settings.MODEL_COOLDOWN_S
+
+    async def complete(self, task: str, prompt: str, messages: List[dict] = None) -> str:
+        modelos = self.candidates(task)
+        error: Optional[BaseException] = None
+        for i, model in enumerate(modelos):
+            ultimo = i == len(modelos) - 1
+            start = time.perf_counter()
+            with span(f"llm.{task}", model=model, attempt=i + 1):
+                try:
+                    # Con respaldo disponible no se reintenta el mismo modelo: se pasa al siguiente
+                    text = await asyncio.wait_for(
+                        llamar_modelo(prompt, model=model, messages=messages, retries=None if ultimo else 0),
+                        timeout=self.timeouts[task],
+                    )
+                except Exception as e:
+                    if not es_fallo_del_modelo(e):
+                        raise
+                    error = e
+                    self._registrar_fallo(model, e)
+                    print(f"[MODEL_ROUTER] {task}: falló {model} ({e.__class__.__name__}: {e})")
+                    continue
+            self._registrar_exito(model, (time.perf_counter() - start) * 1000)
+            return text
+        raise error
+
+    async def stream(self, task: str, prompt: str, messages: List[dict] = None) -> AsyncIterator[str]:
+        """
+        Streaming con failover antes del primer token: el plazo del tipo de tarea aplica
+        hasta que llega el primer token; después, un error se propaga al cliente.
+        """
+        modelos = self.candidates(task)
+        error: Optional[BaseException] = None
+        for i, model in enumerate(modelos):
+            ultimo = i == len(modelos) - 1
+            start = time.perf_counter()
+            tokens = stream_modelo(prompt, model=model, messages=messages, retries=None if ultimo else 0)
+            try:
+                primero = await asyncio.wait_for(tokens.__anext__(), timeout=self.timeouts[task])
+            except StopAsyncIteration:
+                self._registrar_exito(model, (time.perf_counter() - start) * 1000)
+                return
+            except Exception as e:
+                await tokens.aclose()
+                if not es_fallo_del_modelo(e):
+                    raise
+                error = e
+                self._registrar_fallo(model, e)
+                print(f"[MODEL_ROUTER] {task} (stream): falló {model} ({e.__class__.__name__}: {e})")
+                continue
+
+            # La latencia del stream se mide al primer token (lo que percibe el usuario)
+            self._registrar_exito(model, (time.perf_counter() - start) * 1000)
+            try:
+                yield primero
+                async for token in tokens:
+                    yield token
+            finally:
+                await tokens.aclose()
+            return
+        raise error
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "routes": self.routes,
+            "timeouts_s": self.timeouts,
+            "models": {model: stats.to_dict(now) for model, stats in sorted(self._stats.items())},
+        }
+
+
+model_router = ModelRouter.from_settings()
+
+
+def model_router_stats() -> dict:
+    return model_router.stats()
@@ -6,9 +6,9 @@ class MunicipalFormTool(Tool):
     keywords = ["formulario", "solicitud", "permiso", "poda", "evento", "construcción"]
 
     async def __call__(self, query: str, context: dict = None) -> dict:
-        lowered = query.lower()
+        match = self.dispatch_match(query, context)
 
-        if not any(keyword in lowered for keyword in self.keywords):
+        if not match.matched(self.keywords):
             return None
 
         forms = {
@@ -18,7 +18,7 @@ class MunicipalFormTool(Tool):
         }
 
         for keyword, filename in forms.items():
-            if keyword in lowered:
+            if keyword in match.matches:
                 return {
                     "respuesta": f"Aquí tienes el formulario de {keyword}.",
                     "structured": {
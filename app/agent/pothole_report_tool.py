@@ -1,41 +1,35 @@
 from app.agent.tool_engine import Tool
 from app.db.models import PotholeReport, McpDocument
 from app.db.database import async_session
-from app.services.embedding_service import generate_embedding
-from app.agent.llm_singleton import get_llm_agent
+from app.services.embedding_service import generate_embedding_async
+from app.services.extraction_service import extract_text_async
+from app.services.response_cache import invalidate_response_cache
+from app.agent.model_router import model_router, EXTRACTION
 from base64 import b64decode
 from datetime import datetime
-import pickle
 import re
 
 class PotholeReportTool(Tool):
     name = "pothole_report"
     keywords = ["bache", "poste", "hueco"]  # Palabras clave para activar la tool
+    action_verbs = ["reportar", "avisar", "encontré", "ver", "informar"]
+    cancelable = False  # registra el reporte en BD: cancelarlo a medias lo perdería sin aviso
 
-    def should_trigger(self, text: str) -> bool:
-        """Asegura que se activa solo cuando se menciona una acción de reporte explícita"""
-        text = text.lower()
-        # Comprobamos que haya una acción + mención válida (bache/poste/hueco)
-        if any(verb in text for verb in ["reportar", "avisar", "encontré", "ver", "informar"]):
-            return any(kw in text for kw in self.keywords)
-        return False
+    def trigger_groups(self):
+        """Se activa solo cuando hay una acción de reporte explícita + mención válida (bache/poste/hueco)"""
+        return [self.action_verbs, self.keywords]
 
     async def __call__(self, query: str, context: dict = None) -> dict:
-        lowered = query.lower()
+        match = self.dispatch_match(query, context)
 
         # Solo procesar si la tool fue activada por una acción y términos clave
-        if not self.should_trigger(query):
+        if not (match.matched(self.action_verbs) and match.matched(self.keywords)):
             return None  # ❌ No contiene las condiciones para activarse, dejar paso a otras tools
 
-        # Determinar tipo de incidente
-        tipo = (
-            "bache" if "bache" in lowered else
-            "poste" if "poste" in lowered else
-            "hueco"  # Si no está bache o poste, se marca como "hueco" por defecto
-        )
+        # Determinar tipo de incidente (si no está bache o poste, se marca como "hueco" por defecto)
+        tipo = match.matched(self.keywords)[0]
 
         # 🧠 Extraer ubicación con modelo
-        agent = get_llm_agent()
         prompt_llm = f"""
 Eres un sistema municipal que extrae ubicaciones geográficas de mensajes ciudadanos. 
 Extrae la dirección o referencia de ubicación del siguiente mensaje. Si no hay ubicación clara, responde "desconocida".
@@ -44,8 +38,7 @@ Mensaje: {query}
 
 Ubicación:
 """.strip()
-        response = await agent.arun(prompt_llm)
-        ubicacion = response.content.strip()
+        ubicacion = (await model_router.complete(EXTRACTION, prompt_llm)).strip()
         if not ubicacion or "desconocida" in ubicacion.lower():
             ubicacion = "ubicación no especificada"  # Respuesta por defecto si no se encuentra ubicación
 
@@ -67,15 +60,13 @@ Ubicación:
             if base64_file:
                 try:
                     raw_bytes = b64decode(base64_file)
-                    from app.services.file_processor import extract_text_from_image_bytes
-                    extracted = extract_text_from_image_bytes(raw_bytes)
+                    extracted = await extract_text_async(raw_bytes, filename or "reporte.jpg", scene=True) or ""
                     content = f"{query}\n\n{extracted}"
 
-                    embedding = generate_embedding(content)
+                    embedding = await generate_embedding_async(content)
                     mcp = McpDocument(
                         filename=filename or f"reporte_{tipo}_{nuevo.created_at.isoformat()}",
                         content=content,
-                        embedding=pickle.dumps(embedding),
                         embedding_pg=embedding,
                         path="reportes"
                     )
@@ -86,6 +77,8 @@ Ubicación:
 
             # Commit a la base de datos
             await session.commit()
+            if base64_file:
+                invalidate_response_cache("(reporte con archivo en MCP)")
 
             # Respuesta estructurada para el usuario
             return {
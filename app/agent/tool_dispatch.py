@@ -0,0 +1,131 @@
+import re
+import unicodedata
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, List, Sequence, Set, Tuple
+
+
+def normalize_prompt(text: str) -> str:
+    """Normaliza una sola vez: NFC, minúsculas y espacios colapsados."""
+    text = unicodedata.normalize("NFC", text or "").lower()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class AhoCorasick:
+    """Autómata Aho-Corasick: encuentra todas las frases en una sola pasada sobre el texto.
+
+    El costo de `search` es O(len(texto) + coincidencias) sin importar cuántas
+    frases (y por lo tanto cuántas tools) haya registradas.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Set[str]] = [set()]
+
+        for pattern in patterns:
+            if pattern:
+                self._add(pattern)
+        self._build()
+
+    def _add(self, pattern: str) -> None:
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(set())
+            state = nxt
+        self._out[state].add(pattern)
+
+    def _build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                self._out[nxt] |= self._out[self._fail[nxt]]
+
+    def search(self, text: str) -> Set[str]:
+        found: Set[str] = set()
+        state = 0
+        for ch in text:
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            if self._out[state]:
+                found |= self._out[state]
+        return found
+
+
+@dataclass
+class DispatchMatch:
+    """Resultado de despachar un prompt: texto normalizado y frases encontradas."""
+    normalized: str
+    matches: FrozenSet[str]
+    candidates: List = field(default_factory=list)
+
+    def matched(self, phrases: Iterable[str]) -> List[str]:
+        """Frases de `phrases` presentes en el prompt, en el orden en que se pasaron."""
+        return [p for p in phrases if p in self.matches]
+
+
+class ToolDispatcher:
+    """Índice de triggers declarativos de todas las tools.
+
+    Cada tool declara `trigger_groups()`: una lista de grupos de frases; la tool es
+    candidata si cada grupo tiene al menos una frase en el prompt. Todas las frases
+    de todas las tools se compilan en un único autómata, así que agregar tools no
+    agrega pasadas sobre el prompt.
+    """
+
+    def __init__(self, tools: Sequence):
+        self.tools = list(tools)
+        self._groups: List[List[FrozenSet[str]]] = []
+        # frase -> índices de las tools que la declaran, para revisar solo las tocadas
+        self._por_frase: Dict[str, Set[int]] = {}
+        for idx, tool in enumerate(self.tools):
+            groups = [frozenset(normalize_prompt(p) for p in group) for group in tool.trigger_groups()]
+            groups = [g for g in groups if g]
+            self._groups.append(groups)
+            for group in groups:
+                for phrase in group:
+                    self._por_frase.setdefault(phrase, set()).add(idx)
+        self._automaton = AhoCorasick(self._por_frase)
+
+    def dispatch(self, text: str, exclude: Set[str] = None) -> DispatchMatch:
+        normalized = normalize_prompt(text)
+        matches = frozenset(self._automaton.search(normalized))
+        tocadas: Set[int] = set()
+        for phrase in matches:
+            tocadas |= self._por_frase[phrase]
+
+        # Se respeta el orden de registro: es la prioridad entre tools
+        candidates = []
+        for idx in sorted(tocadas):
+            tool = self.tools[idx]
+            if exclude and tool.name in exclude:
+                continue
+            if all(group & matches for group in self._groups[idx]):
+                candidates.append(tool)
+        return DispatchMatch(normalized=normalized, matches=matches, candidates=candidates)
+
+
+_tool_indexes: Dict[Tuple[str, ...], AhoCorasick] = {}
+
+
+def match_phrases(text: str, phrases: Sequence[str]) -> DispatchMatch:
+    """Coincidencias para una tool invocada fuera del ToolEngine (sin despacho previo)."""
+    key = tuple(phrases)
+    automaton = _tool_indexes.get(key)
+    if automaton is None:
+        automaton = _tool_indexes[key] = AhoCorasick(normalize_prompt(p) for p in phrases)
+    normalized = normalize_prompt(text)
+    return DispatchMatch(normalized=normalized, matches=frozenset(automaton.search(normalized)))
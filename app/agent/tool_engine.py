@@ -1,63 +1,118 @@
-from typing import List, Dict, Set
+from typing import List, Dict, Optional, Set
+import asyncio
 import base64
-from app.services.file_processor import extract_text_from_pdf_bytes, extract_text_from_image_bytes
+from app.services.extraction_service import extract_text_async
+from app.services.worker_pool import WorkerPoolSaturado, WorkerTimeout
 import re
 from app.agent.structured_output import build_structured_output
+from app.services.tracing import span
+from app.agent.tool_dispatch import DispatchMatch, ToolDispatcher, match_phrases
+from app.config.settings import settings
 
 
 class Tool:
     name: str = "unnamed_tool"
-    keywords: List[str] = []  # palabras clave que activan la tool en postprocesamiento
+    keywords: List[str] = []  # palabras clave que activan la tool (antes y después del LLM)
+    timeout_s: Optional[float] = None  # None = settings.TOOL_TIMEOUT_S
+    cancelable: bool = True  # False = tiene efectos secundarios (p. ej. escribe en BD): corre sin plazo
 
     async def __call__(self, query: str, context: dict = None) -> Dict:
         raise NotImplementedError("Tool debe implementar __call__")
 
+    def trigger_groups(self) -> List[List[str]]:
+        """Triggers declarativos: la tool es candidata si cada grupo tiene al menos una coincidencia."""
+        return [self.keywords]
+
+    def dispatch_match(self, query: str, context: dict = None) -> DispatchMatch:
+        """Coincidencias ya calculadas por el ToolEngine; si la tool se llama sola, se calculan aquí."""
+        if context and context.get("dispatch") is not None:
+            return context["dispatch"]
+        return match_phrases(query, [p for group in self.trigger_groups() for p in group])
+
     def should_trigger(self, text: str) -> bool:
-        lowered = text.lower()
-        return any(kw in lowered for kw in self.keywords)
+        match = self.dispatch_match(text)
+        return all(match.matched(group) for group in self.trigger_groups())
 
 
 class ToolEngine:
     def __init__(self, tools: List[Tool]):
         self.tools = tools
+        self.dispatcher = ToolDispatcher(tools)
+
+    async def _run_tool(self, tool: Tool, text: str, context: dict, phase: str, timed_out: Set[str] = None, failed: Set[str] = None) -> Optional[Dict]:
+        """Ejecuta una tool con su plazo; un timeout o un error se aísla y cuenta como 'sin resultado'."""
+        timeout_s = tool.timeout_s if tool.timeout_s is not None else settings.TOOL_TIMEOUT_S
+        with span(f"tool.{tool.name}", phase=phase) as s:
+            try:
+                if not tool.cancelable:
+                    return await tool(text, context=context)
+                return await asyncio.wait_for(tool(text, context=context), timeout=timeout_s)
+            except asyncio.TimeoutError:
+                print(f"[TOOL_ENGINE] Tool {tool.name} excedió {timeout_s}s, cancelada")
+                s.set_attribute("timeout", True)
+                if timed_out is not None:
+                    timed_out.add(tool.name)
+            except (WorkerPoolSaturado, WorkerTimeout):
+                raise
+            except Exception as e:
+                print(f"[TOOL_ENGINE] Error en tool {tool.name}: {e}")
+                s.set_attribute("error", str(e))
+                if failed is not None:
+                    failed.add(tool.name)
+        return None
 
     async def run_tools_before_llm(self, prompt: str, used_tools: Set[str], context: dict = None) -> Dict:
-        for tool in self.tools:
-            if tool.name not in used_tools:
-                print(f"[TOOL_ENGINE] Probando tool: {tool.name} con prompt: {prompt}")
-                result = await tool(prompt, context=context)
-                if result:
-                    used_tools.add(tool.name)
-                    print(f"[TOOL_ENGINE] Tool activada: {tool.name}")
-                    
-                    return build_structured_output(
-                        text=result.get("respuesta", result.get("text", "")),
-                        intent="tool_response",
-                        source=tool.name,
-                        session_id=context.get("session_id", "default") if context else "default",
-                        structured=result.get("structured"),
-                        extra={
-                            "topic": result.get("topic", "desconocido"),
-                            "confidence": 0.95,
-                            "tools_called": [tool.name]
-                        }
-                    )
+        match = self.dispatcher.dispatch(prompt, exclude=used_tools)
+        if not match.candidates:
+            return {}
+
+        print(f"[TOOL_ENGINE] Tools candidatas: {[tool.name for tool in match.candidates]}")
+        tool_context = {**(context or {}), "dispatch": match}
+        for tool in match.candidates:
+            with span(f"tool.{tool.name}", phase="before_llm"):
+                result = await tool(prompt, context=tool_context)
+            if result:
+                used_tools.add(tool.name)
+                print(f"[TOOL_ENGINE] Tool activada: {tool.name}")
+                
+                return build_structured_output(
+                    text=result.get("respuesta", result.get("text", "")),
+                    intent="tool_response",
+                    source=tool.name,
+                    session_id=context.get("session_id", "default") if context else "default",
+                    structured=result.get("structured"),
+                    extra={
+                        "topic": result.get("topic", "desconocido"),
+                        "confidence": 0.95,
+                        "tools_called": [tool.name]
+                    }
+                )
         return {}
 
 
 
-    async def run_tools_after_llm(self, response_text: str, used_tools: Set[str]) -> List[Dict]:
+    async def run_tools_after_llm(self, response_text: str, used_tools: Set[str], timed_out: Set[str] = None, failed: Set[str] = None) -> List[Dict]:
+        """Corre las tools candidatas en paralelo, cada una con su plazo.
+
+        Los resultados se devuelven en el orden de registro de las tools (determinista),
+        sin importar cuál terminó primero. Las tools que excedieron su plazo o fallaron
+        se agregan a `timed_out` / `failed` si se pasan.
+        """
         extra_responses = []
-        for tool in self.tools:
-            if tool.name not in used_tools and tool.should_trigger(response_text):
-                result = await tool(response_text)
-                if result:
-                    used_tools.add(tool.name)
-                    extra_responses.append({
-                        "text": result["respuesta"],
-                        "tool": tool.name,
-                        "topic": result.get("topic", "desconocido")
-                    })
+        match = self.dispatcher.dispatch(response_text, exclude=used_tools)
+        context = {"dispatch": match}
+        results = await asyncio.gather(*[
+            self._run_tool(tool, response_text, context, "after_llm", timed_out, failed)
+            for tool in match.candidates
+        ])
+        for tool, result in zip(match.candidates, results):
+            if result:
+                used_tools.add(tool.name)
+                extra_responses.append({
+                    "text": result["respuesta"],
+                    "tool": tool.name,
+                    "topic": result.get("topic", "desconocido")
+                })
         return extra_responses
 
 
@@ -65,15 +120,12 @@ class TrashScheduleTool(Tool):
     name = "trash_schedule"
     keywords = ["basura", "recolección", "zona"]
 
-    def normalize_text(self, text: str) -> str:
-        text = text.lower()
-        text = text.replace("\n", " ")
-        text = re.sub(r"[^\w\s]", " ", text)
-        return re.sub(r"\s+", " ", text).strip()
-
     async def __call__(self, query: str, context: dict = None) -> Dict:
-        cleaned = self.normalize_text(query)
-        print(f"[TOOL:trash_schedule] Texto limpiado: '{cleaned}'")
+        match = self.dispatch_match(query, context)
+        # \W*: como el limpiado original (puntuación → espacio), acepta "zona:5", "zona-3", "zona #7"
+        zona_match = re.search(r"\bzona\W*(\d{1,2})\b", match.normalized)
+        if not zona_match:
+            return None
 
         zonas = {
             "zona 1": "La recolección de basura en zona 1 es lunes y jueves a las 6:00 AM.",
@@ -89,10 +141,11 @@ class TrashScheduleTool(Tool):
         }
 
 
-        for zona, respuesta in zonas.items():
-            if zona in cleaned:
-                print(f"🟢 Tool activada para {zona}")
-                return {"respuesta": respuesta, "topic": "basura"}
+        zona = f"zona {int(zona_match.group(1))}"
+        respuesta = zonas.get(zona)
+        if respuesta:
+            print(f"🟢 Tool activada para {zona}")
+            return {"respuesta": respuesta, "topic": "basura"}
 
         return None
 
@@ -103,25 +156,24 @@ class FormAccessTool(Tool):
     keywords = ["formulario", "permiso", "trámite"]
 
     async def __call__(self, query: str, context: dict = None) -> Dict:
-        if "permiso de construcción" in query.lower():
+        lowered = self.dispatch_match(query, context).normalized
+        if "permiso de construcción" in lowered:
             return {"respuesta": "Puedes descargar el formulario de permiso de construcción aquí: https://municipalidad.gob.gt/formularios/construccion.pdf", "topic": "formularios"}
-        elif "trámite" in query.lower():
+        elif "trámite" in lowered:
             return {"respuesta": "Los formularios están disponibles en https://municipalidad.gob.gt/formularios", "topic": "formularios"}
         return None
 
 
 
-def combinar_prompt(prompt: str, base64_file: str = None, filename: str = None) -> str:
+async def combinar_prompt(prompt: str, base64_file: str = None, filename: str = None) -> str:
     if base64_file and filename:
         try:
             raw_bytes = base64.b64decode(base64_file)
-            extracted_text = ""
-            if filename.lower().endswith(".pdf"):
-                extracted_text = extract_text_from_pdf_bytes(raw_bytes)
-            elif filename.lower().endswith((".jpg", ".jpeg", ".png", ".bmp", ".tiff")):
-                extracted_text = extract_text_from_image_bytes(raw_bytes)
+            extracted_text = await extract_text_async(raw_bytes, filename)
             if extracted_text:
                 return f"Contenido visual: {extracted_text.strip()}\n\nUsuario dijo: {prompt}"
+        except (WorkerPoolSaturado, WorkerTimeout):
+            raise
         except Exception as e:
             print(f"[TOOL_ENGINE] Error al procesar archivo base64: {e}")
     return prompt
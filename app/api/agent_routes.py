@@ -6,25 +6,69 @@ from app.api import file_processor_routes
 from app.services.session_service import save_session
 from sqlmodel import select
 from app.db.models import Session as SessionModel
-from app.db.database import async_session
+from app.db.database import async_session, pool_metrics
+from app.api.pagination import bad_request, parse_keyset, ndjson_response
+from app.config.settings import settings
 import json
 from app.db.models import McpDocument
-from app.services.embedding_service import generate_embedding, cosine_similarity
+from app.services.embedding_service import cosine_similarity
+from app.services.extraction_service import extract_text_async
+from app.services.hybrid_search import SEARCH_MODES, buscar_hibrido
+from app.services.worker_pool import WorkerPoolSaturado, WorkerTimeout, estado_pools
+from app.services.job_queue import job_queue_stats
+from app.services.upload_buffer import UploadDemasiadoGrande
+from app.services.extraction_cache import extraction_cache_stats
+from app.services.embedding_cache import embedding_cache_stats
+from app.services.response_cache import response_cache_stats
+from app.services.session_memory import session_memory_stats
+from app.services.ocr_warmup import ocr_readiness
+from app.services.http_client import http_client_stats
+from app.agent.model_router import model_router_stats
+from app.services.embedding_service import embedding_batcher_stats
 from app.db.models import McpDocument
-import pickle
-from app.agent.tool_engine import combinar_prompt
 from blacksheep.contents import StreamedContent
-from sqlalchemy import text
 import json
 import time
 from app.services.metrics_service import log_latency
-from app.services.metrics_service import obtener_metricas_latencia
+from app.services.metrics_service import obtener_metricas_latencia, prometheus_text, log_stage_latency
+from app.services.tracing import start_trace, span, use_span
+from app.services.write_behind import write_behind
 
 agent = MomostenangoAgent()
 
+
+async def handle_worker_pool_saturado(app, request: Request, exc: WorkerPoolSaturado) -> Response:
+    response = Response(503, content=Content(
+        b"application/json",
+        json.dumps({"error": "Servidor ocupado procesando archivos, intenta de nuevo en unos segundos."}).encode("utf-8")
+    ))
+    response.add_header(b"Retry-After", b"5")
+    return response
+
+
+async def handle_worker_timeout(app, request: Request, exc: WorkerTimeout) -> Response:
+    return Response(504, content=Content(
+        b"application/json",
+        json.dumps({"error": "El procesamiento del archivo tardó demasiado."}).encode("utf-8")
+    ))
+
+
+async def handle_upload_demasiado_grande(app, request: Request, exc: UploadDemasiadoGrande) -> Response:
+    return Response(413, content=Content(
+        b"application/json",
+        json.dumps({"error": str(exc)}).encode("utf-8")
+    ))
+
+
 def setup_routes(app):
     setup_document_routes(app)
 
+    # Backpressure de los pools de OCR/embeddings → 503 / 504
+    app.exceptions_handlers[WorkerPoolSaturado] = handle_worker_pool_saturado
+    app.exceptions_handlers[WorkerTimeout] = handle_worker_timeout
+    # Subidas en streaming que pasan de UPLOAD_MAX_BYTES → 413
+    app.exceptions_handlers[UploadDemasiadoGrande] = handle_upload_demasiado_grande
+
     @post("/chat")
     async def chat(request: Request) -> Response:
         body = await request.json()
@@ -35,31 +79,30 @@ def setup_routes(app):
         base64_file = body.get("base64_file")  # opcional
         filename = body.get("filename", "")    # opcional
 
-        from app.services.file_processor import extract_text_from_pdf_bytes, extract_text_from_image_bytes
         from base64 import b64decode
 
-        if base64_file and filename:
-            try:
-                raw_bytes = b64decode(base64_file)
-                extracted_text = ""
-
-                if filename.lower().endswith(".pdf"):
-                    extracted_text = extract_text_from_pdf_bytes(raw_bytes)
-                elif filename.lower().endswith((".jpg", ".jpeg", ".png", ".bmp", ".tiff")):
-                    extracted_text = extract_text_from_image_bytes(raw_bytes)
-                else:
-                    print("[CHAT] Tipo de archivo no soportado:", filename)
+        with start_trace("POST /chat", session_id=session_id, has_file=bool(base64_file)):
+            if base64_file and filename:
+                try:
+                    raw_bytes = b64decode(base64_file)
+                    extracted_text = await extract_text_async(raw_bytes, filename)
 
-                if extracted_text:
-                    prompt = f"Contenido visual: {extracted_text.strip()}\n\nUsuario dijo: {prompt}"
-            except Exception as e:
-                print(f"[CHAT] Error al procesar archivo base64: {str(e)}")
+                    if extracted_text is None:
+                        print("[CHAT] Tipo de archivo no soportado:", filename)
+                    elif extracted_text:
+                        prompt = f"Contenido visual: {extracted_text.strip()}\n\nUsuario dijo: {prompt}"
+                except (WorkerPoolSaturado, WorkerTimeout):
+                    raise
+                except Exception as e:
+                    print(f"[CHAT] Error al procesar archivo base64: {str(e)}")
 
-        start = time.perf_counter() # para que veamos si sale o no optimizada esta madre, sus tiempos
+            start = time.perf_counter() # para que veamos si sale o no optimizada esta madre, sus tiempos
 
-        reply = await agent.responder(prompt, session_id=session_id)
+            with span("agent.responder"):
+                reply = await agent.responder(prompt, session_id=session_id, user_id=user_id)
 
-        await save_session(user_id, session_id, prompt, reply.get("text", ""))
+            with span("db.save_session"):
+                await save_session(user_id, session_id, prompt, reply.get("text", ""))
 
         latency_ms = (time.perf_counter() - start) * 1000
         await log_latency("/chat", latency_ms)
@@ -107,22 +150,31 @@ def setup_routes(app):
             )
         
     @get("/mcp/list-docs")
-    async def list_mcp_documents() -> Response:
-        async with async_session() as session:
-            result = await session.execute(select(McpDocument))
-            docs = result.scalars().all()
-            payload = [
-                { "filename": d.filename, "created_at": d.created_at.isoformat() }
-                for d in docs
-            ]
-            return Response(200, content=Content(b"application/json", json.dumps(payload).encode("utf-8")))
+    async def list_mcp_documents(request: Request) -> Response:
+        # NDJSON paginado por clave (?after_id=&limit=); solo las columnas que se devuelven
+        try:
+            after_id, limit = parse_keyset(request)
+        except ValueError as e:
+            return bad_request(str(e))
+        stmt = (
+            select(McpDocument.id, McpDocument.filename, McpDocument.created_at)
+            .where(McpDocument.id > after_id)
+            .order_by(McpDocument.id)
+            .limit(limit)
+        )
+        return ndjson_response(stmt, lambda d: {
+            "id": d.id, "filename": d.filename, "created_at": d.created_at.isoformat()
+        })
 
     @get("/mcp/search")
     async def search_mcp_documents(request: Request) -> Response:
         query = request.query.get("query")
+        query = query[0] if isinstance(query, list) else query
         top_k_raw = request.query.get("top_k", ["5"])
         top_k = int(top_k_raw[0]) if isinstance(top_k_raw, list) else int(top_k_raw)
-
+        mode = request.query.get("mode", ["hybrid"])[0]  # hybrid | lexical | vector
+        if mode not in SEARCH_MODES:
+            return bad_request(f"mode debe ser uno de {', '.join(SEARCH_MODES)}")
 
         if not query:
             return Response(
@@ -133,28 +185,15 @@ def setup_routes(app):
                 )
             )
 
-        query_embedding = generate_embedding(query)
-        vector_str = f"[{', '.join(map(str, query_embedding))}]"
-
-        sql = text("""
-            SELECT filename, content, path, created_at,
-            embedding_pg <#> :query_vector AS distance
-            FROM mcpdocument
-            ORDER BY distance ASC
-            LIMIT :top_k
-        """)
-
-        async with async_session() as session:
-            result = await session.execute(sql, {
-                "query_vector": vector_str,
-                "top_k": top_k
-            })
-            rows = result.mappings().all()
+        rows = await buscar_hibrido(query, top_k=top_k, mode=mode)
 
         payload = [
             {
                 "filename": row["filename"],
-                "score": round(1 - row["distance"], 4),
+                "score": round(row["score"], 4),
+                "matched_by": row["matched_by"],
+                "similarity": round(row["similarity"], 4) if row.get("similarity") is not None else None,
+                "page": row["page"],
                 "path": row["path"],
                 "content_snippet": row["content"][:300],
                 "created_at": row["created_at"].isoformat()
@@ -185,32 +224,159 @@ def setup_routes(app):
         base64_file = body.get("base64_file")
         filename = body.get("filename")
 
-        full_prompt = combinar_prompt(prompt, base64_file, filename)
+        request_start = time.perf_counter()
+
+        def sse(event: dict) -> bytes:
+            # Un evento SSE por mensaje: "data: <json>" + línea en blanco
+            return f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")
 
         async def stream_tokens():
             start = time.perf_counter()
-            collected = ""
-            async for token in agent.stream_responder(full_prompt, session_id=session_id, filename=filename, base64_file=base64_file):
-                collected += token
-                yield token.encode("utf-8")
+            parts = []
+            state = {}
+            # La traza no queda como span actual entre yields (ese contexto es el del servidor):
+            # se activa con use_span solo mientras se espera el siguiente evento del agente
+            with start_trace("POST /chat-stream", activate=False, session_id=session_id, has_file=bool(base64_file)) as trace:
+                # Primer byte inmediato, antes de OCR, tools, embeddings o pgvector
+                yield sse({"type": "status", "status": "recibido", "message": "Procesando tu mensaje..."})
+                ttfb_ms = (time.perf_counter() - request_start) * 1000
+                trace.add_event("first_byte")
+                trace.set_attribute("ttfb_ms", round(ttfb_ms, 2))
+                log_stage_latency("chat_stream.ttfb", ttfb_ms)
+
+                eventos = agent.stream_responder(prompt, session_id=session_id, filename=filename, base64_file=base64_file, state=state, user_id=user_id)
+                try:
+                    while True:
+                        with use_span(trace):
+                            try:
+                                event = await eventos.__anext__()
+                            except StopAsyncIteration:
+                                break
+                        if event["type"] == "token":
+                            parts.append(event["token"])
+                        elif event["type"] == "tool":
+                            parts.append(event["text"])
+                        yield sse(event)
+                except Exception as e:
+                    print(f"[CHAT-STREAM] Error durante el streaming: {e}")
+                    yield sse({"type": "error", "message": "Ocurrió un error generando la respuesta."})
+                finally:
+                    with use_span(trace):
+                        await eventos.aclose()
+                yield sse({"type": "done", "session_id": session_id})
 
-            await save_session(user_id, session_id, full_prompt, collected)
+                with use_span(trace), span("db.save_session"):
+                    await save_session(user_id, session_id, state.get("prompt", prompt), "".join(parts))
             latency_ms = (time.perf_counter() - start) * 1000
             await log_latency("/chat-stream", latency_ms)
         return Response(
             200,
+            # Sin cache ni buffering de proxies (nginx) para que cada evento salga al instante
+            headers=[(b"Cache-Control", b"no-cache"), (b"X-Accel-Buffering", b"no")],
             content=StreamedContent(b"text/event-stream", stream_tokens)
         )
     
+    @get("/ready")
+    async def readiness() -> Response:
+        ocr = ocr_readiness()
+        payload = {"status": "ready" if ocr["ready"] else "warming", "ocr": ocr}
+        return Response(
+            200 if ocr["ready"] else 503,
+            content=Content(b"application/json", json.dumps(payload).encode("utf-8"))
+        )
+
     @get("/metrics/latency")
     async def get_latency_metrics(request: Request) -> Response:
         endpoint = request.query.get("endpoint", ["/chat"])[0]
-        metrics = await obtener_metricas_latencia(endpoint)
+        kind = request.query.get("kind", ["endpoint"])[0]  # endpoint | stage
+        try:
+            minutes = int(request.query.get("minutes", ["60"])[0])
+        except ValueError:
+            return bad_request("minutes debe ser un número entero")
+        # No se puede pedir más de lo que guardan los histogramas en memoria
+        ventana_min = max(1, settings.LATENCY_SLOT_S * settings.LATENCY_WINDOW_SLOTS // 60)
+        minutes = min(max(minutes, 1), ventana_min)
+        metrics = await obtener_metricas_latencia(endpoint, ultimos_minutos=minutes, kind=kind)
         return Response(
             200,
             content=Content(b"application/json", json.dumps(metrics).encode("utf-8"))
         )
 
+    @get("/metrics")
+    async def get_prometheus_metrics() -> Response:
+        db_pool = pool_metrics()
+        wb = write_behind.stats()
+        pools = estado_pools()
+        gauges = {
+            "momostenango_db_pool_checked_out": db_pool["checked_out"],
+            "momostenango_db_pool_overflow": db_pool["overflow"],
+            "momostenango_db_pool_wait_max_ms": db_pool["wait_max_ms"],
+            "momostenango_write_behind_queued": wb["queued"],
+            "momostenango_write_behind_dropped": wb["dropped"],
+            **{f"momostenango_http_{k}": v for k, v in http_client_stats().items()},
+            **{f"momostenango_worker_{name}_pending": estado["pendientes"] for name, estado in pools.items()},
+            **{f"momostenango_worker_{name}_rejected": estado["rechazados"] for name, estado in pools.items()},
+        }
+        return Response(
+            200,
+            content=Content(b"text/plain; version=0.0.4", prometheus_text(gauges).encode("utf-8"))
+        )
+
+    @get("/metrics/workers")
+    async def get_worker_metrics() -> Response:
+        return Response(
+            200,
+            content=Content(b"application/json", json.dumps(estado_pools()).encode("utf-8"))
+        )
+
+    @get("/metrics/jobs")
+    async def get_job_metrics() -> Response:
+        return Response(
+            200,
+            content=Content(b"application/json", json.dumps(await job_queue_stats()).encode("utf-8"))
+        )
+
+    @get("/metrics/http")
+    async def get_http_metrics() -> Response:
+        return Response(
+            200,
+            content=Content(b"application/json", json.dumps(http_client_stats()).encode("utf-8"))
+        )
+
+    @get("/metrics/models")
+    async def get_model_metrics() -> Response:
+        return Response(
+            200,
+            content=Content(b"application/json", json.dumps(model_router_stats()).encode("utf-8"))
+        )
+
+    @get("/metrics/db-pool")
+    async def get_db_pool_metrics() -> Response:
+        return Response(
+            200,
+            content=Content(b"application/json", json.dumps(pool_metrics()).encode("utf-8"))
+        )
+
+    @get("/metrics/write-behind")
+    async def get_write_behind_metrics() -> Response:
+        return Response(
+            200,
+            content=Content(b"application/json", json.dumps(write_behind.stats()).encode("utf-8"))
+        )
+
+    @get("/metrics/cache")
+    async def get_cache_metrics() -> Response:
+        payload = {
+            "extraction": extraction_cache_stats(),
+            "embedding": {**embedding_cache_stats(), "batcher": embedding_batcher_stats()},
+            "response": response_cache_stats(),
+            "session_memory": session_memory_stats(),
+        }
+        return Response(
+            200,
+            content=Content(b"application/json", json.dumps(payload).encode("utf-8"))
+        )
+
     @get("/test-cors")
     async def test_cors():
         return Response(200, content=Content(b"text/plain", b"CORS OK"))
\ No newline at end of file
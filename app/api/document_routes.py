@@ -3,11 +3,12 @@ from blacksheep.contents import Content
 from app.db.models import Document
 from app.db.database import async_session
 from sqlmodel import select
-from app.services.embedding_service import generate_embedding
+from app.api.pagination import bad_request, parse_keyset, ndjson_response
+from app.services.embedding_service import generate_embedding_async
 import json
-import pickle
 from base64 import b64decode
-from app.services.file_processor import extract_text_from_pdf_bytes, extract_text_from_image_bytes
+from app.services.extraction_service import extract_text_async
+from app.services.worker_pool import WorkerPoolSaturado, WorkerTimeout
 
 
 @post("/documents")
@@ -18,11 +19,10 @@ async def create_document(request: Request) -> Response:
     content = body.get("content", "")
 
     # Generar embedding para el contenido del documento
-    embedding = generate_embedding(content)
-    embedding_bytes = pickle.dumps(embedding)
+    embedding = await generate_embedding_async(content)
 
     # Crear el documento en la base de datos
-    new_doc = Document(title=title, content=content, embedding=embedding_bytes)
+    new_doc = Document(title=title, content=content, embedding_pg=embedding)
 
     async with async_session() as session:
         session.add(new_doc)
@@ -30,9 +30,8 @@ async def create_document(request: Request) -> Response:
         await session.refresh(new_doc)
 
         # Devolver el documento creado con sus detalles
-        doc_dict = new_doc.model_dump()
-        if new_doc.embedding:
-            doc_dict["embedding"] = pickle.loads(new_doc.embedding)
+        doc_dict = new_doc.model_dump(exclude={"embedding_pg"})
+        doc_dict["embedding"] = embedding
 
         return Response(
             201,
@@ -53,22 +52,22 @@ async def process_document(request: Request) -> Response:
         
         # Extraer texto dependiendo del tipo de archivo
         if file_type == "image":
-            text = extract_text_from_image_bytes(binary_data)
+            text = await extract_text_async(binary_data, "documento.png")
         else:
-            text = extract_text_from_pdf_bytes(binary_data)
+            text = await extract_text_async(binary_data, "documento.pdf")
 
+    except (WorkerPoolSaturado, WorkerTimeout):
+        raise
     except Exception as e:
         return Response(400, content=Content(b"application/json", json.dumps({"error": str(e)}).encode()))
 
     # Obtener título y generar embedding para el contenido extraído
     title = body.get("title", "Documento Procesado")
-    embedding_vector = await generate_embedding(text)
-    embedding = pickle.dumps(embedding_vector)
-
+    embedding_vector = await generate_embedding_async(text)
 
     # Guardar el documento en la base de datos
     async with async_session() as session:
-        doc = Document(title=title, content=text, embedding=embedding)
+        doc = Document(title=title, content=text, embedding_pg=embedding_vector)
         session.add(doc)
         await session.commit()
         await session.refresh(doc)
@@ -83,23 +82,18 @@ async def process_document(request: Request) -> Response:
 
 @get("/documents")
 async def search_documents(request: Request) -> Response:
-    # Endpoint para obtener todos los documentos almacenados
-    async with async_session() as session:
-        result = await session.execute(select(Document))
-        documents = result.scalars().all()
-
-        # Serializar los documentos para la respuesta
-        serialized = []
-        for doc in documents:
-            doc_dict = doc.model_dump()
-            if doc.embedding:
-                doc_dict["embedding"] = pickle.loads(doc.embedding)  # Deserializar embedding
-            serialized.append(doc_dict)
-
-        return Response(
-            200,
-            content=Content(b"application/json", json.dumps(serialized).encode("utf-8"))
-        )
+    # Listado paginado por clave (?after_id=&limit=) en NDJSON: solo id y título, sin contenido ni embeddings
+    try:
+        after_id, limit = parse_keyset(request)
+    except ValueError as e:
+        return bad_request(str(e))
+    stmt = (
+        select(Document.id, Document.title)
+        .where(Document.id > after_id)
+        .order_by(Document.id)
+        .limit(limit)
+    )
+    return ndjson_response(stmt, lambda row: {"id": row.id, "title": row.title})
 
 
 def setup_document_routes(app):
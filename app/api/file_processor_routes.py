@@ -1,19 +1,29 @@
 from blacksheep import get, post, Request, Response
 from blacksheep.contents import Content
 from starlette.datastructures import UploadFile
-from app.services.file_processor import (
-    extract_text_from_pdf_bytes,
-    extract_text_from_image_bytes
-)
+from app.config.settings import settings
+from app.services.file_processor import is_supported_file
+from app.services.extraction_service import extract_text_async
+from app.services.upload_buffer import SpooledUpload, UploadDemasiadoGrande, read_upload
+from app.services.job_queue import ACCIONES, enqueue_job, get_job
+from app.services.worker_pool import WorkerPoolSaturado, WorkerTimeout
 import json
-from app.services.mcp_document_service import save_mcp_document
+from app.services.ingestion_service import ingest_document
+from app.services.vector_search import buscar_fragmentos
+from app.services.bulk_ingestion_service import (
+    create_bulk_job,
+    get_bulk_job,
+    ingest_directory,
+    ingest_tar,
+    resolve_ingest_directory
+)
+import asyncio
+import tempfile
 from base64 import b64decode
-from app.services.embedding_service import generate_embedding
-import pickle
+from app.services.embedding_service import generate_embedding_async
 from app.db.models import McpDocument
-from app.db.database import async_session
 from sqlmodel import select
-from sqlalchemy import text
+from app.api.pagination import bad_request, parse_keyset, ndjson_response
 from blacksheep import get, Response
 from blacksheep.server.responses import file
 from pathlib import Path
@@ -74,45 +84,238 @@ async def process_file_base64(request: Request) -> Response:
                 json.dumps({"error": "Se requiere 'filename' y 'base64_data'."}).encode("utf-8")
             ))
 
-        raw_bytes = b64decode(base64_data)
-        if filename.lower().endswith(".pdf"):
-            text = extract_text_from_pdf_bytes(raw_bytes)
-        elif filename.lower().endswith((".jpg", ".jpeg", ".png", ".bmp", ".tiff")):
-            text = extract_text_from_image_bytes(raw_bytes)
-        else:
+        if not is_supported_file(filename):
             return Response(415, content=Content(
                 b"application/json",
                 json.dumps({"error": "Formato no soportado. Solo PDF o imagen."}).encode("utf-8")
             ))
 
-        embedding = generate_embedding(text)
-        await save_mcp_document(filename, text, embedding, path) 
+        raw_bytes = b64decode(base64_data)
+        if data.get("async"):
+            # Responde de inmediato con el id del trabajo; el resultado se consulta en /jobs/{id}
+            with SpooledUpload(filename, max_bytes=len(raw_bytes)) as upload:
+                upload.write(raw_bytes)
+                upload.finish()
+                return await _respuesta_encolado(upload, "ingest", path)
+
+        result = await ingest_document(filename, raw_bytes, path)
 
         return Response(200, content=Content(
             b"application/json",
-            json.dumps({"filename": filename, "text": text[:300]}).encode("utf-8")
+            json.dumps({
+                "filename": filename,
+                "text": result["text"][:300],
+                "document_id": result["document_id"],
+                "chunks": result["chunks"]
+            }).encode("utf-8")
         ))
 
+    except (WorkerPoolSaturado, WorkerTimeout):
+        raise
     except Exception as e:
         return Response(500, content=Content(
             b"application/json",
             json.dumps({"error": str(e)}).encode("utf-8")
         ))
 
+
+@post("/upload")
+async def upload_file(request: Request) -> Response:
+    # Subida sin base64: multipart/form-data (campo de archivo + action/path) o el archivo crudo en
+    # el cuerpo con ?filename=&action=&path=. Se vuelca en streaming a memoria o a un temporal en
+    # disco y los extractores leen de ahí; pasar UPLOAD_MAX_BYTES corta la lectura con 413.
+    try:
+        upload, fields = await read_upload(request)
+    except ValueError as e:
+        return Response(400, content=Content(
+            b"application/json",
+            json.dumps({"error": str(e)}).encode("utf-8")
+        ))
+
+    with upload:
+        if not upload.filename or not is_supported_file(upload.filename):
+            return Response(415, content=Content(
+                b"application/json",
+                json.dumps({"error": "Formato no soportado. Solo PDF o imagen (indica el nombre del archivo)."}).encode("utf-8")
+            ))
+
+        action = fields.get("action", "extract")
+        if action == "ingest":
+            result = await ingest_document(upload.filename, upload.source(), fields.get("path", "root"), upload.digest)
+            payload = {
+                "filename": upload.filename,
+                "text": result["text"][:300],
+                "document_id": result["document_id"],
+                "chunks": result["chunks"],
+            }
+        elif action == "extract":
+            text = await extract_text_async(upload.source(), upload.filename, upload.digest)
+            payload = {
+                "filename": upload.filename,
+                "size_bytes": upload.size,
+                "sha256": upload.digest,
+                "text": text or "",
+            }
+        else:
+            return Response(400, content=Content(
+                b"application/json",
+                json.dumps({"error": "action debe ser 'extract' o 'ingest'"}).encode("utf-8")
+            ))
+
+    return Response(200, content=Content(
+        b"application/json",
+        json.dumps(payload).encode("utf-8")
+    ))
+
+
+async def _respuesta_encolado(upload: SpooledUpload, action: str, path: str) -> Response:
+    job, creado = await enqueue_job(upload, action, path)
+    job["deduplicated"] = not creado
+    # Un archivo ya procesado (mismo sha256, action y path) devuelve el resultado sin volver a encolar
+    response = Response(200 if job["status"] == "completado" else 202, content=Content(
+        b"application/json",
+        json.dumps(job).encode("utf-8")
+    ))
+    response.add_header(b"Location", f"/jobs/{job['job_id']}".encode("utf-8"))
+    return response
+
+
+@post("/jobs")
+async def create_job(request: Request) -> Response:
+    # Mismos formatos que /upload (multipart o cuerpo crudo con ?filename=), pero sin esperar al
+    # OCR ni a los embeddings: guarda el archivo en la cola (Postgres) y devuelve 202 con el id.
+    try:
+        upload, fields = await read_upload(request)
+    except ValueError as e:
+        return Response(400, content=Content(
+            b"application/json",
+            json.dumps({"error": str(e)}).encode("utf-8")
+        ))
+
+    with upload:
+        if not upload.filename or not is_supported_file(upload.filename):
+            return Response(415, content=Content(
+                b"application/json",
+                json.dumps({"error": "Formato no soportado. Solo PDF o imagen (indica el nombre del archivo)."}).encode("utf-8")
+            ))
+
+        action = fields.get("action", "extract")
+        if action not in ACCIONES:
+            return Response(400, content=Content(
+                b"application/json",
+                json.dumps({"error": "action debe ser 'extract' o 'ingest'"}).encode("utf-8")
+            ))
+        return await _respuesta_encolado(upload, action, fields.get("path", "root"))
+
+
+@get("/jobs/{job_id}")
+async def get_extraction_job(job_id: str) -> Response:
+    job = await get_job(job_id)
+    if job is None:
+        return Response(404, content=Content(
+            b"application/json",
+            json.dumps({"error": "Trabajo no encontrado"}).encode("utf-8")
+        ))
+    return Response(200, content=Content(
+        b"application/json",
+        json.dumps(job).encode("utf-8")
+    ))
+
+
+# Tareas de ingesta masiva en segundo plano (se guarda la referencia para que no las recolecte el GC)
+_bulk_tasks = set()
+
+def _lanzar_en_segundo_plano(coro):
+    task = asyncio.create_task(coro)
+    _bulk_tasks.add(task)
+    task.add_done_callback(_bulk_tasks.discard)
+
+
+@post("/mcp/ingest-dir")
+async def ingest_mcp_directory(request: Request) -> Response:
+    data = await request.json()
+    directory = (data or {}).get("directory", ".")
+    path = (data or {}).get("path", "root")
+
+    try:
+        target = resolve_ingest_directory(directory)
+    except ValueError as e:
+        return Response(400, content=Content(
+            b"application/json",
+            json.dumps({"error": str(e)}).encode("utf-8")
+        ))
+
+    job = create_bulk_job()
+    _lanzar_en_segundo_plano(ingest_directory(target, path, job))
+    return Response(202, content=Content(
+        b"application/json",
+        json.dumps(job.to_dict()).encode("utf-8")
+    ))
+
+
+@post("/mcp/ingest-tar")
+async def ingest_mcp_tar(request: Request) -> Response:
+    # Cuerpo: archivo .tar / .tar.gz crudo. Se vuelca a disco en streaming, sin base64.
+    # Tope INGEST_TAR_MAX_BYTES por Content-Length y mientras se lee (413 como en /upload)
+    path = request.query.get("path", ["root"])[0]
+    length = request.headers.get_first(b"content-length")
+    if length and int(length) > settings.INGEST_TAR_MAX_BYTES:
+        raise UploadDemasiadoGrande(f"El archivo excede {settings.INGEST_TAR_MAX_BYTES} bytes")
+    tmp = tempfile.NamedTemporaryFile(prefix="mcp_ingesta_", suffix=".tar", delete=False)
+    try:
+        with tmp:
+            recibidos = 0
+            async for chunk in request.stream():
+                recibidos += len(chunk)
+                if recibidos > settings.INGEST_TAR_MAX_BYTES:
+                    raise UploadDemasiadoGrande(f"El archivo excede {settings.INGEST_TAR_MAX_BYTES} bytes")
+                tmp.write(chunk)
+    except UploadDemasiadoGrande:
+        Path(tmp.name).unlink(missing_ok=True)
+        raise
+    except Exception as e:
+        Path(tmp.name).unlink(missing_ok=True)
+        return Response(400, content=Content(
+            b"application/json",
+            json.dumps({"error": f"No se pudo leer el archivo: {e}"}).encode("utf-8")
+        ))
+
+    job = create_bulk_job()
+    _lanzar_en_segundo_plano(ingest_tar(Path(tmp.name), path, job))
+    return Response(202, content=Content(
+        b"application/json",
+        json.dumps(job.to_dict()).encode("utf-8")
+    ))
+
+
+@get("/mcp/ingest-jobs/{job_id}")
+async def get_ingest_job(job_id: str) -> Response:
+    job = get_bulk_job(job_id)
+    if job is None:
+        return Response(404, content=Content(
+            b"application/json",
+            json.dumps({"error": "Trabajo de ingesta no encontrado"}).encode("utf-8")
+        ))
+    return Response(200, content=Content(
+        b"application/json",
+        json.dumps(job.to_dict()).encode("utf-8")
+    ))
+
     
 @get("/mcp/explore-dir")
-async def explore_dir():
-    async with async_session() as session:
-        result = await session.execute(select(McpDocument))
-        docs = result.scalars().all()
-
-    return [
-        {
-            "filename": doc.filename,
-            "path": doc.path
-        }
-        for doc in docs
-    ]
+async def explore_dir(request: Request) -> Response:
+    # NDJSON paginado por clave (?after_id=&limit=) con solo filename/path
+    try:
+        after_id, limit = parse_keyset(request)
+    except ValueError as e:
+        return bad_request(str(e))
+    stmt = (
+        select(McpDocument.id, McpDocument.filename, McpDocument.path)
+        .where(McpDocument.id > after_id)
+        .order_by(McpDocument.id)
+        .limit(limit)
+    )
+    return ndjson_response(stmt, lambda doc: {"id": doc.id, "filename": doc.filename, "path": doc.path})
 # experimentando
 @get("/mcp/search-pgvector")
 async def search_mcp_pgvector(request: Request) -> Response:
@@ -123,25 +326,15 @@ async def search_mcp_pgvector(request: Request) -> Response:
             json.dumps({"error": "Falta el parámetro ?query="}).encode("utf-8")
         ))
 
-    query_embedding = generate_embedding(query)
-
-    sql = text("""
-        SELECT id, filename, content, path, created_at,
-        embedding_pg <#> :query_vector AS distance
-        FROM mcpdocument
-        ORDER BY distance ASC
-        LIMIT 5
-    """)
-
-    async with async_session() as session:
-        vector_str = f"[{', '.join(map(str, query_embedding))}]"
-        result = await session.execute(sql, {"query_vector": vector_str})
-        rows = result.mappings().all()
+    query = query[0] if isinstance(query, list) else query
+    query_embedding = await generate_embedding_async(query)
+    rows = await buscar_fragmentos(query_embedding, top_k=5)
 
     payload = [
         {
             "filename": row["filename"],
-            "score": round(1 - row["distance"], 4),  # Convertimos distancia a similitud
+            "score": round(row["similarity"], 4),  # similitud coseno
+            "page": row["page"],
             "path": row["path"],
             "content_snippet": row["content"][:300],
             "created_at": row["created_at"].isoformat()
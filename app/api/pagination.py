@@ -0,0 +1,40 @@
+import json
+from typing import Callable, Tuple
+from blacksheep import Request, Response
+from blacksheep.contents import Content, StreamedContent
+from app.db.database import async_session
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def parse_keyset(request: Request) -> Tuple[int, int]:
+    """
+    Paginación por clave: ?after_id=<último id recibido>&limit=<n>.
+    Cada línea NDJSON trae su "id"; el cliente pide la siguiente página con el último.
+    Lanza ValueError si after_id o limit no son enteros (las rutas responden 400).
+    """
+    try:
+        after_id = int(request.query.get("after_id", ["0"])[0])
+        limit = int(request.query.get("limit", [str(DEFAULT_PAGE_SIZE)])[0])
+    except ValueError:
+        raise ValueError("after_id y limit deben ser números enteros")
+    return after_id, min(max(limit, 1), MAX_PAGE_SIZE)
+
+
+def bad_request(message: str) -> Response:
+    return Response(400, content=Content(
+        b"application/json",
+        json.dumps({"error": message}).encode("utf-8")
+    ))
+
+
+def ndjson_response(stmt, serialize: Callable[[object], dict]) -> Response:
+    """Ejecuta la consulta con cursor del servidor y emite una línea JSON por fila."""
+    async def stream_rows():
+        async with async_session() as session:
+            result = await session.stream(stmt)
+            async for row in result:
+                yield (json.dumps(serialize(row)) + "\n").encode("utf-8")
+
+    return Response(200, content=StreamedContent(b"application/x-ndjson", stream_rows))
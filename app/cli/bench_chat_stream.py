@@ -0,0 +1,87 @@
+"""
+Benchmark de /chat-stream: mide el tiempo hasta el primer byte (TTFB), hasta el primer
+token del LLM y el total, con N peticiones y cierta concurrencia.
+
+Uso (con el backend corriendo, idealmente contra app.cli.stub_model_server):
+    python -m app.cli.bench_chat_stream --url http://127.0.0.1:8000/chat-stream -n 50 -c 5 \\
+        --prompt "¿Cuál es la multa por no pagar el impuesto vehicular?"
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import List, Optional
+
+import httpx
+
+
+def _percentil(valores: List[float], q: float) -> Optional[float]:
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    idx = min(len(ordenados) - 1, max(0, round(q * (len(ordenados) - 1))))
+    return ordenados[idx]
+
+
+async def _una_peticion(client: httpx.AsyncClient, url: str, payload: dict) -> dict:
+    start = time.perf_counter()
+    ttfb = first_token = None
+    eventos = 0
+    async with client.stream("POST", url, json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            if not line.startswith("data:"):
+                continue
+            eventos += 1
+            event = json.loads(line[len("data:"):])
+            if first_token is None and event.get("type") in ("token", "tool"):
+                first_token = time.perf_counter() - start
+    return {"ttfb": ttfb, "first_token": first_token, "total": time.perf_counter() - start, "events": eventos}
+
+
+async def main(url: str, n: int, concurrency: int, prompt: str, base64_file: str = None, filename: str = None):
+    payload = {"prompt": prompt, "user_id": "bench", "session_id": "bench"}
+    if base64_file:
+        payload.update({"base64_file": base64_file, "filename": filename})
+
+    semaforo = asyncio.Semaphore(concurrency)
+    resultados, errores = [], 0
+
+    async with httpx.AsyncClient(timeout=120) as client:
+        async def correr():
+            nonlocal errores
+            async with semaforo:
+                try:
+                    resultados.append(await _una_peticion(client, url, payload))
+                except Exception as e:
+                    errores += 1
+                    print(f"[BENCH] Error: {e}")
+
+        await asyncio.gather(*[correr() for _ in range(n)])
+
+    print(f"[BENCH] {len(resultados)} ok, {errores} errores, concurrencia {concurrency}")
+    for campo in ("ttfb", "first_token", "total"):
+        valores = [r[campo] * 1000 for r in resultados if r[campo] is not None]
+        if valores:
+            print(f"[BENCH] {campo:>11}: p50={_percentil(valores, 0.5):8.1f} ms  "
+                  f"p95={_percentil(valores, 0.95):8.1f} ms  max={max(valores):8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TTFB de /chat-stream")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/chat-stream")
+    parser.add_argument("-n", type=int, default=20, help="Número de peticiones")
+    parser.add_argument("-c", type=int, default=1, help="Peticiones concurrentes")
+    parser.add_argument("--prompt", default="¿Qué impuestos municipales debo pagar por mi vehículo?")
+    parser.add_argument("--file", help="Archivo (imagen/PDF) a adjuntar en base64 para medir el camino con OCR")
+    args = parser.parse_args()
+
+    b64 = name = None
+    if args.file:
+        import base64
+        from pathlib import Path
+        b64 = base64.b64encode(Path(args.file).read_bytes()).decode("ascii")
+        name = Path(args.file).name
+    asyncio.run(main(args.url, args.n, args.c, args.prompt, b64, name))
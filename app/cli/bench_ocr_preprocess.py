@@ -0,0 +1,178 @@
+"""
+Benchmark del preprocesado de imágenes antes del OCR: compara latencia y precisión de
+variantes (sin preprocesar, gris+reducción, +deskew, +binarización) sobre un directorio.
+
+Referencia de precisión por imagen: `<nombre>.gt.txt` si existe junto a la imagen; si no, el
+texto del OCR sin preprocesar a resolución completa (mide cuánto se pierde al preprocesar).
+Con --simulate-photo N cada imagen se reescala a lado N y se recodifica como JPEG, para
+medir el caso de fotos de teléfono (12 MP ≈ lado 4000) con los archivos de prueba.
+
+Con --precheck-only no corre OCR: muestra las estadísticas del pre-chequeo "¿tiene texto?"
+(separabilidad, filas con trazos, primer plano) de cada imagen y de las primeras páginas de
+cada PDF rasterizadas, que hacen de escaneos. Sirve para ajustar los umbrales sin EasyOCR.
+
+Uso:
+    python -m app.cli.bench_ocr_preprocess tests/files_to_test --repeat 3 --simulate-photo 4000
+    python -m app.cli.bench_ocr_preprocess tests/files_to_test --precheck-only --simulate-photo 4000
+"""
+import argparse
+import difflib
+import os
+import re
+import statistics
+import time
+from io import BytesIO
+from typing import Dict, List, Tuple
+
+from app.config.settings import settings
+from app.services.file_processor import IMAGE_EXTENSIONS, get_reader
+from app.services.image_preprocessing import preprocess_for_ocr
+
+VARIANTES = {
+    "prep": dict(deskew=False, binarize=False),
+    "prep+deskew": dict(deskew=True, binarize=False),
+    "prep+binarize": dict(deskew=False, binarize=True),
+}
+
+
+def _normalizar(text: str) -> str:
+    return re.sub(r"\s+", " ", text.lower()).strip()
+
+
+def _precision(texto: str, referencia: str) -> Dict[str, float]:
+    texto, referencia = _normalizar(texto), _normalizar(referencia)
+    palabras_ref = set(referencia.split())
+    return {
+        "similitud": difflib.SequenceMatcher(None, texto, referencia).ratio() if referencia else float(not texto),
+        "recall_palabras": len(palabras_ref & set(texto.split())) / len(palabras_ref) if palabras_ref else 1.0,
+    }
+
+
+def _simular_foto(raw: bytes, lado: int) -> bytes:
+    from PIL import Image
+
+    image = Image.open(BytesIO(raw)).convert("RGB")
+    escala = lado / max(image.size)
+    image = image.resize((round(image.width * escala), round(image.height * escala)), Image.BICUBIC)
+    out = BytesIO()
+    image.save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+def _ocr_original(raw: bytes) -> str:
+    import numpy as np
+    from PIL import Image
+
+    result = get_reader().readtext(np.array(Image.open(BytesIO(raw))))
+    return "\n".join(item[1] for item in result)
+
+
+def _ocr_variante(raw: bytes, opciones: dict) -> Tuple[str, dict]:
+    prep = preprocess_for_ocr(raw, precheck=True, **opciones)
+    info = {"size": prep.size, "has_text": prep.has_text, "separability": prep.separability,
+            "text_rows": prep.text_rows, "foreground": prep.foreground, "steps": prep.steps}
+    if not prep.has_text:
+        return "", info
+    result = get_reader().readtext(prep.image)
+    return "\n".join(item[1] for item in result), info
+
+
+def _medir(fn, repeat: int):
+    tiempos = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        salida = fn()
+        tiempos.append((time.perf_counter() - start) * 1000)
+    return salida, statistics.median(tiempos)
+
+
+def _paginas_pdf(path: str, max_paginas: int = 3, dpi: int = 150) -> List[Tuple[str, bytes]]:
+    import fitz
+
+    with fitz.open(path) as doc:
+        return [(f"{os.path.basename(path)}#p{page.number + 1}", page.get_pixmap(dpi=dpi).tobytes("png"))
+                for page in doc if page.number < max_paginas]
+
+
+def precheck_only(directorio: str, simulate_photo: int):
+    muestras: List[Tuple[str, bytes]] = []
+    for nombre in sorted(os.listdir(directorio)):
+        path = os.path.join(directorio, nombre)
+        if nombre.lower().endswith(IMAGE_EXTENSIONS):
+            with open(path, "rb") as f:
+                muestras.append((nombre, f.read()))
+        elif nombre.lower().endswith(".pdf"):
+            muestras.extend(_paginas_pdf(path))
+
+    print(f"[BENCH] Pre-chequeo (OCR_TEXT_MIN_SEPARABILITY={settings.OCR_TEXT_MIN_SEPARABILITY}), "
+          f"simulate_photo={simulate_photo or 'no'}")
+    for nombre, raw in muestras:
+        variantes = [(nombre, raw)]
+        if simulate_photo:
+            variantes.append((f"{nombre}@{simulate_photo}", _simular_foto(raw, simulate_photo)))
+        for etiqueta, datos in variantes:
+            prep = preprocess_for_ocr(datos, deskew=False, binarize=False, precheck=True)
+            print(f"  {etiqueta:<48} has_text={prep.has_text!s:<5} separability={prep.separability:.3f}  "
+                  f"text_rows={prep.text_rows:.3f}  foreground={prep.foreground:.3f}")
+
+
+def main(directorio: str, repeat: int, simulate_photo: int):
+    archivos = sorted(
+        os.path.join(directorio, f) for f in os.listdir(directorio) if f.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not archivos:
+        print(f"[BENCH] No hay imágenes en {directorio}")
+        return
+
+    print("[BENCH] Cargando lector OCR (no cuenta en las mediciones)...")
+    get_reader()
+    print(f"[BENCH] OCR_MAX_SIDE={settings.OCR_MAX_SIDE}, repeat={repeat}, simulate_photo={simulate_photo or 'no'}")
+
+    totales: Dict[str, List[float]] = {"original": []}
+    for path in archivos:
+        with open(path, "rb") as f:
+            raw = f.read()
+        if simulate_photo:
+            raw = _simular_foto(raw, simulate_photo)
+        nombre = os.path.basename(path)
+
+        texto_original, ms_original = _medir(lambda: _ocr_original(raw), repeat)
+        gt_path = os.path.splitext(path)[0] + ".gt.txt"
+        if os.path.exists(gt_path):
+            with open(gt_path, encoding="utf-8") as f:
+                referencia, fuente = f.read(), "gt"
+        else:
+            referencia, fuente = texto_original, "ocr-original"
+
+        print(f"\n[BENCH] {nombre} ({len(raw) / 1024:.0f} KB, referencia: {fuente})")
+        p = _precision(texto_original, referencia)
+        print(f"  {'original':<14} {ms_original:8.0f} ms  similitud={p['similitud']:.3f}  "
+              f"recall={p['recall_palabras']:.3f}")
+        totales["original"].append(ms_original)
+
+        for variante, opciones in VARIANTES.items():
+            (texto, info), ms = _medir(lambda: _ocr_variante(raw, opciones), repeat)
+            p = _precision(texto, referencia)
+            totales.setdefault(variante, []).append(ms)
+            print(f"  {variante:<14} {ms:8.0f} ms  similitud={p['similitud']:.3f}  "
+                  f"recall={p['recall_palabras']:.3f}  {info}")
+
+    print("\n[BENCH] Latencia total (suma de medianas por imagen):")
+    base = sum(totales["original"]) or 1.0
+    for variante, tiempos in totales.items():
+        print(f"  {variante:<14} {sum(tiempos):8.0f} ms  ({sum(tiempos) / base:.2f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de preprocesado de imágenes para OCR")
+    parser.add_argument("directorio", nargs="?", default="tests/files_to_test")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones por imagen (se toma la mediana)")
+    parser.add_argument("--simulate-photo", type=int, default=0,
+                        help="Reescalar cada imagen a este lado máximo y recodificar como JPEG")
+    parser.add_argument("--precheck-only", action="store_true",
+                        help="Solo estadísticas del pre-chequeo de texto, sin OCR (incluye páginas de PDF)")
+    args = parser.parse_args()
+    if args.precheck_only:
+        precheck_only(args.directorio, args.simulate_photo)
+    else:
+        main(args.directorio, args.repeat, args.simulate_photo)
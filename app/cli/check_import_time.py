@@ -0,0 +1,81 @@
+"""
+Verifica que importar la app (main.py y sus rutas) quede dentro de un presupuesto de tiempo
+y que no arrastre dependencias pesadas (EasyOCR/PyTorch/OpenCV) al proceso del servidor.
+
+Se mide en un intérprete limpio, igual que un arranque real. Sale con código 1 si se excede
+el presupuesto o si se importó algún módulo pesado, para poder usarlo en CI.
+
+Uso:
+    python -m app.cli.check_import_time --budget-ms 2000 --top 15
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+from app.config.settings import settings
+
+# No deben cargarse al importar el servidor: viven en los workers de OCR/PDF y se cargan al primer uso
+HEAVY_MODULES = ("easyocr", "torch", "torchvision", "cv2", "scipy", "skimage", "openai", "fitz", "pymupdf")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{"elapsed_ms": elapsed_ms, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _top_imports(module: str, top: int) -> list:
+    """Módulos con más tiempo acumulado según `python -X importtime`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    filas = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # Formato: "import time:   self_us |   cumulative_us | módulo"
+        _, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        filas.append((int(cumulative_us), name.strip()))
+    return sorted(filas, reverse=True)[:top]
+
+
+def main(module: str, budget_ms: float, top: int) -> int:
+    proc = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        print(proc.stderr)
+        print(f"[IMPORT] No se pudo importar {module}")
+        return 1
+
+    resultado = json.loads(proc.stdout.strip().splitlines()[-1])
+    print(f"[IMPORT] import {module}: {resultado['elapsed_ms']:.0f} ms (presupuesto {budget_ms:.0f} ms)")
+
+    if top:
+        for cumulative_us, name in _top_imports(module, top):
+            print(f"[IMPORT]   {cumulative_us / 1000:8.1f} ms  {name}")
+
+    ok = True
+    if resultado["heavy"]:
+        print(f"[IMPORT] ❌ Módulos pesados cargados al importar: {', '.join(resultado['heavy'])}")
+        ok = False
+    if resultado["elapsed_ms"] > budget_ms:
+        print("[IMPORT] ❌ Se excedió el presupuesto de import")
+        ok = False
+    if ok:
+        print("[IMPORT] ✅ Dentro del presupuesto")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Presupuesto de tiempo de import del servidor")
+    parser.add_argument("--module", default="main", help="Módulo a importar (por defecto main)")
+    parser.add_argument("--budget-ms", type=float, default=settings.STARTUP_IMPORT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=10, help="Mostrar los N imports más lentos (0 = ninguno)")
+    args = parser.parse_args()
+    sys.exit(main(args.module, args.budget_ms, args.top))
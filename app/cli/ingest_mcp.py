@@ -0,0 +1,44 @@
+"""
+Carga masiva de documentos al repositorio MCP desde un directorio local.
+
+Uso:
+    python -m app.cli.ingest_mcp ruta/al/directorio --path reglamentos
+"""
+import argparse
+import asyncio
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.db.database import init_db
+from app.services.bulk_ingestion_service import create_bulk_job, ingest_directory
+from app.services.worker_pool import shutdown_pools
+
+
+async def _reportar_progreso(job, intervalo: float = 2.0):
+    while job.status in ("pendiente", "procesando"):
+        estado = job.to_dict()
+        print(f"[CLI] {estado['extracted']}/{estado['total']} extraídos, {estado['stored']} guardados, "
+              f"{estado['failed']} fallidos, {estado['chunks']} fragmentos ({estado['elapsed_s']}s)")
+        await asyncio.sleep(intervalo)
+
+
+async def main(directory: str, path_prefix: str):
+    await init_db()
+    job = create_bulk_job()
+    progreso = asyncio.create_task(_reportar_progreso(job))
+    try:
+        await ingest_directory(Path(directory).resolve(), path_prefix, job)
+    finally:
+        progreso.cancel()
+        shutdown_pools()
+    print(f"[CLI] Resultado: {job.to_dict()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingesta masiva de PDFs/imágenes al repositorio MCP")
+    parser.add_argument("directory", help="Directorio con los archivos a cargar (se recorre recursivamente)")
+    parser.add_argument("--path", default="root", help="Ruta lógica MCP bajo la que se guardan los documentos")
+    args = parser.parse_args()
+    asyncio.run(main(args.directory, args.path))
@@ -0,0 +1,46 @@
+"""
+Workers de la cola de extracción (POST /jobs) fuera del servidor web. Se pueden correr
+varios, en la misma máquina o en otras: se reparten los trabajos con FOR UPDATE SKIP LOCKED.
+
+Uso:
+    python -m app.cli.job_worker --workers 4
+"""
+import argparse
+import asyncio
+import signal
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.config.settings import settings
+from app.db.database import init_db, dispose_engine
+from app.services.http_client import close_http_client
+from app.services.job_queue import job_queue_stats, start_job_workers, stop_job_workers
+from app.services.worker_pool import shutdown_pools
+
+
+async def main(workers: int):
+    await init_db()
+    detener = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, detener.set)
+
+    start_job_workers(workers)
+    print(f"[CLI] Cola de trabajos: {await job_queue_stats()}")
+    try:
+        await detener.wait()
+    finally:
+        print("[CLI] Deteniendo workers (los trabajos en curso vuelven a la cola)...")
+        await stop_job_workers()
+        shutdown_pools()
+        await close_http_client()
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Procesa la cola de trabajos de extracción/ingesta")
+    parser.add_argument("--workers", type=int, default=settings.JOB_WORKERS,
+                        help="Trabajos en paralelo en este proceso (por defecto JOB_WORKERS)")
+    args = parser.parse_args()
+    asyncio.run(main(args.workers))
@@ -0,0 +1,110 @@
+"""
+Servidor stub local que imita OpenRouter (/chat/completions, con y sin stream) y los
+embeddings de OpenAI (/embeddings), para probar el cliente HTTP compartido sin gastar tokens.
+
+Uso:
+    python -m app.cli.stub_model_server --port 8900 --latency-ms 200 --fail-rate 0.2
+
+y en el .env del backend:
+    OPENROUTER_BASE_URL=http://127.0.0.1:8900
+    OPENAI_BASE_URL=http://127.0.0.1:8900
+"""
+import argparse
+import hashlib
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESPUESTA = "Esta es una respuesta simulada del servidor stub para pruebas de carga."
+
+
+def _vector(text: str, dim: int) -> list:
+    rng = random.Random(int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16))
+    return [rng.uniform(-1, 1) for _ in range(dim)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, para que se note la reutilización de conexiones
+    config = None  # argparse.Namespace
+
+    def log_message(self, format, *args):
+        if self.config.verbose:
+            super().log_message(format, *args)
+
+    def _json(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _simular_red(self) -> bool:
+        """Latencia con cola larga (1 de cada 20 tarda 10x) y fallos 429/503 aleatorios."""
+        latencia = self.config.latency_ms * (10 if random.random() < 0.05 else 1)
+        time.sleep(latencia / 1000)
+        if random.random() < self.config.fail_rate:
+            status = random.choice([429, 503])
+            self._json(status, {"error": {"code": status, "message": "stub: fallo simulado"}}, {"Retry-After": "0"})
+            return False
+        return True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self._simular_red():
+            return
+
+        if self.path.endswith("/embeddings"):
+            inputs = body.get("input")
+            inputs = [inputs] if isinstance(inputs, str) else inputs or []
+            self._json(200, {
+                "data": [{"index": i, "embedding": _vector(text, self.config.dim)} for i, text in enumerate(inputs)],
+                "model": body.get("model"),
+            })
+        elif self.path.endswith("/chat/completions"):
+            if body.get("stream"):
+                self._stream()
+            else:
+                self._json(200, {"choices": [{"message": {"role": "assistant", "content": RESPUESTA}}]})
+        else:
+            self._json(404, {"error": "ruta desconocida"})
+
+    def _stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def enviar(data: str):
+            raw = data.encode("utf-8")
+            self.wfile.write(f"{len(raw):X}\r\n".encode() + raw + b"\r\n")
+            self.wfile.flush()
+
+        enviar(": OPENROUTER PROCESSING\n\n")
+        for i, palabra in enumerate(RESPUESTA.split(" ")):
+            token = palabra if i == 0 else " " + palabra
+            enviar(f"data: {json.dumps({'choices': [{'delta': {'content': token}}]})}\n\n")
+            time.sleep(self.config.token_ms / 1000)
+        enviar("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub local de OpenRouter/OpenAI para pruebas")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=100, help="Latencia base por petición")
+    parser.add_argument("--token-ms", type=float, default=20, help="Pausa entre tokens en streaming")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fracción de respuestas 429/503")
+    parser.add_argument("--dim", type=int, default=1536, help="Dimensión de los embeddings")
+    parser.add_argument("--verbose", action="store_true")
+    StubHandler.config = parser.parse_args()
+
+    server = ThreadingHTTPServer((StubHandler.config.host, StubHandler.config.port), StubHandler)
+    print(f"[STUB] Escuchando en http://{StubHandler.config.host}:{StubHandler.config.port}")
+    server.serve_forever()
@@ -0,0 +1,135 @@
+import io
+import pickle
+from typing import List, Optional
+import numpy as np
+from sqlalchemy import text
+from app.config.settings import settings
+from app.db.database import async_session
+from app.db.vector_types import EMBEDDING_DIM, PG_VECTOR_TYPE
+
+# Cambios de esquema que create_all no aplica sobre tablas existentes.
+# Todas las sentencias son idempotentes y se ejecutan en cada arranque.
+SCHEMA_MIGRATIONS = [
+    f"ALTER TABLE document ADD COLUMN IF NOT EXISTS embedding_pg {PG_VECTOR_TYPE}({EMBEDDING_DIM});",
+    "CREATE INDEX IF NOT EXISTS idx_session_user_session_created ON session (user_id, session_id, created_at);",
+]
+
+# (tabla, índice HNSW) de cada columna embedding_pg
+VECTOR_COLUMNS = [
+    ("document", "idx_document_embedding_pg"),
+    ("mcpdocument", "idx_mcpdocument_embedding_pg"),
+    ("mcpdocumentchunk", "idx_mcpdocumentchunk_embedding_pg"),
+    ("embeddingcacheentry", None),
+]
+
+BACKFILL_BATCH = 500
+
+
+async def run_schema_migrations():
+    async with async_session() as session:
+        for sql in SCHEMA_MIGRATIONS:
+            await session.execute(text(sql))
+        await session.commit()
+
+
+class _ListUnpickler(pickle.Unpickler):
+    # Los blobs legados son pickle de list[float]: no se permite cargar ninguna clase
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"Clase no permitida en embedding legado: {module}.{name}")
+
+
+def decode_legacy_embedding(blob: bytes) -> list:
+    """Blob de la columna `embedding` antigua: float32 crudo (document_service) o pickle de lista."""
+    if len(blob) == EMBEDDING_DIM * 4:
+        return np.frombuffer(blob, dtype=np.float32).tolist()
+    return [float(x) for x in _ListUnpickler(io.BytesIO(blob)).load()]
+
+
+async def _column_exists(session, table: str, column: str) -> bool:
+    result = await session.execute(text("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = :table AND column_name = :column
+    """), {"table": table, "column": column})
+    return result.first() is not None
+
+
+async def migrate_legacy_embeddings(drop_column: Optional[bool] = None):
+    """
+    Pasa los embeddings pickle/bytes de la columna `embedding` a `embedding_pg`
+    (solo filas que aún no lo tienen). La columna vieja se borra solo con
+    LEGACY_EMBEDDING_DROP_COLUMN y si no quedó ninguna fila sin migrar (blob ilegible
+    o dimensión distinta de EMBEDDING_DIM): esos vectores no se pueden recuperar después.
+    """
+    drop_column = settings.LEGACY_EMBEDDING_DROP_COLUMN if drop_column is None else drop_column
+    for table in ("document", "mcpdocument"):
+        async with async_session() as session:
+            if not await _column_exists(session, table, "embedding"):
+                continue
+
+            migrated = 0
+            omitidos: List[int] = []
+            last_id = 0
+            while True:
+                result = await session.execute(text(f"""
+                    SELECT id, embedding FROM {table}
+                    WHERE id > :last_id AND embedding IS NOT NULL AND embedding_pg IS NULL
+                    ORDER BY id
+                    LIMIT :batch
+                """), {"last_id": last_id, "batch": BACKFILL_BATCH})
+                rows = result.all()
+                if not rows:
+                    break
+
+                updates = []
+                for row_id, blob in rows:
+                    try:
+                        vector = decode_legacy_embedding(bytes(blob))
+                    except Exception as e:
+                        print(f"[MIGRACION] {table}#{row_id}: embedding ilegible ({e}), se omite")
+                        omitidos.append(row_id)
+                        continue
+                    if len(vector) != EMBEDDING_DIM:
+                        omitidos.append(row_id)
+                        continue
+                    updates.append({"id": row_id, "vector": f"[{', '.join(map(str, vector))}]"})
+                if updates:
+                    await session.execute(
+                        text(f"UPDATE {table} SET embedding_pg = CAST(:vector AS {PG_VECTOR_TYPE}) WHERE id = :id"),
+                        updates
+                    )
+                migrated += len(updates)
+                last_id = rows[-1][0]
+
+            if omitidos:
+                muestra = ", ".join(map(str, omitidos[:50])) + (" ..." if len(omitidos) > 50 else "")
+                print(f"[MIGRACION] {table}: {len(omitidos)} filas sin migrar (ilegibles o de otra dimensión), "
+                      f"se conserva la columna 'embedding'. ids: {muestra}")
+            elif drop_column:
+                await session.execute(text(f"ALTER TABLE {table} DROP COLUMN embedding"))
+                print(f"[MIGRACION] {table}: columna 'embedding' eliminada")
+            await session.commit()
+            if migrated:
+                print(f"[MIGRACION] {table}: {migrated} embeddings legados migrados")
+
+
+async def migrate_vector_storage():
+    """Convierte las columnas embedding_pg al tipo configurado (VECTOR_STORAGE) si difiere."""
+    target = f"{PG_VECTOR_TYPE}({EMBEDDING_DIM})"
+    async with async_session() as session:
+        for table, index_name in VECTOR_COLUMNS:
+            result = await session.execute(text("""
+                SELECT format_type(a.atttypid, a.atttypmod)
+                FROM pg_attribute a
+                WHERE a.attrelid = to_regclass(:table) AND a.attname = 'embedding_pg' AND NOT a.attisdropped
+            """), {"table": table})
+            current = result.scalar()
+            if current is None or current == target:
+                continue
+            # El opclass del índice depende del tipo: se borra y create_vector_indexes lo recrea
+            if index_name:
+                await session.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+            await session.execute(text(
+                f"ALTER TABLE {table} ALTER COLUMN embedding_pg TYPE {target} USING embedding_pg::{target}"
+            ))
+            print(f"[MIGRACION] {table}.embedding_pg: {current} → {target}")
+        await session.commit()
@@ -1,16 +1,16 @@
 from sqlmodel import SQLModel, Field
 from typing import Optional, List
 from datetime import datetime
-from sqlalchemy import Column
+from sqlalchemy import Column, Index, LargeBinary, text
 from sqlalchemy.dialects.postgresql import JSON
-from pgvector.sqlalchemy import Vector
+from app.db.vector_types import embedding_column
 
 
 class Document(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str
     content: str
-    embedding: Optional[bytes] = Field(default=None)
+    embedding_pg: Optional[List[float]] = Field(default=None, sa_column=embedding_column())
 
 class Session(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -20,14 +20,26 @@ class Session(SQLModel, table=True):
     reply: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+    # Historial de una sesión en orden: WHERE user_id = ? AND session_id = ? ORDER BY created_at
+    __table_args__ = (
+        Index("idx_session_user_session_created", "user_id", "session_id", "created_at"),
+    )
+
 class McpDocument(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     filename: str
     content: str
-    embedding: Optional[bytes] = Field(default=None)  # serializado con pickle o vector PgVector
     created_at: datetime = Field(default_factory=datetime.utcnow)
     path: Optional[str] = Field(default="root")
-    embedding_pg: Optional[List[float]] = Field(default=None, sa_column=Column(Vector(1536)))
+    embedding_pg: Optional[List[float]] = Field(default=None, sa_column=embedding_column())
+
+class McpDocumentChunk(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    document_id: int = Field(foreign_key="mcpdocument.id", index=True)
+    chunk_index: int
+    page: int  # página (1-based) donde empieza el fragmento
+    content: str
+    embedding_pg: Optional[List[float]] = Field(default=None, sa_column=embedding_column())
 
 class LatencyLog(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
@@ -44,3 +56,63 @@ class PotholeReport(SQLModel, table=True):
     prompt_original: str
     filename: Optional[str] = None
     etiquetas: Optional[List[str]] = Field(default=None, sa_column=Column(JSON))
+
+
+class ExtractedText(SQLModel, table=True):
+    # Clave: sha256 de los bytes + versión del extractor (ver file_processor.EXTRACTOR_VERSION)
+    cache_key: str = Field(primary_key=True)
+    content_hash: str = Field(index=True)
+    extractor_version: str
+    kind: str
+    text: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class EmbeddingCacheEntry(SQLModel, table=True):
+    # Clave: sha256 de (modelo, texto normalizado), ver embedding_cache.embedding_cache_key
+    cache_key: str = Field(primary_key=True)
+    model: str
+    embedding_pg: Optional[List[float]] = Field(default=None, sa_column=embedding_column())
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class LatencySnapshot(SQLModel, table=True):
+    # Percentiles de una ventana (window_s) calculados desde los histogramas en memoria
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str  # "endpoint" | "stage"
+    name: str = Field(index=True)
+    window_s: int
+    count: int
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p95: Optional[float] = None
+    p99: Optional[float] = None
+    max: Optional[float] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ExtractionJob(SQLModel, table=True):
+    # Cola durable de extracción/ingesta (ver app/services/job_queue.py): los workers toman
+    # trabajos con SELECT ... FOR UPDATE SKIP LOCKED, sin broker externo
+    id: str = Field(primary_key=True)
+    content_hash: str  # sha256 del archivo: el mismo archivo + acción + path es el mismo trabajo
+    action: str        # "extract" | "ingest"
+    filename: str
+    path: str = "root"
+    status: str = "pendiente"  # pendiente | procesando | completado | error
+    attempts: int = 0
+    payload: Optional[bytes] = Field(default=None, sa_column=Column(LargeBinary))  # se borra al completar
+    result: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    error: Optional[str] = None
+    worker_id: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    run_after: datetime = Field(default_factory=datetime.utcnow)
+    locked_until: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    __table_args__ = (
+        Index("uq_extractionjob_content", "content_hash", "action", "path", unique=True),
+        # Solo los trabajos vivos entran al índice que recorre la consulta de los workers
+        Index("idx_extractionjob_queue", "created_at", postgresql_where=text("status IN ('pendiente', 'procesando')")),
+    )
@@ -0,0 +1,32 @@
+import numpy as np
+from typing import Optional
+from sqlalchemy import Column
+from pgvector.sqlalchemy import Vector, HALFVEC
+from app.config.settings import settings
+
+EMBEDDING_DIM = 1536
+
+# Representación canónica de los embeddings: una sola columna pgvector por tabla.
+# "float32" → vector(1536) (6 KB por fila), "float16" → halfvec(1536) (3 KB por fila).
+PG_VECTOR_TYPE = "halfvec" if settings.VECTOR_STORAGE == "float16" else "vector"
+
+
+def embedding_column() -> Column:
+    # Cada tabla necesita su propio objeto Column
+    if PG_VECTOR_TYPE == "halfvec":
+        return Column(HALFVEC(EMBEDDING_DIM))
+    return Column(Vector(EMBEDDING_DIM))
+
+
+def read_vector(value) -> Optional[np.ndarray]:
+    """
+    Valor leído de la base → ndarray float32. pgvector ya entrega ndarray (se reutiliza
+    sin copiar si el dtype coincide); los blobs float32 crudos se leen con np.frombuffer.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return np.frombuffer(value, dtype=np.float32)
+    if hasattr(value, "to_numpy"):  # pgvector.HalfVector
+        value = value.to_numpy()
+    return np.asarray(value, dtype=np.float32)
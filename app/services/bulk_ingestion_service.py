@@ -0,0 +1,266 @@
+import asyncio
+import tarfile
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import insert
+from app.config.settings import settings
+from app.db.database import async_session
+from app.db.models import McpDocument, McpDocumentChunk
+from app.services.chunking import Chunk, PageChunker
+from app.services.embedding_service import generate_embeddings_async
+from app.services.file_processor import extract_pages_from_path, is_supported_file
+from app.services.response_cache import invalidate_response_cache
+from app.services.worker_pool import run_bulk, bulk_pool
+
+
+@dataclass
+class BulkIngestJob:
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "pendiente"  # pendiente | procesando | completado | error
+    total: int = 0
+    extracted: int = 0
+    stored: int = 0
+    failed: int = 0
+    skipped: int = 0  # sin texto extraíble: no se guardan
+    chunks: int = 0
+    errors: List[str] = field(default_factory=list)
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "extracted": self.extracted,
+            "stored": self.stored,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "chunks": self.chunks,
+            "errors": self.errors[-20:],
+            "elapsed_s": round(elapsed, 1),
+        }
+
+
+_jobs: Dict[str, BulkIngestJob] = {}
+
+# Compartido por todos los trabajos: con un semáforo por trabajo, dos ingestas simultáneas
+# llenaban de más la cola acotada del pool y los archivos fallaban con WorkerPoolSaturado
+_semaforo_pool = asyncio.Semaphore(bulk_pool.max_pendientes)
+
+
+def get_bulk_job(job_id: str) -> Optional[BulkIngestJob]:
+    return _jobs.get(job_id)
+
+
+def create_bulk_job() -> BulkIngestJob:
+    job = BulkIngestJob()
+    _jobs[job.id] = job
+    return job
+
+
+def resolve_ingest_directory(directory: str) -> Path:
+    """Solo se permite ingerir directorios dentro de INGEST_ROOT."""
+    root = Path(settings.INGEST_ROOT).resolve()
+    target = (root / directory).resolve()
+    if target != root and root not in target.parents:
+        raise ValueError(f"El directorio debe estar dentro de {settings.INGEST_ROOT}")
+    if not target.is_dir():
+        raise ValueError(f"No existe el directorio {directory}")
+    return target
+
+
+def list_ingest_files(directory: Path) -> List[Path]:
+    return sorted(p for p in directory.rglob("*") if p.is_file() and is_supported_file(p.name))
+
+
+async def _extraer(file_path: Path, job: BulkIngestJob) -> Tuple[Path, Optional[List[Tuple[int, str]]]]:
+    # El semáforo mantiene el pool de ingesta lleno sin pasarse de su cola
+    async with _semaforo_pool:
+        try:
+            pages = await run_bulk(extract_pages_from_path, str(file_path))
+            job.extracted += 1
+            return file_path, pages
+        except Exception as e:
+            job.failed += 1
+            job.errors.append(f"{file_path.name}: {e}")
+            print(f"[INGESTA MASIVA] Error extrayendo {file_path}: {e}")
+            return file_path, None
+
+
+async def _embeber(chunks: List[Chunk]) -> List[List[float]]:
+    lotes = [chunks[i:i + settings.INGEST_EMBED_BATCH] for i in range(0, len(chunks), settings.INGEST_EMBED_BATCH)]
+    semaforo = asyncio.Semaphore(settings.BULK_EMBED_CONCURRENCY)
+
+    async def _lote(lote: List[Chunk]) -> List[List[float]]:
+        async with semaforo:
+            return await generate_embeddings_async([c.text for c in lote])
+
+    resultados = await asyncio.gather(*[_lote(lote) for lote in lotes])
+    return [vector for resultado in resultados for vector in resultado]
+
+
+async def _guardar_grupo(grupo: List[Tuple[Path, List[Tuple[int, str]]]], base_dir: Path, path_prefix: str, job: BulkIngestJob):
+    """Fragmenta, embebe y guarda un grupo de documentos con inserciones multi-fila y un solo commit."""
+    documentos = []
+    todos_los_chunks: List[Chunk] = []
+    for file_path, pages in grupo:
+        chunker = PageChunker(settings.CHUNK_MAX_TOKENS, settings.CHUNK_OVERLAP_TOKENS)
+        chunks = []
+        for page, text in pages:
+            chunks.extend(chunker.feed(page, text))
+        chunks.extend(chunker.flush())
+        if not chunks:
+            # Sin texto no hay embedding: una fila vacía solo ensuciaría la búsqueda
+            job.skipped += 1
+            print(f"[INGESTA MASIVA] {file_path.name}: sin texto extraíble, no se guarda")
+            continue
+        relative_dir = file_path.parent.relative_to(base_dir).as_posix()
+        documentos.append({
+            "filename": file_path.name,
+            "path": path_prefix if relative_dir == "." else f"{path_prefix}/{relative_dir}",
+            "content": "".join(text for _, text in pages).strip(),
+            "chunks": chunks,
+        })
+        todos_los_chunks.extend(chunks)
+    if not documentos:
+        return
+
+    vectores = await _embeber(todos_los_chunks)
+
+    # Reparto de vectores por documento y embedding de documento como promedio normalizado
+    offset = 0
+    for doc in documentos:
+        n = len(doc["chunks"])
+        doc["vectores"] = vectores[offset:offset + n]
+        offset += n
+        promedio = np.asarray(doc["vectores"], dtype=np.float32).mean(axis=0)
+        doc["embedding_pg"] = (promedio / np.linalg.norm(promedio)).tolist()
+
+    async with async_session() as session:
+        result = await session.execute(
+            insert(McpDocument).returning(McpDocument.id),
+            [
+                {
+                    "filename": doc["filename"],
+                    "path": doc["path"],
+                    "content": doc["content"],
+                    "embedding_pg": doc["embedding_pg"],
+                }
+                for doc in documentos
+            ]
+        )
+        ids = result.scalars().all()
+
+        filas = [
+            {
+                "document_id": doc_id,
+                "chunk_index": chunk.index,
+                "page": chunk.page,
+                "content": chunk.text,
+                "embedding_pg": vector,
+            }
+            for doc_id, doc in zip(ids, documentos)
+            for chunk, vector in zip(doc["chunks"], doc["vectores"])
+        ]
+        if filas:
+            await session.execute(insert(McpDocumentChunk), filas)
+        await session.commit()
+    invalidate_response_cache(f"(ingesta masiva, {len(documentos)} documentos)")
+
+    job.stored += len(documentos)
+    job.chunks += len(filas)
+
+
+async def _guardar_grupo_seguro(grupo: List[Tuple[Path, List[Tuple[int, str]]]], base_dir: Path, path_prefix: str, job: BulkIngestJob):
+    """Un lote que falla (embeddings, inserción) cuenta sus archivos como fallidos y la ingesta sigue."""
+    try:
+        await _guardar_grupo(grupo, base_dir, path_prefix, job)
+    except Exception as e:
+        job.failed += len(grupo)
+        for file_path, _ in grupo:
+            job.errors.append(f"{file_path.name}: {e}")
+        print(f"[INGESTA MASIVA] Error guardando un grupo de {len(grupo)} documentos: {e}")
+
+
+async def ingest_directory(directory: Path, path_prefix: str = "root", job: Optional[BulkIngestJob] = None) -> BulkIngestJob:
+    """
+    Ingiere todos los PDF/imágenes de un directorio: extracción en paralelo en el pool
+    de ingesta, embeddings por lotes y un commit cada BULK_COMMIT_EVERY documentos.
+    """
+    job = job or create_bulk_job()
+    job.status = "procesando"
+    files = list_ingest_files(directory)
+    job.total = len(files)
+    print(f"[INGESTA MASIVA] {job.total} archivos en {directory}")
+
+    tareas = [asyncio.ensure_future(_extraer(f, job)) for f in files]
+    try:
+        grupo: List[Tuple[Path, List[Tuple[int, str]]]] = []
+        for terminada in asyncio.as_completed(tareas):
+            file_path, pages = await terminada
+            if pages is None:
+                continue
+            grupo.append((file_path, pages))
+            if len(grupo) >= settings.BULK_COMMIT_EVERY:
+                await _guardar_grupo_seguro(grupo, directory, path_prefix, job)
+                grupo = []
+        if grupo:
+            await _guardar_grupo_seguro(grupo, directory, path_prefix, job)
+        job.status = "completado"
+    except Exception as e:
+        job.status = "error"
+        job.errors.append(str(e))
+        print(f"[INGESTA MASIVA] Error: {e}")
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+        job.finished_at = time.time()
+
+    print(f"[INGESTA MASIVA] {job.stored}/{job.total} documentos, {job.chunks} fragmentos, {job.failed} fallidos")
+    return job
+
+
+def extract_tar_safely(tar_path: Path, destino: Path):
+    """
+    Extrae un .tar/.tar.gz descartando rutas absolutas, '..' y enlaces. Rechaza el archivo
+    (ValueError) si supera INGEST_TAR_MAX_MEMBERS entradas o INGEST_TAR_MAX_EXTRACTED_BYTES
+    descomprimidos, antes de escribir nada en disco.
+    """
+    with tarfile.open(tar_path, mode="r:*") as tar:
+        miembros = []
+        total_bytes = 0
+        # Se recorre en streaming: una bomba con millones de entradas se corta sin listarlas todas
+        for n, member in enumerate(tar, start=1):
+            if n > settings.INGEST_TAR_MAX_MEMBERS:
+                raise ValueError(f"El tar tiene más de {settings.INGEST_TAR_MAX_MEMBERS} entradas")
+            target = (destino / member.name).resolve()
+            if not member.isfile() or (destino.resolve() not in target.parents):
+                continue
+            total_bytes += member.size
+            if total_bytes > settings.INGEST_TAR_MAX_EXTRACTED_BYTES:
+                raise ValueError(f"El tar descomprimido excede {settings.INGEST_TAR_MAX_EXTRACTED_BYTES} bytes")
+            miembros.append(member)
+        # filter="data" existe desde Python 3.11.4 / 3.12
+        extra = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+        tar.extractall(destino, members=miembros, **extra)
+
+
+async def ingest_tar(tar_path: Path, path_prefix: str, job: BulkIngestJob) -> BulkIngestJob:
+    with tempfile.TemporaryDirectory(prefix="mcp_ingesta_") as tmp:
+        try:
+            await asyncio.to_thread(extract_tar_safely, tar_path, Path(tmp))
+        except Exception as e:
+            job.status = "error"
+            job.errors.append(f"Tar inválido: {e}")
+            job.finished_at = time.time()
+            return job
+        finally:
+            tar_path.unlink(missing_ok=True)
+        return await ingest_directory(Path(tmp), path_prefix, job)
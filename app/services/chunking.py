@@ -0,0 +1,58 @@
+import re
+from dataclasses import dataclass
+from typing import List
+
+_WORD_RE = re.compile(r"\S+")
+
+
+@dataclass
+class Chunk:
+    index: int
+    page: int
+    text: str
+
+
+class PageChunker:
+    """
+    Parte el texto en fragmentos de hasta `max_tokens` con `overlap` tokens
+    repetidos entre fragmentos consecutivos. Se alimenta página por página,
+    así no hace falta tener el documento completo en memoria.
+    Los tokens se aproximan por palabras separadas por espacios.
+    """
+
+    def __init__(self, max_tokens: int = 350, overlap: int = 50):
+        if overlap >= max_tokens:
+            raise ValueError("overlap debe ser menor que max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self._palabras: List[str] = []
+        self._paginas: List[int] = []  # página de origen de cada palabra pendiente
+        self._index = 0
+
+    def feed(self, page: int, text: str) -> List[Chunk]:
+        for word in _WORD_RE.findall(text):
+            self._palabras.append(word)
+            self._paginas.append(page)
+
+        listos = []
+        while len(self._palabras) >= self.max_tokens:
+            listos.append(self._emitir(self.max_tokens))
+            # Se conserva el solapamiento como inicio del siguiente fragmento
+            avance = self.max_tokens - self.overlap
+            del self._palabras[:avance]
+            del self._paginas[:avance]
+        return listos
+
+    def flush(self) -> List[Chunk]:
+        # Solo quedan palabras nuevas si hay más que el solapamiento ya emitido
+        if not self._palabras or (self._index > 0 and len(self._palabras) <= self.overlap):
+            return []
+        chunk = self._emitir(len(self._palabras))
+        self._palabras.clear()
+        self._paginas.clear()
+        return [chunk]
+
+    def _emitir(self, n: int) -> Chunk:
+        chunk = Chunk(index=self._index, page=self._paginas[0], text=" ".join(self._palabras[:n]))
+        self._index += 1
+        return chunk
@@ -0,0 +1,77 @@
+import hashlib
+import re
+import unicodedata
+from typing import Dict, List, Optional
+from sqlmodel import select
+from app.config.settings import settings
+from app.db.database import async_session
+from app.db.models import EmbeddingCacheEntry
+from app.db.vector_types import read_vector
+from app.services.lru_cache import LRUCache
+
+_memoria = LRUCache(maxsize=settings.EMBEDDING_CACHE_SIZE)
+
+
+def normalize_text(text: str) -> str:
+    # "Multa de  tránsito " y "multa de tránsito" comparten embedding
+    text = unicodedata.normalize("NFC", text).lower()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def embedding_cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+async def get_cached_embeddings(keys: List[str], persist: bool = True) -> Dict[str, List[float]]:
+    """Devuelve los embeddings encontrados (memoria y luego Postgres) para las claves dadas."""
+    found: Dict[str, List[float]] = {}
+    missing = []
+    for key in keys:
+        cached = _memoria.get(key)
+        if cached is not None:
+            found[key] = cached
+        else:
+            missing.append(key)
+
+    if not missing or not (persist and settings.EMBEDDING_CACHE_PERSIST):
+        return found
+
+    try:
+        async with async_session() as session:
+            result = await session.execute(
+                select(EmbeddingCacheEntry.cache_key, EmbeddingCacheEntry.embedding_pg)
+                .where(EmbeddingCacheEntry.cache_key.in_(missing))
+            )
+            rows = result.all()
+    except Exception as e:
+        print(f"[EMBEDDING_CACHE] Error leyendo cache persistente: {e}")
+        return found
+
+    for key, vector in rows:
+        vector = read_vector(vector).tolist()
+        _memoria.set(key, vector)
+        found[key] = vector
+    return found
+
+
+async def get_cached_embedding(key: str, persist: bool = True) -> Optional[List[float]]:
+    return (await get_cached_embeddings([key], persist=persist)).get(key)
+
+
+async def set_cached_embeddings(model: str, entries: Dict[str, List[float]], persist: bool = True):
+    for key, vector in entries.items():
+        _memoria.set(key, vector)
+    if not entries or not (persist and settings.EMBEDDING_CACHE_PERSIST):
+        return
+
+    try:
+        async with async_session() as session:
+            for key, vector in entries.items():
+                await session.merge(EmbeddingCacheEntry(cache_key=key, model=model, embedding_pg=vector))
+            await session.commit()
+    except Exception as e:
+        print(f"[EMBEDDING_CACHE] Error guardando cache persistente: {e}")
+
+
+def embedding_cache_stats() -> dict:
+    return _memoria.stats()
@@ -1,11 +1,16 @@
-import openai
-import os
+import asyncio
+import httpx
 import numpy as np
-from typing import List
+from typing import List, Optional, Set, Tuple
 from dotenv import load_dotenv
+from app.config.settings import settings
+from app.services.http_client import http_client
+from app.services.embedding_cache import embedding_cache_key, get_cached_embeddings, set_cached_embeddings
+from app.services.tracing import span
+from app.services.worker_pool import run_embedding
 
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+
 
 USE_FAKE_EMBEDDING = False  # Cambiá a True para simular sin usar tokens reales
 
@@ -15,17 +20,150 @@ def generate_fake_embedding(text: str, dim: int = 384) -> List[float]:
     rng = np.random.default_rng(seed)
     return rng.random(dim).tolist()
 
-def generate_real_embedding(text: str, model: str = "text-embedding-ada-002") -> List[float]:
-    response = openai.embeddings.create(
-        input=text,
-        model=model
+async def generate_real_embeddings_async(texts: List[str], model: str = settings.EMBEDDING_MODEL) -> List[List[float]]:
+    """Una sola llamada multi-input por el cliente HTTP compartido (pool, reintentos, hedging)."""
+    response = await http_client.request(
+        "openai.embeddings", "POST", f"{settings.OPENAI_BASE_URL}/embeddings",
+        json={"input": texts, "model": model},
+        headers={"Authorization": f"Bearer {settings.OPENAI_API_KEY}"},
     )
-    return response.data[0].embedding
+    ordered = sorted(response.json()["data"], key=lambda item: item["index"])
+    return [item["embedding"] for item in ordered]
 
-def generate_embedding(text: str) -> List[float]:
+async def _embed_remote(texts: List[str]) -> List[List[float]]:
     if USE_FAKE_EMBEDDING:
-        return generate_fake_embedding(text)
-    return generate_real_embedding(text)
+        return [generate_fake_embedding(text) for text in texts]
+    return await generate_real_embeddings_async(texts)
+
+
+def _rechazo_de_inputs(error: BaseException) -> bool:
+    """400/413/422: el proveedor rechazó la llamada entera por algún input (vacío, demasiado largo)."""
+    return isinstance(error, httpx.HTTPStatusError) and error.response.status_code in (400, 413, 422)
+
+
+class EmbeddingBatcher:
+    """
+    Junta las peticiones de embedding que llegan dentro de una ventana corta
+    (EMBEDDING_BATCH_WINDOW_MS) y las resuelve con una sola llamada multi-input.
+    Si el proveedor rechaza el lote por un input inválido, se reintenta cada texto por
+    separado: cada petición recibe solo su propio error, no el de otro usuario.
+    """
+
+    def __init__(self, window_ms: float, max_batch: int):
+        self.window_s = window_ms / 1000
+        self.max_batch = max_batch
+        self._pendientes: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Referencias a los lotes en vuelo: el event loop solo guarda referencias débiles a las tareas
+        self._en_vuelo: Set[asyncio.Future] = set()
+        self.batches = 0
+        self.textos = 0
+        self.lotes_divididos = 0
+
+    async def embed(self, text: str) -> List[float]:
+        if not text.strip():
+            # Un input vacío hace que el proveedor rechace el lote entero: no entra al lote
+            raise ValueError("No se puede generar el embedding de un texto vacío")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pendientes.append((text, future))
+
+        if len(self._pendientes) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_s, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pendientes = self._pendientes, []
+        if batch:
+            tarea = asyncio.ensure_future(self._procesar(batch))
+            self._en_vuelo.add(tarea)
+            tarea.add_done_callback(self._en_vuelo.discard)
+
+    async def _procesar(self, batch: List[Tuple[str, asyncio.Future]]):
+        textos = list(dict.fromkeys(text for text, _ in batch))  # sin duplicados, orden estable
+        self.batches += 1
+        self.textos += len(textos)
+        try:
+            por_texto = dict(zip(textos, await _embed_remote(textos)))
+        except Exception as e:
+            if len(textos) > 1 and _rechazo_de_inputs(e):
+                print(f"[EMBEDDINGS] Lote de {len(textos)} textos rechazado ({e}); se reintenta uno por uno")
+                self.lotes_divididos += 1
+                resultados = await asyncio.gather(*[_embed_remote([text]) for text in textos], return_exceptions=True)
+                por_texto = {text: r if isinstance(r, BaseException) else r[0] for text, r in zip(textos, resultados)}
+            else:
+                por_texto = {text: e for text in textos}
+
+        for text, future in batch:
+            if future.done():
+                continue
+            resultado = por_texto[text]
+            if isinstance(resultado, BaseException):
+                future.set_exception(resultado)
+            else:
+                future.set_result(resultado)
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "textos": self.textos, "lotes_divididos": self.lotes_divididos}
+
+
+_batcher = EmbeddingBatcher(settings.EMBEDDING_BATCH_WINDOW_MS, settings.EMBEDDING_BATCH_MAX)
+
+
+def _cache_model() -> str:
+    return "fake" if USE_FAKE_EMBEDDING else settings.EMBEDDING_MODEL
+
+
+async def generate_embedding_async(text: str) -> List[float]:
+    """
+    Versión para handlers async: cache (LRU + Postgres) y, si no está,
+    micro-batch hacia OpenAI por el cliente HTTP compartido.
+    """
+    model = _cache_model()
+    key = embedding_cache_key(model, text)
+    # Los vectores fake (384 dims) no caben en la columna persistente de 1536
+    persist = not USE_FAKE_EMBEDDING
+
+    with span("embedding", model=model) as sp:
+        cached = (await get_cached_embeddings([key], persist=persist)).get(key)
+        sp.set_attribute("cache_hit", cached is not None)
+        if cached is not None:
+            return cached
+
+        # Tope de pendientes (503) y plazo (504) por petición, no solo los del cliente HTTP
+        vector = await run_embedding(_batcher.embed(text))
+        await set_cached_embeddings(model, {key: vector}, persist=persist)
+        return vector
+
+
+async def generate_embeddings_async(texts: List[str]) -> List[List[float]]:
+    """Embeddings para varios textos: solo los que no están en cache van a OpenAI, en una llamada."""
+    model = _cache_model()
+    persist = not USE_FAKE_EMBEDDING
+    keys = [embedding_cache_key(model, text) for text in texts]
+    found = await get_cached_embeddings(keys, persist=persist)
+
+    faltantes = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in faltantes:
+            faltantes[key] = text
+
+    if faltantes:
+        vectores = await run_embedding(_embed_remote(list(faltantes.values())))
+        nuevos = dict(zip(faltantes.keys(), vectores))
+        await set_cached_embeddings(model, nuevos, persist=persist)
+        found.update(nuevos)
+
+    return [found[key] for key in keys]
+
+
+def embedding_batcher_stats() -> dict:
+    return _batcher.stats()
 
 def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
     a = np.array(vec1)
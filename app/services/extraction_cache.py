@@ -0,0 +1,69 @@
+import hashlib
+from typing import Optional
+from app.config.settings import settings
+from app.db.database import async_session
+from app.db.models import ExtractedText
+from app.services.lru_cache import LRUCache
+
+_memoria = LRUCache(maxsize=settings.EXTRACTION_CACHE_SIZE)
+
+
+def content_hash(raw_bytes: bytes) -> str:
+    return hashlib.sha256(raw_bytes).hexdigest()
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def cache_key(digest: str, extractor_version: str) -> str:
+    return f"{digest}:{extractor_version}"
+
+
+async def get_cached_text(key: str) -> Optional[str]:
+    """Busca primero en el LRU y luego en Postgres (promoviendo el resultado a memoria)."""
+    cached = _memoria.get(key)
+    if cached is not None:
+        return cached
+    if not settings.EXTRACTION_CACHE_PERSIST:
+        return None
+
+    try:
+        async with async_session() as session:
+            row = await session.get(ExtractedText, key)
+    except Exception as e:
+        print(f"[EXTRACTION_CACHE] Error leyendo cache persistente: {e}")
+        return None
+
+    if row is None:
+        return None
+    _memoria.set(key, row.text)
+    return row.text
+
+
+async def set_cached_text(key: str, digest: str, extractor_version: str, kind: str, text: str):
+    _memoria.set(key, text)
+    if not settings.EXTRACTION_CACHE_PERSIST:
+        return
+
+    try:
+        async with async_session() as session:
+            # merge → upsert por clave primaria (dos uploads idénticos concurrentes no fallan)
+            await session.merge(ExtractedText(
+                cache_key=key,
+                content_hash=digest,
+                extractor_version=extractor_version,
+                kind=kind,
+                text=text
+            ))
+            await session.commit()
+    except Exception as e:
+        print(f"[EXTRACTION_CACHE] Error guardando cache persistente: {e}")
+
+
+def extraction_cache_stats() -> dict:
+    return _memoria.stats()
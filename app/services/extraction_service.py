@@ -0,0 +1,64 @@
+import asyncio
+from typing import Dict, Optional
+from app.services.file_processor import FileSource, extract_image_text, file_kind, source_size, EXTRACTOR_VERSION
+from app.services.pdf_extraction import extract_pdf_text_async
+from app.services.extraction_cache import content_hash, file_hash, cache_key, get_cached_text, set_cached_text
+from app.services.worker_pool import run_cpu
+from app.services.tracing import span
+from app.services.upload_buffer import liberar_temporal, retener_temporal
+
+# Extracciones en curso por clave: dos peticiones con el mismo archivo comparten el mismo trabajo
+_en_curso: Dict[str, "asyncio.Future[Optional[str]]"] = {}
+
+
+async def _extraer_y_guardar(source: FileSource, digest: str, key: str, kind: str, scene: bool) -> Optional[str]:
+    if kind == "pdf":
+        # Por página: texto nativo + OCR en paralelo solo de las escaneadas
+        text, completo = await extract_pdf_text_async(source)
+    else:
+        text, completo = await run_cpu(extract_image_text, source, None, scene)
+    # No se cachea un PDF con páginas vencidas por el plazo (el próximo intento puede completarlo)
+    # ni una imagen que el pre-chequeo descartó (puede ser un falso negativo)
+    if text is not None and completo:
+        await set_cached_text(key, digest, EXTRACTOR_VERSION, kind, text)
+    return text
+
+
+async def extract_text_async(source: FileSource, filename: str, digest: Optional[str] = None,
+                             scene: bool = False) -> Optional[str]:
+    """
+    Extrae texto (PDF u OCR) en el pool de procesos sin bloquear el event loop.
+    `source` son los bytes o la ruta del archivo; `digest` (sha256) se puede pasar si ya se
+    calculó, p. ej. al recibir una subida en streaming. `scene=True` marca una foto de escena
+    (reporte de bache): se aplica el pre-chequeo "¿tiene texto?" y, si no lo tiene, se omite el OCR.
+    Resultado cacheado por sha256 de los bytes + versión del extractor.
+    """
+    kind = file_kind(filename)
+    if kind is None:
+        return None
+
+    with span(f"extract.{kind}", size_bytes=source_size(source)) as sp:
+        if digest is None:
+            digest = file_hash(source) if isinstance(source, str) else content_hash(source)
+        key = cache_key(digest, EXTRACTOR_VERSION)
+
+        cached = await get_cached_text(key)
+        if cached is not None:
+            print(f"[EXTRACTION] Cache hit para {filename} ({digest[:12]})")
+            sp.set_attribute("cache_hit", True)
+            return cached
+
+        sp.set_attribute("cache_hit", False)
+        # Una extracción con pre-chequeo no se comparte con una sin él: podría devolver "" a un documento
+        clave_curso = f"{key}:escena" if scene and kind == "image" else key
+        tarea = _en_curso.get(clave_curso)
+        if tarea is None:
+            tarea = asyncio.ensure_future(_extraer_y_guardar(source, digest, key, kind, scene))
+            _en_curso[clave_curso] = tarea
+            tarea.add_done_callback(lambda _: _en_curso.pop(clave_curso, None))
+            # La tarea sobrevive a la petición que la creó (shield): el temporal de la subida
+            # tiene que vivir lo mismo que ella, no lo que dura esa petición
+            if isinstance(source, str) and retener_temporal(source):
+                tarea.add_done_callback(lambda _: liberar_temporal(source))
+        # shield: si un cliente se desconecta no se cancela el trabajo que comparten otros
+        return await asyncio.shield(tarea)
@@ -1,20 +1,168 @@
-import fitz  # PDF
+import threading
 from PIL import Image
-import easyocr # Imagenes lectura OCR
 from io import BytesIO
 import numpy as np
+import os
+from typing import Iterator, List, Optional, Tuple, Union
+from app.config.settings import settings
+from app.services.image_preprocessing import preprocess_for_ocr
 
-reader = easyocr.Reader(['es', 'en'], gpu=False)
+# El lector OCR (EasyOCR + PyTorch + pesos) se carga en el primer uso, dentro del proceso
+# que hace OCR (los workers del pool), nunca al importar el módulo.
+_reader = None
+_reader_lock = threading.Lock()
 
-def extract_text_from_pdf_bytes(pdf_bytes: bytes) -> str:
-    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        return text.strip()
 
-def extract_text_from_image_bytes(image_bytes: bytes) -> str:
-    image = Image.open(BytesIO(image_bytes))
-    image_np = np.array(image)  # 👈 Convertimos PIL → numpy.ndarray
-    result = reader.readtext(image_np)
-    return "\n".join([item[1] for item in result])
+def get_reader():
+    global _reader
+    if _reader is None:
+        with _reader_lock:
+            if _reader is None:
+                import easyocr  # Imagenes lectura OCR
+                langs = [lang.strip() for lang in settings.OCR_LANGS.split(",") if lang.strip()]
+                _reader = easyocr.Reader(langs, gpu=False)
+    return _reader
+
+
+def ocr_loaded() -> bool:
+    return _reader is not None
+
+
+def warm_up_ocr() -> bool:
+    """Carga el lector en el proceso actual (se llama en los workers del pool)."""
+    get_reader()
+    return True
+
+# Origen de un archivo: bytes en memoria o la ruta de un archivo en disco (p. ej. una subida
+# volcada a un temporal). Con una ruta, a los workers del pool solo viaja el nombre, no los bytes.
+FileSource = Union[bytes, str]
+
+def source_size(source: FileSource) -> int:
+    return os.path.getsize(source) if isinstance(source, str) else len(source)
+
+def _abrir_pdf(source: FileSource):
+    # PyMuPDF se importa al primer PDF (en los workers del pool), no al arrancar el servidor
+    import fitz
+    if isinstance(source, str):
+        return fitz.open(source)
+    return fitz.open(stream=source, filetype="pdf")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tiff")
+
+# Subir cuando cambie la forma de extraer texto: invalida el cache de extracción
+EXTRACTOR_VERSION = "3"  # 2: preprocesado de imágenes; 3: OCR de páginas escaneadas en PDF
+
+# Lado máximo del render de una página escaneada (planos/A0 a PDF_OCR_DPI serían enormes)
+_PDF_MAX_LADO_PX = 4000
+
+def _texto_nativo_util(text: str) -> bool:
+    """La capa de texto cuenta si tiene suficientes caracteres (un sello o folio no alcanza)."""
+    return len("".join(text.split())) >= settings.PDF_MIN_NATIVE_CHARS
+
+def _paginas_a_procesar(doc, max_pages: Optional[int]) -> int:
+    max_pages = settings.PDF_MAX_PAGES if max_pages is None else max_pages
+    return min(doc.page_count, max_pages) if max_pages else doc.page_count
+
+def _ocr_pagina(page, dpi: int) -> str:
+    lado = max(page.rect.width, page.rect.height) / 72 * dpi
+    if lado > _PDF_MAX_LADO_PX:
+        dpi = int(dpi * _PDF_MAX_LADO_PX / lado)
+    import fitz
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    # Render en gris directo a numpy (una fila mide `stride` bytes)
+    image_np = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    result = get_reader().readtext(image_np)
+    return "\n".join([item[1] for item in result]) + "\n"
+
+def plan_pdf_pages(source: FileSource, max_pages: Optional[int] = None) -> Tuple[int, List[Tuple[int, Optional[str]]]]:
+    """
+    Pasada rápida por la capa de texto: (total de páginas, [(número 1-based, texto o None)]).
+    None marca una página escaneada que necesita OCR. Solo se miran las primeras PDF_MAX_PAGES.
+    """
+    with _abrir_pdf(source) as doc:
+        plan = []
+        for i in range(_paginas_a_procesar(doc, max_pages)):
+            text = doc[i].get_text()
+            plan.append((i + 1, text if _texto_nativo_util(text) else None))
+        return doc.page_count, plan
+
+def ocr_pdf_page(source: FileSource, page_number: int, dpi: Optional[int] = None) -> str:
+    """OCR de una sola página (para repartir las páginas escaneadas entre los workers del pool)."""
+    with _abrir_pdf(source) as doc:
+        return _ocr_pagina(doc[page_number - 1], dpi or settings.PDF_OCR_DPI)
+
+def iter_pdf_pages(source: FileSource, max_pages: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Recorre las páginas una a una (número 1-based, texto) sin armar el documento completo.
+    Híbrido y secuencial: texto nativo si lo hay, OCR solo en las páginas escaneadas.
+    """
+    with _abrir_pdf(source) as doc:
+        for i in range(_paginas_a_procesar(doc, max_pages)):
+            page = doc[i]
+            text = page.get_text()
+            if not _texto_nativo_util(text):
+                try:
+                    text = _ocr_pagina(page, settings.PDF_OCR_DPI)
+                except Exception as e:
+                    print(f"[PDF] Falló el OCR de la página {i + 1}: {e}")
+            yield i + 1, text
+
+def extract_pdf_pages(source: FileSource) -> List[Tuple[int, str]]:
+    # Versión serializable para el pool de procesos
+    return list(iter_pdf_pages(source))
+
+def extract_text_from_pdf_bytes(source: FileSource) -> str:
+    return "".join(text for _, text in iter_pdf_pages(source)).strip()
+
+def extract_image_text(source: FileSource, preprocess: Optional[bool] = None, precheck: bool = False) -> Tuple[str, bool]:
+    """
+    OCR de una imagen. Devuelve (texto, completo): completo=False si el pre-chequeo la tomó por
+    foto de escena y se omitió el OCR, para que ese "" no quede en la caché de extracción.
+    """
+    preprocess = settings.OCR_PREPROCESS if preprocess is None else preprocess
+    if not preprocess:
+        image = Image.open(source if isinstance(source, str) else BytesIO(source))
+        image_np = np.array(image)  # 👈 Convertimos PIL → numpy.ndarray
+        result = get_reader().readtext(image_np)
+        return "\n".join([item[1] for item in result]), True
+
+    prep = preprocess_for_ocr(source, precheck=precheck and settings.OCR_TEXT_PRECHECK)
+    if not prep.has_text:
+        # Foto de escena (p. ej. un bache): no vale la pena pagar el OCR completo
+        print(f"[OCR] Sin texto aparente (separabilidad={prep.separability}, filas={prep.text_rows}), se omite OCR")
+        return "", False
+    result = get_reader().readtext(prep.image)
+    return "\n".join([item[1] for item in result]), True
+
+def extract_text_from_image_bytes(source: FileSource, preprocess: Optional[bool] = None) -> str:
+    return extract_image_text(source, preprocess)[0]
+
+def is_supported_file(filename: str) -> bool:
+    lowered = filename.lower()
+    return lowered.endswith(".pdf") or lowered.endswith(IMAGE_EXTENSIONS)
+
+def file_kind(filename: str) -> Optional[str]:
+    lowered = filename.lower()
+    if lowered.endswith(".pdf"):
+        return "pdf"
+    if lowered.endswith(IMAGE_EXTENSIONS):
+        return "image"
+    return None
+
+def extract_pages_from_path(file_path: str) -> List[Tuple[int, str]]:
+    """Extrae el archivo dentro del worker: solo viaja la ruta, no los bytes."""
+    kind = file_kind(file_path)
+    if kind == "pdf":
+        return extract_pdf_pages(file_path)
+    if kind == "image":
+        return [(1, extract_text_from_image_bytes(file_path))]
+    raise ValueError(f"Formato no soportado: {file_path}")
+
+def extract_text_from_file_bytes(source: FileSource, filename: str) -> Optional[str]:
+    """Elige el extractor según la extensión. Devuelve None si el formato no es soportado."""
+    lowered = filename.lower()
+    if lowered.endswith(".pdf"):
+        return extract_text_from_pdf_bytes(source)
+    if lowered.endswith(IMAGE_EXTENSIONS):
+        return extract_text_from_image_bytes(source)
+    return None
@@ -0,0 +1,126 @@
+import math
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class LogHistogram:
+    """
+    Histograma log-lineal al estilo HDR: cada bucket cubre un rango relativo de
+    `precision` (1% por defecto), así los percentiles tienen error relativo acotado
+    sin guardar muestras. Dos histogramas con la misma precisión se combinan sumando buckets.
+    """
+
+    def __init__(self, precision: float = 0.01):
+        self.precision = precision
+        self._log_base = math.log1p(precision)
+        self.buckets: Dict[int, int] = defaultdict(int)
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def _index(self, value: float) -> int:
+        # Los valores <= 0 (o menores a 1 µs) caen en un bucket común
+        if value <= 0.001:
+            return -10**6
+        return int(math.floor(math.log(value) / self._log_base))
+
+    def _bucket_value(self, index: int) -> float:
+        if index == -10**6:
+            return 0.0
+        # Punto medio geométrico del bucket
+        return math.exp((index + 0.5) * self._log_base)
+
+    def record(self, value: float):
+        self.buckets[self._index(value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "LogHistogram") -> "LogHistogram":
+        if other.precision != self.precision:
+            raise ValueError("Solo se pueden combinar histogramas con la misma precisión")
+        for index, n in other.buckets.items():
+            self.buckets[index] += n
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        acumulado = 0
+        for index in sorted(self.buckets):
+            acumulado += self.buckets[index]
+            if acumulado >= rank:
+                # Nunca reportar fuera del rango observado
+                return min(max(self._bucket_value(index), self.min), self.max)
+        return self.max
+
+    def cumulative_counts(self, bounds: Iterable[float]) -> List[Tuple[float, int]]:
+        """Conteos acumulados para los límites dados (formato de buckets de Prometheus)."""
+        ordenados = sorted(self.buckets.items())
+        resultado = []
+        i = 0
+        acumulado = 0
+        for bound in bounds:
+            while i < len(ordenados) and self._bucket_value(ordenados[i][0]) <= bound:
+                acumulado += ordenados[i][1]
+                i += 1
+            resultado.append((bound, acumulado))
+        return resultado
+
+    def summary(self) -> dict:
+        def r(v):
+            return round(v, 2) if v is not None else None
+        return {
+            "p50": r(self.quantile(0.50)),
+            "p90": r(self.quantile(0.90)),
+            "p95": r(self.quantile(0.95)),
+            "p99": r(self.quantile(0.99)),
+            "max": r(self.max),
+            "count": self.count,
+        }
+
+
+class RollingHistogram:
+    """
+    Ventana deslizante de histogramas por intervalo (`slot_s` segundos, `slots` intervalos).
+    También acumula un histograma total desde el arranque para exponer contadores a Prometheus.
+    """
+
+    def __init__(self, slot_s: int = 60, slots: int = 60, precision: float = 0.01):
+        self.slot_s = slot_s
+        self.slots = slots
+        self.precision = precision
+        self._ring: Dict[int, LogHistogram] = {}
+        self.total = LogHistogram(precision)
+
+    def _slot(self, now: Optional[float] = None) -> int:
+        return int((time.time() if now is None else now) // self.slot_s)
+
+    def record(self, value: float, now: Optional[float] = None):
+        slot = self._slot(now)
+        hist = self._ring.get(slot)
+        if hist is None:
+            hist = self._ring[slot] = LogHistogram(self.precision)
+            # Descartar intervalos que ya salieron de la ventana
+            for viejo in [s for s in self._ring if s <= slot - self.slots]:
+                del self._ring[viejo]
+        hist.record(value)
+        self.total.record(value)
+
+    def window(self, seconds: float, now: Optional[float] = None) -> LogHistogram:
+        current = self._slot(now)
+        desde = current - max(1, math.ceil(seconds / self.slot_s)) + 1
+        merged = LogHistogram(self.precision)
+        for slot, hist in self._ring.items():
+            if desde <= slot <= current:
+                merged.merge(hist)
+        return merged
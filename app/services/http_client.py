@@ -0,0 +1,220 @@
+import asyncio
+import importlib.util
+import random
+import time
+from typing import AsyncIterator, Optional
+
+import httpx
+
+from app.config.settings import settings
+from app.services.metrics_service import latency_quantile, registrar_latencia
+
+# Respuestas que vale la pena reintentar: rate limit y errores del lado del proveedor
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def is_retryable_transport_error(error: BaseException) -> bool:
+    """Errores de red reintentables. Los locales (cabecera inválida, URL mal formada) fallarían igual."""
+    return (isinstance(error, httpx.TransportError)
+            and not isinstance(error, (httpx.LocalProtocolError, httpx.UnsupportedProtocol)))
+
+
+class ModelHttpClient:
+    """
+    Cliente HTTP único para los proveedores de modelos (OpenRouter, embeddings de OpenAI).
+
+    - Un solo httpx.AsyncClient con pool de conexiones, keep-alive y HTTP/2 (si `h2` está instalado).
+    - Concurrencia acotada con un semáforo (HTTP_CONCURRENCY peticiones en vuelo).
+    - Reintentos con backoff exponencial y jitter completo en 429/5xx y errores de transporte,
+      respetando Retry-After cuando el proveedor lo manda.
+    - Hedging opcional: si la petición tarda más que el percentil reciente de esa serie, se
+      lanza una segunda y gana la primera que responda.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaforo = asyncio.Semaphore(settings.HTTP_CONCURRENCY)
+        self.en_vuelo = 0
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            http2 = settings.HTTP_HTTP2 and importlib.util.find_spec("h2") is not None
+            self._client = httpx.AsyncClient(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=settings.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_S,
+                ),
+                timeout=httpx.Timeout(settings.HTTP_TIMEOUT_S, connect=settings.HTTP_CONNECT_TIMEOUT_S),
+            )
+            print(f"[HTTP] Cliente compartido creado (http2={http2})")
+        return self._client
+
+    @staticmethod
+    def _backoff(intento: int, response: Optional[httpx.Response] = None) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return min(float(retry_after), settings.HTTP_BACKOFF_MAX_S)
+                except ValueError:
+                    pass
+        # Jitter completo: evita que todos los clientes reintenten al mismo tiempo
+        tope = min(settings.HTTP_BACKOFF_MAX_S, settings.HTTP_BACKOFF_BASE_S * (2 ** intento))
+        return random.uniform(0, tope)
+
+    async def _send(self, method: str, url: str, retries: Optional[int] = None, **kwargs) -> httpx.Response:
+        client = self._get_client()
+        retries = settings.HTTP_RETRIES if retries is None else retries
+        for intento in range(retries + 1):
+            ultimo = intento == retries
+            async with self._semaforo:
+                self.en_vuelo += 1
+                self.requests += 1
+                try:
+                    response = await client.request(method, url, **kwargs)
+                except httpx.TransportError as e:
+                    if ultimo or not is_retryable_transport_error(e):
+                        self.errors += 1
+                        raise
+                    print(f"[HTTP] Error de transporte ({e.__class__.__name__}), reintento {intento + 1}")
+                    espera = self._backoff(intento)
+                    response = None
+                finally:
+                    self.en_vuelo -= 1
+
+            if response is not None:
+                if response.status_code not in RETRY_STATUS or ultimo:
+                    if response.is_error:
+                        self.errors += 1
+                    response.raise_for_status()
+                    return response
+                print(f"[HTTP] {response.status_code} desde {url}, reintento {intento + 1}")
+                espera = self._backoff(intento, response)
+
+            self.retries += 1
+            await asyncio.sleep(espera)
+
+    def _hedge_delay_s(self, name: str) -> Optional[float]:
+        p = latency_quantile(name, settings.HTTP_HEDGE_PERCENTILE, kind="upstream")
+        if p is None:
+            return None  # sin historia suficiente no se especula
+        return max(p, settings.HTTP_HEDGE_MIN_DELAY_MS) / 1000
+
+    async def _send_hedged(self, delay_s: float, method: str, url: str, **kwargs) -> httpx.Response:
+        primera = asyncio.create_task(self._send(method, url, **kwargs))
+        done, _ = await asyncio.wait({primera}, timeout=delay_s)
+        if done:
+            return primera.result()
+
+        self.hedges += 1
+        segunda = asyncio.create_task(self._send(method, url, **kwargs))
+        pendientes = {primera, segunda}
+        error = None
+        try:
+            while pendientes:
+                done, pendientes = await asyncio.wait(pendientes, return_when=asyncio.FIRST_COMPLETED)
+                for tarea in done:
+                    if tarea.exception() is None:
+                        if tarea is segunda:
+                            self.hedge_wins += 1
+                        return tarea.result()
+                    error = tarea.exception()
+            raise error
+        finally:
+            for tarea in (primera, segunda):
+                if not tarea.done():
+                    tarea.cancel()
+
+    async def request(self, name: str, method: str, url: str, hedge: Optional[bool] = None, **kwargs) -> httpx.Response:
+        """
+        Petición con reintentos (y hedging si se pide). `name` identifica la serie de latencia
+        (p. ej. "openrouter.chat") usada para el percentil del hedging y para /metrics.
+        Solo se debe hacer hedging de peticiones idempotentes o baratas de duplicar.
+        `retries` (kwarg opcional) reemplaza HTTP_RETRIES, p. ej. para pasar rápido a otro modelo.
+        """
+        hedge = settings.HTTP_HEDGE_ENABLED if hedge is None else hedge
+        delay_s = self._hedge_delay_s(name) if hedge else None
+
+        start = time.perf_counter()
+        if delay_s is None:
+            response = await self._send(method, url, **kwargs)
+        else:
+            response = await self._send_hedged(delay_s, method, url, **kwargs)
+        registrar_latencia(name, (time.perf_counter() - start) * 1000, kind="upstream")
+        return response
+
+    async def stream_lines(self, name: str, method: str, url: str, retries: Optional[int] = None, **kwargs) -> AsyncIterator[str]:
+        """
+        Respuesta en streaming línea por línea. Solo se reintenta antes de recibir la primera
+        línea: una vez que se emitió algo al cliente, un error se propaga.
+        """
+        client = self._get_client()
+        retries = settings.HTTP_RETRIES if retries is None else retries
+        emitido = False
+        for intento in range(retries + 1):
+            ultimo = intento == retries
+            start = time.perf_counter()
+            async with self._semaforo:
+                self.en_vuelo += 1
+                self.requests += 1
+                try:
+                    async with client.stream(method, url, **kwargs) as response:
+                        if response.status_code in RETRY_STATUS and not ultimo:
+                            print(f"[HTTP] {response.status_code} desde {url} (stream), reintento {intento + 1}")
+                            espera = self._backoff(intento, response)
+                        else:
+                            if response.is_error:
+                                self.errors += 1
+                                await response.aread()
+                                response.raise_for_status()
+                            async for line in response.aiter_lines():
+                                if not emitido:
+                                    emitido = True
+                                    registrar_latencia(f"{name}.ttfb", (time.perf_counter() - start) * 1000, kind="upstream")
+                                yield line
+                            return
+                except httpx.TransportError as e:
+                    if ultimo or emitido or not is_retryable_transport_error(e):
+                        self.errors += 1
+                        raise
+                    print(f"[HTTP] Error de transporte en stream ({e.__class__.__name__}), reintento {intento + 1}")
+                    espera = self._backoff(intento)
+                finally:
+                    self.en_vuelo -= 1
+
+            self.retries += 1
+            await asyncio.sleep(espera)
+
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "en_vuelo": self.en_vuelo,
+            "concurrencia_max": settings.HTTP_CONCURRENCY,
+            "requests": self.requests,
+            "retries": self.retries,
+            "errors": self.errors,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+
+http_client = ModelHttpClient()
+
+
+async def close_http_client():
+    await http_client.close()
+
+
+def http_client_stats() -> dict:
+    return http_client.stats()
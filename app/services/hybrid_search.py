@@ -0,0 +1,121 @@
+import asyncio
+import re
+from typing import Dict, List, Optional
+from sqlalchemy import text
+from app.config.settings import settings
+from app.db.database import async_session
+from app.services.embedding_service import generate_embedding_async
+from app.services.vector_search import buscar_fragmentos
+from app.services.tracing import span
+
+SEARCH_MODES = ("hybrid", "lexical", "vector")
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+# Referencias exactas: "artículo 12", "art. 5", "decreto 57-92", códigos con dígitos, frases entre comillas
+_EXACT_RE = re.compile(r"(art[íi]culo|art\.|decreto|acuerdo|inciso|numeral)\s*\d+|\d+[-/]\d+|\"[^\"]+\"", re.IGNORECASE)
+
+
+def build_tsquery(query: str) -> str:
+    """
+    Términos unidos con OR para to_tsquery('spanish', ...). Solo caracteres de palabra,
+    así que no hay sintaxis de tsquery que escapar. ts_rank_cd premia a quien tenga más términos.
+    """
+    terms = [t for t in _TERM_RE.findall(query.lower()) if len(t) >= 3 or t.isdigit()]
+    return " | ".join(dict.fromkeys(terms))
+
+
+def is_keyword_query(query: str) -> bool:
+    """Consultas que la búsqueda léxica resuelve sola: referencias exactas o pocas palabras clave."""
+    if _EXACT_RE.search(query):
+        return True
+    words = _TERM_RE.findall(query)
+    return 0 < len(words) <= 3 and "?" not in query
+
+
+async def buscar_lexico(query: str, limit: int) -> List[dict]:
+    tsquery = build_tsquery(query)
+    if not tsquery:
+        return []
+
+    sql_chunks = text("""
+        SELECT c.id AS chunk_id, d.id AS document_id, d.filename, d.path, d.created_at, c.page, c.content,
+        ts_rank_cd(c.content_tsv, q) AS rank
+        FROM mcpdocumentchunk c
+        JOIN mcpdocument d ON d.id = c.document_id,
+        to_tsquery('spanish', :tsquery) q
+        WHERE c.content_tsv @@ q
+        ORDER BY rank DESC
+        LIMIT :limit
+    """)
+    sql_legacy = text("""
+        SELECT NULL AS chunk_id, d.id AS document_id, d.filename, d.path, d.created_at, NULL AS page, d.content,
+        ts_rank_cd(d.content_tsv, q) AS rank
+        FROM mcpdocument d, to_tsquery('spanish', :tsquery) q
+        WHERE d.content_tsv @@ q
+          AND NOT EXISTS (SELECT 1 FROM mcpdocumentchunk c WHERE c.document_id = d.id)
+        ORDER BY rank DESC
+        LIMIT :limit
+    """)
+
+    params = {"tsquery": tsquery, "limit": limit}
+    with span("db.lexical_search"):
+        async with async_session() as session:
+            rows = [dict(r) for r in (await session.execute(sql_chunks, params)).mappings().all()]
+            rows += [dict(r) for r in (await session.execute(sql_legacy, params)).mappings().all()]
+
+    rows.sort(key=lambda r: r["rank"], reverse=True)
+    return rows[:limit]
+
+
+async def buscar_vectorial(query: str, limit: int) -> List[dict]:
+    query_embedding = await generate_embedding_async(query)
+    return await buscar_fragmentos(query_embedding, top_k=limit)
+
+
+def _result_key(row: dict) -> str:
+    return f"c{row['chunk_id']}" if row["chunk_id"] is not None else f"d{row['document_id']}"
+
+
+def reciprocal_rank_fusion(rankings: Dict[str, List[dict]], k: int) -> List[dict]:
+    """score = Σ 1 / (k + posición) sobre cada lista en la que aparece el resultado."""
+    fused: Dict[str, dict] = {}
+    for source, rows in rankings.items():
+        for position, row in enumerate(rows, start=1):
+            key = _result_key(row)
+            entry = fused.setdefault(key, {**row, "score": 0.0, "matched_by": []})
+            entry["score"] += 1.0 / (k + position)
+            entry["matched_by"].append(source)
+    return sorted(fused.values(), key=lambda r: r["score"], reverse=True)
+
+
+async def buscar_hibrido(query: str, top_k: int = 4, mode: Optional[str] = None) -> List[dict]:
+    """
+    Búsqueda en el repositorio MCP. mode: "hybrid" (por defecto), "lexical" o "vector".
+    En modo híbrido, si la consulta parece de palabras clave y la búsqueda léxica ya
+    encuentra resultados, se evita la llamada de embedding.
+    """
+    mode = mode or "hybrid"
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"mode debe ser uno de {', '.join(SEARCH_MODES)}")
+    candidates = max(top_k, settings.HYBRID_CANDIDATES)
+
+    if mode == "lexical":
+        rows = await buscar_lexico(query, top_k)
+        return reciprocal_rank_fusion({"lexical": rows}, settings.HYBRID_RRF_K)[:top_k]
+    if mode == "vector":
+        rows = await buscar_vectorial(query, top_k)
+        return reciprocal_rank_fusion({"vector": rows}, settings.HYBRID_RRF_K)[:top_k]
+
+    if settings.HYBRID_LEXICAL_FASTPATH and is_keyword_query(query):
+        lexical = await buscar_lexico(query, candidates)
+        if lexical:
+            print("[HYBRID] Ruta rápida léxica, sin embedding")
+            return reciprocal_rank_fusion({"lexical": lexical}, settings.HYBRID_RRF_K)[:top_k]
+        vector = await buscar_vectorial(query, candidates)
+        return reciprocal_rank_fusion({"vector": vector}, settings.HYBRID_RRF_K)[:top_k]
+
+    lexical, vector = await asyncio.gather(
+        buscar_lexico(query, candidates),
+        buscar_vectorial(query, candidates),
+    )
+    return reciprocal_rank_fusion({"lexical": lexical, "vector": vector}, settings.HYBRID_RRF_K)[:top_k]
@@ -0,0 +1,160 @@
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from app.config.settings import settings
+
+# Lado máximo de la miniatura usada para las estadísticas (pre-chequeo y deskew): barata y suficiente
+_THUMB_SIDE = 400
+# Transiciones claro/oscuro por fila a partir de las cuales la fila "parece" una línea de texto
+_MIN_TRANSICIONES_FILA = 6
+# Umbrales del pre-chequeo, medidos con `bench_ocr_preprocess --precheck-only` sobre tests/files_to_test
+# (imágenes, fotos simuladas y páginas de PDF rasterizadas). Texto: primer plano 0.002-0.053 y
+# filas con trazos 0.010-0.307 (entre líneas siempre hay filas limpias). bache.jpg: primer plano
+# ≈0.33 y filas ≈0.89-0.97 (la textura cruza todas las filas).
+_PRIMER_PLANO = (0.001, 0.25)
+_FILAS_TEXTO = (0.005, 0.6)
+
+
+@dataclass
+class PreprocessedImage:
+    image: np.ndarray               # escala de grises uint8, lista para reader.readtext
+    has_text: bool
+    original_size: Tuple[int, int]
+    size: Tuple[int, int]
+    separability: float             # separabilidad de Otsu (0..1): texto sobre fondo liso ≈ alta
+    text_rows: float                # fracción de filas con muchas transiciones claro/oscuro
+    foreground: float               # fracción de píxeles de primer plano (trazo)
+    skew_deg: float = 0.0
+    steps: List[str] = field(default_factory=list)
+
+
+def _otsu(gray: np.ndarray) -> Tuple[int, float]:
+    """Umbral de Otsu y separabilidad η = varianza entre clases / varianza total."""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    prob = hist / max(hist.sum(), 1.0)
+    niveles = np.arange(256, dtype=np.float64)
+    omega = np.cumsum(prob)
+    mu = np.cumsum(prob * niveles)
+    mu_t = mu[-1]
+    denom = omega * (1.0 - omega)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma_b = np.where(denom > 0, (mu_t * omega - mu) ** 2 / denom, 0.0)
+    umbral = int(np.argmax(sigma_b))
+    var_total = float((prob * (niveles - mu_t) ** 2).sum())
+    return umbral, float(sigma_b[umbral] / var_total) if var_total > 0 else 0.0
+
+
+def _cargar_gris(source: Union[bytes, str], max_side: int) -> Tuple[Image.Image, Tuple[int, int], List[str]]:
+    image = Image.open(source if isinstance(source, str) else BytesIO(source))
+    original_size = image.size
+    steps = []
+
+    # JPEG: el decodificador reduce por potencias de 2 (y a gris) sin decodificar los 12 MP completos
+    if image.format == "JPEG" and max(original_size) > max_side:
+        image.draft("L", (max_side, max_side))
+        steps.append("draft")
+
+    # Fotos de teléfono: la orientación real viene en EXIF (exif_transpose copia siempre: solo si hace falta)
+    if image.getexif().get(0x0112, 1) != 1:
+        image = ImageOps.exif_transpose(image)
+        steps.append("exif")
+
+    # Transparencias (RGBA/LA/paleta) sobre blanco: el fondo transparente suele ser negro al convertir
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        fondo = Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(fondo, rgba)
+        steps.append("alpha")
+    if image.mode != "L":
+        image = image.convert("L")
+        steps.append("gray")
+
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        steps.append(f"resize:{max_side}")
+    return image, original_size, steps
+
+
+def _binaria(gray: Image.Image, umbral: int) -> Tuple[np.ndarray, bool]:
+    """Máscara con el primer plano (clase minoritaria) en True, y si el fondo es claro."""
+    mascara = np.asarray(gray) <= umbral
+    fondo_claro = mascara.mean() <= 0.5
+    return (mascara if fondo_claro else ~mascara), fondo_claro
+
+
+def _estimar_inclinacion(mascara: np.ndarray, max_deg: float, paso: float = 0.5) -> float:
+    """
+    Ángulo (grados, sentido de PIL.rotate) que deja las líneas horizontales: el que maximiza
+    los saltos del perfil de proyección por filas.
+    """
+    binaria = Image.fromarray(mascara.astype(np.uint8) * 255)
+    mejor_angulo, mejor_score = 0.0, -1.0
+    for angulo in np.arange(-max_deg, max_deg + paso / 2, paso):
+        rotada = np.asarray(binaria.rotate(float(angulo), resample=Image.NEAREST, fillcolor=0), dtype=np.float32)
+        perfil = rotada.sum(axis=1)
+        score = float(np.square(np.diff(perfil)).sum())
+        if score > mejor_score:
+            mejor_angulo, mejor_score = float(angulo), score
+    return mejor_angulo
+
+
+def preprocess_for_ocr(source: Union[bytes, str], max_side: Optional[int] = None, deskew: Optional[bool] = None,
+                       binarize: Optional[bool] = None, precheck: bool = False) -> PreprocessedImage:
+    """
+    Prepara una imagen para EasyOCR: orientación EXIF, escala de grises, reducción a `max_side`
+    y, opcionalmente, enderezado y binarización (Otsu). Calcula además un pre-chequeo barato de
+    si la imagen tiene texto (solo con `precheck`). `source` son los bytes o la ruta del archivo.
+    Los parámetros en None toman el valor de settings (el benchmark los pasa explícitos para
+    comparar variantes).
+    """
+    max_side = settings.OCR_MAX_SIDE if max_side is None else max_side
+    deskew = settings.OCR_DESKEW if deskew is None else deskew
+    binarize = settings.OCR_BINARIZE if binarize is None else binarize
+
+    gray, original_size, steps = _cargar_gris(source, max_side)
+
+    # Estadísticas sobre una miniatura: cuestan poco aunque la imagen sea grande
+    thumb = gray.copy()
+    thumb.thumbnail((_THUMB_SIDE, _THUMB_SIDE), Image.BILINEAR)
+    umbral, separability = _otsu(np.asarray(thumb))
+    mascara, fondo_claro = _binaria(thumb, umbral)
+    transiciones = np.count_nonzero(mascara[:, 1:] != mascara[:, :-1], axis=1)
+    text_rows = float((transiciones >= _MIN_TRANSICIONES_FILA).mean()) if len(transiciones) else 0.0
+    primer_plano = float(mascara.mean())
+
+    has_text = True
+    if precheck:
+        # Texto: fondo liso bien separado del trazo, poco primer plano y algunas filas con muchos
+        # trazos, pero no todas (una foto con textura, como un bache, tiene transiciones en cada fila)
+        has_text = (separability >= settings.OCR_TEXT_MIN_SEPARABILITY
+                    and _PRIMER_PLANO[0] <= primer_plano <= _PRIMER_PLANO[1]
+                    and _FILAS_TEXTO[0] <= text_rows <= _FILAS_TEXTO[1])
+        steps.append("precheck")
+
+    skew = 0.0
+    if has_text and deskew:
+        skew = _estimar_inclinacion(mascara, settings.OCR_DESKEW_MAX_DEG)
+        if abs(skew) >= 0.5:
+            gray = gray.rotate(skew, resample=Image.BICUBIC, expand=True, fillcolor=255 if fondo_claro else 0)
+            steps.append(f"deskew:{skew:+.1f}")
+
+    if has_text and binarize:
+        umbral_full, _ = _otsu(np.asarray(gray))
+        gray = gray.point(lambda p: 255 if p > umbral_full else 0)
+        steps.append("binarize")
+
+    return PreprocessedImage(
+        image=np.asarray(gray),
+        has_text=has_text,
+        original_size=original_size,
+        size=gray.size,
+        separability=round(separability, 3),
+        text_rows=round(text_rows, 3),
+        foreground=round(primer_plano, 3),
+        skew_deg=skew,
+        steps=steps,
+    )
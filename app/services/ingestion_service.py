@@ -0,0 +1,88 @@
+from typing import AsyncIterator, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import insert
+from app.config.settings import settings
+from app.db.database import async_session
+from app.db.models import McpDocument, McpDocumentChunk
+from app.services.chunking import Chunk, PageChunker
+from app.services.embedding_service import generate_embeddings_async
+from app.services.extraction_service import extract_text_async
+from app.services.file_processor import FileSource, file_kind
+from app.services.pdf_extraction import iter_pdf_pages_hybrid
+from app.services.response_cache import invalidate_response_cache
+
+
+async def iter_document_pages(source: FileSource, filename: str, digest: Optional[str] = None) -> AsyncIterator[Tuple[int, str]]:
+    """Páginas (número, texto) del archivo. Una imagen es un documento de una sola página."""
+    kind = file_kind(filename)
+    if kind == "pdf":
+        # Las páginas llegan a medida que están listas: el chunker y los embeddings no esperan al OCR
+        async for page in iter_pdf_pages_hybrid(source):
+            yield page.number, page.text
+    elif kind == "image":
+        yield 1, await extract_text_async(source, filename, digest) or ""
+    else:
+        raise ValueError(f"Formato no soportado: {filename}")
+
+
+async def iter_chunk_batches(pages: AsyncIterator[Tuple[int, str]], page_texts: List[str]) -> AsyncIterator[List[Chunk]]:
+    """Convierte el flujo de páginas en lotes de fragmentos listos para embeber."""
+    chunker = PageChunker(settings.CHUNK_MAX_TOKENS, settings.CHUNK_OVERLAP_TOKENS)
+    lote: List[Chunk] = []
+    async for page, text in pages:
+        page_texts.append(text)
+        lote.extend(chunker.feed(page, text))
+        while len(lote) >= settings.INGEST_EMBED_BATCH:
+            yield lote[:settings.INGEST_EMBED_BATCH]
+            lote = lote[settings.INGEST_EMBED_BATCH:]
+    lote.extend(chunker.flush())
+    if lote:
+        yield lote
+
+
+async def ingest_document(filename: str, source: FileSource, path: str = "root", digest: Optional[str] = None) -> dict:
+    """
+    Ingesta en streaming: páginas → fragmentos solapados → embeddings por lotes →
+    inserción multi-fila en mcpdocumentchunk, todo en una sola transacción.
+    """
+    page_texts: List[str] = []
+    suma = None
+    total_chunks = 0
+
+    async with async_session() as session:
+        doc = McpDocument(filename=filename, content="", path=path)
+        session.add(doc)
+        await session.flush()  # para obtener doc.id
+
+        async for lote in iter_chunk_batches(iter_document_pages(source, filename, digest), page_texts):
+            vectores = await generate_embeddings_async([c.text for c in lote])
+            await session.execute(insert(McpDocumentChunk), [
+                {
+                    "document_id": doc.id,
+                    "chunk_index": chunk.index,
+                    "page": chunk.page,
+                    "content": chunk.text,
+                    "embedding_pg": vector,
+                }
+                for chunk, vector in zip(lote, vectores)
+            ])
+            lote_np = np.asarray(vectores, dtype=np.float32)
+            suma = lote_np.sum(axis=0) if suma is None else suma + lote_np.sum(axis=0)
+            total_chunks += len(lote)
+
+        if total_chunks == 0:
+            # Sin texto (escaneo ilegible, foto sin texto): no se guarda una fila vacía y sin embedding
+            await session.rollback()
+            print(f"[INGESTA] {filename}: sin texto extraíble, no se guarda")
+            return {"document_id": None, "filename": filename, "pages": len(page_texts), "chunks": 0,
+                    "text": "", "skipped": "sin texto"}
+
+        # Embedding a nivel documento: promedio normalizado de sus fragmentos
+        doc.content = "".join(page_texts).strip()
+        promedio = suma / np.linalg.norm(suma)
+        doc.embedding_pg = promedio.tolist()
+        await session.commit()
+    invalidate_response_cache(f"(ingesta de {filename})")
+
+    print(f"[INGESTA] {filename}: {len(page_texts)} páginas, {total_chunks} fragmentos")
+    return {"document_id": doc.id, "filename": filename, "pages": len(page_texts), "chunks": total_chunks, "text": doc.content}
@@ -0,0 +1,351 @@
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import defer
+from sqlmodel import select
+
+from app.config.settings import settings
+from app.db.database import async_session
+from app.db.models import ExtractionJob
+from app.services.extraction_service import extract_text_async
+from app.services.ingestion_service import ingest_document
+from app.services.response_cache import invalidate_response_cache
+from app.services.tracing import start_trace
+from app.services.upload_buffer import SpooledUpload
+
+ACCIONES = ("extract", "ingest")
+
+# Despierta a los workers de este proceso al encolar; los de otros procesos se enteran por sondeo
+_nuevo_trabajo = asyncio.Event()
+
+# Toma el trabajo más antiguo disponible: pendiente (y ya sin espera de reintento) o con la
+# concesión vencida (su worker murió). SKIP LOCKED hace que varios workers no se pisen.
+_CLAIM_SQL = text("""
+    UPDATE extractionjob
+    SET status = 'procesando',
+        attempts = attempts + 1,
+        worker_id = :worker_id,
+        started_at = timezone('utc', now()),
+        locked_until = timezone('utc', now()) + make_interval(secs => :lease_s)
+    WHERE id = (
+        SELECT id FROM extractionjob
+        WHERE (status = 'pendiente' AND run_after <= timezone('utc', now()))
+           OR (status = 'procesando' AND locked_until < timezone('utc', now()))
+        ORDER BY created_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, action, filename, path, content_hash, attempts
+""")
+
+
+def job_to_dict(job: ExtractionJob) -> dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "action": job.action,
+        "filename": job.filename,
+        "path": job.path,
+        "sha256": job.content_hash,
+        "attempts": job.attempts,
+        "error": job.error,
+        "result": job.result,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def _leer_payload(upload: SpooledUpload) -> bytes:
+    source = upload.source()
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read()
+    return source
+
+
+async def _buscar(session, content_hash: str, action: str, path: str) -> Optional[ExtractionJob]:
+    stmt = (
+        select(ExtractionJob)
+        .options(defer(ExtractionJob.payload))
+        .where(ExtractionJob.content_hash == content_hash, ExtractionJob.action == action, ExtractionJob.path == path)
+    )
+    return (await session.execute(stmt)).scalar_one_or_none()
+
+
+async def enqueue_job(upload: SpooledUpload, action: str, path: str = "root") -> Tuple[dict, bool]:
+    """
+    Encola la subida y devuelve (trabajo, creado). Idempotente por (sha256, action, path): reenviar
+    el mismo archivo devuelve el trabajo existente en vez de repetir OCR y embeddings. Un trabajo
+    que terminó en error se reinicia al reenviarlo.
+    """
+    if action not in ACCIONES:
+        raise ValueError(f"action debe ser uno de {ACCIONES}")
+
+    async with async_session() as session:
+        existente = await _buscar(session, upload.digest, action, path)
+        if existente is not None:
+            if existente.status == "error":
+                await session.execute(
+                    update(ExtractionJob)
+                    .where(ExtractionJob.id == existente.id, ExtractionJob.status == "error")
+                    .values(status="pendiente", attempts=0, error=None, worker_id=None,
+                            run_after=datetime.utcnow(), finished_at=None,
+                            payload=_leer_payload(upload))
+                )
+                await session.commit()
+                _nuevo_trabajo.set()
+                session.expire_all()
+                existente = await _buscar(session, upload.digest, action, path)
+            return job_to_dict(existente), False
+
+        ahora = datetime.utcnow()
+        stmt = (
+            pg_insert(ExtractionJob)
+            .values(
+                id=uuid.uuid4().hex,
+                content_hash=upload.digest,
+                action=action,
+                filename=upload.filename,
+                path=path,
+                status="pendiente",
+                attempts=0,
+                payload=_leer_payload(upload),
+                created_at=ahora,
+                run_after=ahora,
+            )
+            .on_conflict_do_nothing(index_elements=["content_hash", "action", "path"])
+            .returning(ExtractionJob.id)
+        )
+        job_id = (await session.execute(stmt)).scalar_one_or_none()
+        await session.commit()
+
+        # None: otra petición encoló el mismo archivo entre la búsqueda y el insert
+        job = await _buscar(session, upload.digest, action, path)
+
+    if job_id is not None:
+        _nuevo_trabajo.set()
+        print(f"[JOBS] Encolado {job_id} ({action} de {upload.filename}, {upload.size} bytes)")
+    return job_to_dict(job), job_id is not None
+
+
+async def get_job(job_id: str) -> Optional[dict]:
+    async with async_session() as session:
+        stmt = select(ExtractionJob).options(defer(ExtractionJob.payload)).where(ExtractionJob.id == job_id)
+        job = (await session.execute(stmt)).scalar_one_or_none()
+    return job_to_dict(job) if job is not None else None
+
+
+async def claim_job(worker_id: str):
+    async with async_session() as session:
+        row = (await session.execute(_CLAIM_SQL, {
+            "worker_id": worker_id,
+            "lease_s": float(settings.JOB_LEASE_S),
+        })).first()
+        await session.commit()
+    return row
+
+
+async def _actualizar(job_id: str, worker_id: str, **values) -> bool:
+    """UPDATE solo si el trabajo sigue siendo de este worker (si perdió la concesión, no pisa a otro)."""
+    async with async_session() as session:
+        result = await session.execute(
+            update(ExtractionJob)
+            .where(ExtractionJob.id == job_id, ExtractionJob.worker_id == worker_id)
+            .values(**values)
+        )
+        await session.commit()
+    return result.rowcount > 0
+
+
+async def _cargar_payload(job_id: str) -> Optional[bytes]:
+    async with async_session() as session:
+        return (await session.execute(
+            select(ExtractionJob.payload).where(ExtractionJob.id == job_id)
+        )).scalar_one_or_none()
+
+
+async def _renovar_concesion(job_id: str, worker_id: str):
+    intervalo = max(1.0, settings.JOB_LEASE_S / 3)
+    while True:
+        await asyncio.sleep(intervalo)
+        try:
+            await _actualizar(job_id, worker_id,
+                              locked_until=datetime.utcnow() + timedelta(seconds=settings.JOB_LEASE_S))
+        except Exception as e:
+            print(f"[JOBS] No se pudo renovar la concesión de {job_id}: {e}")
+
+
+async def _ejecutar(job, upload: SpooledUpload) -> dict:
+    if job.action == "extract":
+        texto = await extract_text_async(upload.source(), job.filename, upload.digest)
+        if texto is None:
+            raise ValueError(f"Formato no soportado: {job.filename}")
+        return {"filename": job.filename, "size_bytes": upload.size, "text": texto}
+
+    result = await ingest_document(job.filename, upload.source(), job.path, upload.digest)
+    return {
+        "filename": job.filename,
+        "document_id": result["document_id"],
+        "pages": result["pages"],
+        "chunks": result["chunks"],
+        "text": result["text"][:300],
+    }
+
+
+async def process_job(job, worker_id: str) -> bool:
+    """Procesa un trabajo ya tomado por `claim_job`. Devuelve si terminó bien."""
+    if job.attempts > settings.JOB_MAX_ATTEMPTS:
+        # Se le venció la concesión una y otra vez: el worker muere con este archivo (OOM, segfault)
+        await _actualizar(job.id, worker_id, status="error", finished_at=datetime.utcnow(), locked_until=None,
+                          error="Se agotaron los intentos (el worker se cayó procesándolo)")
+        print(f"[JOBS] {job.id} descartado tras {job.attempts - 1} intentos")
+        return False
+
+    heartbeat = asyncio.create_task(_renovar_concesion(job.id, worker_id))
+    try:
+        payload = await _cargar_payload(job.id)
+        if payload is None:
+            raise ValueError("El trabajo no tiene el archivo guardado")
+        # Se vuelca igual que una subida: los archivos grandes van a un temporal y el pool los abre por ruta
+        with SpooledUpload(job.filename, max_bytes=len(payload)) as upload:
+            upload.write(payload)
+            upload.finish()
+            del payload
+            with start_trace(f"job.{job.action}", job_id=job.id, attempt=job.attempts):
+                result = await _ejecutar(job, upload)
+
+        await _actualizar(job.id, worker_id, status="completado", result=result, payload=None,
+                          error=None, locked_until=None, finished_at=datetime.utcnow())
+        print(f"[JOBS] {job.id} completado ({job.action} de {job.filename})")
+        return True
+    except asyncio.CancelledError:
+        # Apagado ordenado: el trabajo vuelve a la cola sin gastar el intento
+        try:
+            await _actualizar(job.id, worker_id, status="pendiente", attempts=ExtractionJob.attempts - 1,
+                              worker_id=None, locked_until=None)
+        except Exception:
+            pass  # si no se pudo, lo recupera otro worker al vencer la concesión
+        raise
+    except Exception as e:
+        error = f"{e.__class__.__name__}: {e}"[:2000]
+        if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+            await _actualizar(job.id, worker_id, status="error", error=error,
+                              locked_until=None, finished_at=datetime.utcnow())
+            print(f"[JOBS] {job.id} falló definitivamente tras {job.attempts} intentos: {error}")
+        else:
+            espera = settings.JOB_RETRY_DELAY_S * job.attempts
+            await _actualizar(job.id, worker_id, status="pendiente", error=error, locked_until=None,
+                              run_after=datetime.utcnow() + timedelta(seconds=espera))
+            print(f"[JOBS] {job.id} falló (intento {job.attempts}), se reintenta en {espera}s: {error}")
+        return False
+    finally:
+        heartbeat.cancel()
+
+
+class JobWorkers:
+    """Workers de la cola en este proceso (la web o app/cli/job_worker.py)."""
+
+    def __init__(self):
+        self._tasks: List[asyncio.Task] = []
+        self.processed = 0
+        self.failed = 0
+
+    def start(self, n: int):
+        base = f"{socket.gethostname()}:{os.getpid()}"
+        for i in range(len(self._tasks), len(self._tasks) + n):
+            self._tasks.append(asyncio.create_task(self._run(f"{base}:{i}")))
+        print(f"[JOBS] {n} workers de extracción iniciados ({base})")
+
+    async def _run(self, worker_id: str):
+        while True:
+            try:
+                job = await claim_job(worker_id)
+            except Exception as e:
+                print(f"[JOBS] Error tomando trabajo: {e}")
+                job = None
+
+            if job is None:
+                _nuevo_trabajo.clear()
+                try:
+                    await asyncio.wait_for(_nuevo_trabajo.wait(), settings.JOB_POLL_INTERVAL_S)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                ok = await process_job(job, worker_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Falló hasta el UPDATE de estado: la concesión vencida lo devuelve a la cola
+                print(f"[JOBS] Error registrando el resultado de {job.id}: {e}")
+                ok = False
+            if ok:
+                self.processed += 1
+            else:
+                self.failed += 1
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {"local_workers": len(self._tasks), "processed": self.processed, "failed": self.failed}
+
+
+job_workers = JobWorkers()
+
+
+def start_job_workers(n: int):
+    if n > 0:
+        job_workers.start(n)
+
+
+async def stop_job_workers():
+    await job_workers.stop()
+
+
+async def watch_completed_ingests():
+    """
+    El cache de respuestas es de cada proceso: si la ingesta la hizo app/cli/job_worker.py, la web
+    no se entera. Este bucle (en la web) lo invalida cuando aparece una ingesta completada nueva.
+    """
+    ultima = None
+    while True:
+        try:
+            async with async_session() as session:
+                fin = (await session.execute(
+                    select(func.max(ExtractionJob.finished_at))
+                    .where(ExtractionJob.action == "ingest", ExtractionJob.status == "completado")
+                )).scalar_one_or_none()
+            if ultima is not None and fin is not None and fin > ultima:
+                invalidate_response_cache("(ingesta desde la cola de trabajos)")
+            ultima = fin or ultima or datetime.min
+        except Exception as e:
+            print(f"[JOBS] Error revisando ingestas completadas: {e}")
+        await asyncio.sleep(settings.JOB_POLL_INTERVAL_S * 5)
+
+
+async def job_queue_stats() -> dict:
+    async with async_session() as session:
+        rows = (await session.execute(
+            select(ExtractionJob.status, func.count()).group_by(ExtractionJob.status)
+        )).all()
+        vencidos = (await session.execute(
+            select(func.count()).where(ExtractionJob.status == "procesando",
+                                       ExtractionJob.locked_until < datetime.utcnow())
+        )).scalar_one()
+    return {
+        "by_status": {status: count for status, count in rows},
+        "expired_leases": vencidos,
+        **job_workers.stats(),
+    }
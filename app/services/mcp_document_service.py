@@ -1,14 +1,11 @@
-import pickle
 from app.db.models import McpDocument
 from app.db.database import async_session
+from app.services.response_cache import invalidate_response_cache
 
 async def save_mcp_document(filename: str, content: str, embedding: list[float], path: str = "root"):
-    pickled = pickle.dumps(embedding)
-
     new_doc = McpDocument(
         filename=filename,
         content=content,
-        embedding=pickled,
         embedding_pg=embedding,
         path=path
     )
@@ -16,3 +13,5 @@ async def save_mcp_document(filename: str, content: str, embedding: list[float],
     async with async_session() as session:
         session.add(new_doc)
         await session.commit()
+    invalidate_response_cache(f"(documento {filename})")
+
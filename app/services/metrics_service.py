@@ -1,43 +1,117 @@
-from app.db.database import async_session
-from app.db.models import LatencyLog
-from statistics import median, quantiles
-from typing import Literal
-from datetime import timedelta, datetime
-from sqlalchemy import text
+import asyncio
+import math
+from app.config.settings import settings
+from app.db.models import LatencySnapshot
+from app.services.histogram import RollingHistogram
+from typing import Dict, List, Literal, Optional, Tuple
+from datetime import datetime
 
-async def log_latency(endpoint: str, duration_ms: float):
-    async with async_session() as session:
-        entry = LatencyLog(endpoint=endpoint, duration_ms=duration_ms)
-        session.add(entry)
-        await session.commit()
-
-
-async def obtener_metricas_latencia(endpoint: Literal["/chat", "/chat-stream"], ultimos_minutos: int = 60):
-    async with async_session() as session:
-        desde = datetime.utcnow() - timedelta(minutes=ultimos_minutos)
-        result = await session.execute(
-            text("""
-                SELECT duration_ms
-                FROM latencylog
-                WHERE endpoint = :endpoint
-                  AND timestamp >= :desde
-                ORDER BY timestamp DESC
-                LIMIT 100
-            """),
-            {"endpoint": endpoint, "desde": desde}
+# Histogramas en memoria por (tipo, nombre): tipo "endpoint" o "stage" (etapa del pipeline).
+# Postgres solo recibe instantáneas periódicas (tabla latencysnapshot).
+_histogramas: Dict[Tuple[str, str], RollingHistogram] = {}
+
+# Límites de buckets (ms) para la exposición Prometheus
+PROMETHEUS_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, math.inf]
+
+
+def _histograma(kind: str, name: str) -> RollingHistogram:
+    hist = _histogramas.get((kind, name))
+    if hist is None:
+        hist = _histogramas[(kind, name)] = RollingHistogram(
+            slot_s=settings.LATENCY_SLOT_S,
+            slots=settings.LATENCY_WINDOW_SLOTS,
         )
-        duraciones = [r[0] for r in result.fetchall()]
+    return hist
+
+
+def registrar_latencia(name: str, duration_ms: float, kind: str = "endpoint"):
+    _histograma(kind, name).record(duration_ms)
+
+
+async def log_latency(endpoint: str, duration_ms: float):
+    registrar_latencia(endpoint, duration_ms, kind="endpoint")
+
+
+def log_stage_latency(stage: str, duration_ms: float):
+    registrar_latencia(stage, duration_ms, kind="stage")
+
+
+def latency_quantile(name: str, q: float, kind: str = "stage", seconds: int = 300, min_count: int = 20) -> Optional[float]:
+    """Cuantil reciente de una serie; None si todavía no hay suficientes muestras."""
+    hist = _histogramas.get((kind, name))
+    if hist is None:
+        return None
+    window = hist.window(seconds)
+    if window.count < min_count:
+        return None
+    return window.quantile(q)
+
+
+async def obtener_metricas_latencia(endpoint: Literal["/chat", "/chat-stream"], ultimos_minutos: int = 60, kind: str = "endpoint"):
+    hist = _histogramas.get((kind, endpoint))
+    if hist is None:
+        return {"p50": None, "p90": None, "p95": None, "p99": None, "max": None, "count": 0}
+    return hist.window(ultimos_minutos * 60).summary()
+
+
+def listar_metricas(ultimos_minutos: int = 5) -> List[dict]:
+    return [
+        {"kind": kind, "name": name, **hist.window(ultimos_minutos * 60).summary()}
+        for (kind, name), hist in sorted(_histogramas.items())
+    ]
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(gauges: Optional[Dict[str, float]] = None) -> str:
+    """Formato de exposición de texto de Prometheus (histograma acumulado + cuantiles de 5 min)."""
+    lines = [
+        "# HELP momostenango_latency_ms Latencia por endpoint o etapa del pipeline en milisegundos.",
+        "# TYPE momostenango_latency_ms histogram",
+    ]
+    for (kind, name), hist in sorted(_histogramas.items()):
+        labels = f'kind="{kind}",name="{_escape_label(name)}"'
+        for bound, acumulado in hist.total.cumulative_counts(PROMETHEUS_BUCKETS_MS):
+            le = "+Inf" if bound == math.inf else str(bound)
+            lines.append(f'momostenango_latency_ms_bucket{{{labels},le="{le}"}} {acumulado}')
+        lines.append(f"momostenango_latency_ms_sum{{{labels}}} {hist.total.sum}")
+        lines.append(f"momostenango_latency_ms_count{{{labels}}} {hist.total.count}")
+
+    lines.append("# HELP momostenango_latency_5m_ms Cuantiles de latencia en los últimos 5 minutos.")
+    lines.append("# TYPE momostenango_latency_5m_ms gauge")
+    for (kind, name), hist in sorted(_histogramas.items()):
+        window = hist.window(300)
+        for q in (0.5, 0.9, 0.95, 0.99):
+            value = window.quantile(q)
+            if value is not None:
+                lines.append(f'momostenango_latency_5m_ms{{kind="{kind}",name="{_escape_label(name)}",quantile="{q}"}} {value}')
+
+    for metric, value in (gauges or {}).items():
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot_rows(window_s: int) -> List[dict]:
+    now = datetime.utcnow()
+    rows = []
+    for (kind, name), hist in _histogramas.items():
+        summary = hist.window(window_s).summary()
+        if summary["count"] == 0:
+            continue
+        rows.append({"kind": kind, "name": name, "window_s": window_s, "created_at": now, **summary})
+    return rows
 
-    if not duraciones:
-        return {"p50": None, "p90": None, "p95": None, "count": 0}
 
-    p50 = median(duraciones)
-    p90 = quantiles(duraciones, n=100)[89]
-    p95 = quantiles(duraciones, n=100)[94]
+async def run_snapshot_loop():
+    """Guarda cada LATENCY_SNAPSHOT_INTERVAL_S los percentiles del último intervalo."""
+    # Import diferido: write_behind registra sus propios tiempos en este módulo
+    from app.services.write_behind import write_behind
 
-    return {
-        "p50": round(p50, 2),
-        "p90": round(p90, 2),
-        "p95": round(p95, 2),
-        "count": len(duraciones)
-    }
+    interval = settings.LATENCY_SNAPSHOT_INTERVAL_S
+    while True:
+        await asyncio.sleep(interval)
+        for row in snapshot_rows(interval):
+            write_behind.enqueue(LatencySnapshot, row)
@@ -0,0 +1,43 @@
+import asyncio
+import time
+from app.config.settings import settings
+from app.services.file_processor import warm_up_ocr
+from app.services.worker_pool import run_cpu, WorkerPoolSaturado, WorkerTimeout
+
+# Estado del OCR visto desde el proceso del servidor (el lector vive en los workers del pool).
+# "lazy": sin precarga, se carga con la primera imagen; "cold" → "warming" → "warm" | "error" con OCR_WARMUP.
+_estado = {
+    "status": "cold" if settings.OCR_WARMUP else "lazy",
+    "workers": settings.OCR_WORKERS,
+    "workers_warm": 0,
+    "elapsed_s": None,
+    "error": None,
+}
+
+
+async def warm_up_ocr_pool():
+    """Levanta los workers del pool de OCR con el lector cargado (en segundo plano desde on_start)."""
+    _estado["status"] = "warming"
+    start = time.perf_counter()
+    # Un trabajo por worker: mientras el primero carga, los siguientes obligan a crear más procesos
+    resultados = await asyncio.gather(
+        *[run_cpu(warm_up_ocr, timeout=settings.OCR_WARMUP_TIMEOUT_S) for _ in range(settings.OCR_WORKERS)],
+        return_exceptions=True,
+    )
+    errores = [r for r in resultados if isinstance(r, BaseException)]
+    _estado["workers_warm"] = sum(1 for r in resultados if r is True)
+    _estado["elapsed_s"] = round(time.perf_counter() - start, 2)
+    if errores and not _estado["workers_warm"]:
+        _estado["status"] = "error"
+        _estado["error"] = str(errores[0])
+        print(f"[OCR] Falló la precarga del lector: {errores[0]}")
+    else:
+        _estado["status"] = "warm"
+        if errores and not isinstance(errores[0], (WorkerPoolSaturado, WorkerTimeout)):
+            _estado["error"] = str(errores[0])
+        print(f"[OCR] Lector OCR listo en {_estado['workers_warm']} workers ({_estado['elapsed_s']}s)")
+
+
+def ocr_readiness() -> dict:
+    # Sin precarga el servidor está listo desde el arranque; con precarga, cuando el OCR está caliente
+    return {**_estado, "ready": _estado["status"] in ("lazy", "warm")}
@@ -1,25 +1,68 @@
-import os
-import httpx
+import json
+from typing import AsyncIterator, List, Optional
+from app.config.settings import settings
+from app.services.http_client import http_client
 
-API_KEY = os.getenv("OPENROUTER_API_KEY")
-BASE_URL = "https://openrouter.ai/api/v1/chat/completions"
-MODEL = "mistral/mistral-7b-instruct:free"
 
-async def llamar_modelo(prompt: str) -> str:
-    payload = {
-        "model": MODEL,
-        "messages": [
-            {"role": "user", "content": prompt}
-        ]
-    }
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
+class OpenRouterStreamError(RuntimeError):
+    """Error del proveedor enviado dentro del stream SSE (la respuesta HTTP ya fue 200)."""
+
+
+def _headers() -> dict:
+    return {
+        "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
         "Content-Type": "application/json",
         "X-Title": "fge-ai-agent-backend",
         "HTTP-Referer": "http://localhost:8000"
     }
-    async with httpx.AsyncClient() as client:
-        response = await client.post(BASE_URL, json=payload, headers=headers)
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
 
+
+def _payload(prompt: str, model: Optional[str], messages: Optional[List[dict]], stream: bool = False) -> dict:
+    payload = {
+        "model": model or settings.OPENROUTER_MODEL,
+        "messages": messages or [
+            {"role": "user", "content": prompt}
+        ]
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+async def llamar_modelo(prompt: str, model: str = None, messages: List[dict] = None, hedge: bool = None, retries: int = None) -> str:
+    """Respuesta completa (no streaming) por el cliente HTTP compartido."""
+    response = await http_client.request(
+        "openrouter.chat", "POST", f"{settings.OPENROUTER_BASE_URL}/chat/completions",
+        json=_payload(prompt, model, messages), headers=_headers(), hedge=hedge, retries=retries,
+    )
+    return response.json()["choices"][0]["message"]["content"] or ""
+
+
+async def stream_modelo(prompt: str, model: str = None, messages: List[dict] = None, retries: int = None) -> AsyncIterator[str]:
+    """Tokens (deltas de contenido) a medida que OpenRouter los emite por SSE."""
+    lines = http_client.stream_lines(
+        "openrouter.chat_stream", "POST", f"{settings.OPENROUTER_BASE_URL}/chat/completions",
+        json=_payload(prompt, model, messages, stream=True), headers=_headers(), retries=retries,
+    )
+    try:
+        async for line in lines:
+            # Formato SSE: "data: {...}"; las líneas ": OPENROUTER PROCESSING" son keep-alive
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except json.JSONDecodeError:
+                continue
+            if "error" in chunk:
+                raise OpenRouterStreamError(f"OpenRouter devolvió un error en el stream: {chunk['error']}")
+            choices = chunk.get("choices") or []
+            if choices:
+                token = (choices[0].get("delta") or {}).get("content")
+                if token:
+                    yield token
+    finally:
+        # Libera la conexión (vuelve al pool) aunque el consumidor corte antes de [DONE]
+        await lines.aclose()
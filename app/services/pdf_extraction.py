@@ -0,0 +1,90 @@
+import asyncio
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from app.config.settings import settings
+from app.services.file_processor import FileSource, ocr_pdf_page, plan_pdf_pages, source_size
+from app.services.tracing import span
+from app.services.worker_pool import WorkerTimeout, run_cpu
+
+
+@dataclass
+class PdfPage:
+    number: int
+    text: str
+    source: str  # "native" | "ocr" | "timeout" | "error"
+
+
+async def iter_pdf_pages_hybrid(source: FileSource, max_pages: Optional[int] = None,
+                                deadline_s: Optional[float] = None) -> AsyncIterator[PdfPage]:
+    """
+    Extracción por página, en orden y a medida que está lista:
+    - una pasada rápida por la capa de texto decide qué páginas son escaneadas;
+    - solo esas se rasterizan y pasan por OCR, repartidas en paralelo en el pool de procesos
+      (PDF_OCR_CONCURRENCY a la vez, para no saturar la cola del pool);
+    - las páginas con texto nativo salen de inmediato, sin esperar el OCR de las demás;
+    - al vencer PDF_DEADLINE_S, las páginas escaneadas pendientes salen vacías ("timeout").
+    Con una ruta en `source` (subida volcada a disco), cada trabajo de página recibe solo la ruta.
+    """
+    deadline_s = settings.PDF_DEADLINE_S if deadline_s is None else deadline_s
+    loop = asyncio.get_running_loop()
+    fin = loop.time() + deadline_s
+
+    with span("pdf.plan", size_bytes=source_size(source)):
+        total, plan = await run_cpu(plan_pdf_pages, source, max_pages)
+    escaneadas = [n for n, text in plan if text is None]
+    if len(plan) < total:
+        print(f"[PDF] Se procesan {len(plan)} de {total} páginas (PDF_MAX_PAGES={settings.PDF_MAX_PAGES})")
+    if escaneadas:
+        print(f"[PDF] {len(escaneadas)} de {len(plan)} páginas sin texto nativo: OCR a {settings.PDF_OCR_DPI} dpi")
+
+    semaforo = asyncio.Semaphore(max(1, settings.PDF_OCR_CONCURRENCY))
+
+    async def _ocr(n: int) -> str:
+        async with semaforo:
+            with span("pdf.ocr_page", page=n):
+                return await run_cpu(ocr_pdf_page, source, n, settings.PDF_OCR_DPI)
+
+    tareas: Dict[int, asyncio.Task] = {n: asyncio.ensure_future(_ocr(n)) for n in escaneadas}
+
+    def _cancelar_pendientes():
+        for tarea in tareas.values():
+            if not tarea.done():
+                tarea.cancel()
+
+    try:
+        for n, text in plan:
+            if text is not None:
+                yield PdfPage(n, text, "native")
+                continue
+            try:
+                restante = fin - loop.time()
+                if restante <= 0:
+                    raise asyncio.TimeoutError
+                page = PdfPage(n, await asyncio.wait_for(tareas[n], restante), "ocr")
+            except (asyncio.TimeoutError, WorkerTimeout):
+                if loop.time() >= fin:
+                    # Vencido el plazo, no tiene sentido seguir ocupando el pool con este documento
+                    _cancelar_pendientes()
+                print(f"[PDF] Página {n}: OCR fuera de plazo")
+                page = PdfPage(n, "", "timeout")
+            except Exception as e:
+                print(f"[PDF] Página {n}: falló el OCR ({e.__class__.__name__}: {e})")
+                page = PdfPage(n, "", "error")
+            yield page
+    finally:
+        _cancelar_pendientes()
+        for tarea in tareas.values():
+            # Marca como recuperadas las excepciones de páginas que nadie llegó a esperar
+            if tarea.done() and not tarea.cancelled():
+                tarea.exception()
+
+
+async def extract_pdf_text_async(source: FileSource) -> Tuple[str, bool]:
+    """Texto completo del PDF y si quedó completo (ninguna página vencida o fallida)."""
+    partes = []
+    completo = True
+    async for page in iter_pdf_pages_hybrid(source):
+        partes.append(page.text)
+        completo = completo and page.source in ("native", "ocr")
+    return "".join(partes).strip(), completo
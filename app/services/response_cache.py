@@ -0,0 +1,228 @@
+import copy
+import hashlib
+import re
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+from app.config.settings import settings
+from app.services import embedding_service
+from app.services.embedding_cache import normalize_text
+from app.services.lru_cache import LRUCache
+
+# Solo se cachean respuestas que dependen únicamente del prompt y del corpus MCP;
+# las respuestas de tools (reportes, citas) tienen efectos y estado propios.
+CACHEABLE_INTENTS = {"consulta_mcp", "respuesta_general"}
+
+_PUNTUACION_BORDE = re.compile(r"^[\s¿¡?!.,;:]+|[\s¿¡?!.,;:]+$")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalización para el match exacto: NFC, minúsculas, espacios y signos de los extremos."""
+    return _PUNTUACION_BORDE.sub("", normalize_text(prompt))
+
+
+def is_cacheable_prompt(prompt: str) -> bool:
+    # Prompts enriquecidos con el contenido de un archivo no se repiten: no vale la pena
+    return bool(prompt) and not prompt.startswith("Contenido visual:")
+
+
+def is_cacheable_response(payload: dict) -> bool:
+    structured = payload.get("structured_output", {})
+    if structured.get("intent") not in CACHEABLE_INTENTS:
+        return False
+    # Si alguna tool corrió (o falló) después del LLM, la respuesta no es reproducible
+    return not (structured.get("tools_called") or structured.get("tools_timed_out") or structured.get("tools_failed"))
+
+
+@dataclass
+class _Entrada:
+    payload: dict
+    embedding: Optional[np.ndarray]  # normalizado a norma 1 para que el producto punto sea el coseno
+    expires_at: float
+    version: int
+
+
+class ResponseCache:
+    """
+    Cache de respuestas en memoria con dos niveles: match exacto por prompt normalizado
+    y, si falla, el vecino más parecido por coseno sobre el embedding del prompt.
+
+    `version` se incrementa cada vez que cambia el corpus MCP; las entradas de una
+    versión anterior dejan de ser válidas sin tener que recorrerlas.
+    """
+
+    def __init__(self, maxsize: int, ttl_s: float, threshold: float):
+        self.ttl_s = ttl_s
+        self.threshold = threshold
+        self.version = 0
+        self._entradas = LRUCache(maxsize=maxsize)
+        self._matriz: Optional[np.ndarray] = None
+        self._claves: List[str] = []
+        self._sucia = True
+        self.semantic_hits = 0
+        self.semantic_misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(normalized: str) -> str:
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def _vigente(self, entrada: _Entrada, now: float) -> bool:
+        return entrada.version == self.version and entrada.expires_at > now
+
+    def get_exact(self, normalized: str) -> Optional[dict]:
+        key = self.key(normalized)
+        entrada = self._entradas.get(key)
+        if entrada is None:
+            return None
+        if not self._vigente(entrada, time.time()):
+            self._entradas.pop(key)
+            self._sucia = True
+            return None
+        return entrada.payload
+
+    def _reconstruir_matriz(self, now: float):
+        claves, vectores = [], []
+        for key, entrada in self._entradas.items():
+            if entrada.embedding is not None and self._vigente(entrada, now):
+                claves.append(key)
+                vectores.append(entrada.embedding)
+        self._claves = claves
+        self._matriz = np.vstack(vectores) if vectores else None
+        self._sucia = False
+
+    def get_similar(self, embedding: List[float]) -> Optional[dict]:
+        now = time.time()
+        if self._sucia:
+            self._reconstruir_matriz(now)
+        query = _unitario(embedding)
+        if self._matriz is None or query is None or query.shape[0] != self._matriz.shape[1]:
+            self.semantic_misses += 1
+            return None
+
+        similitudes = self._matriz @ query
+        mejor = int(np.argmax(similitudes))
+        entrada = self._entradas.peek(self._claves[mejor])
+        if similitudes[mejor] < self.threshold or entrada is None or not self._vigente(entrada, now):
+            self.semantic_misses += 1
+            return None
+
+        self.semantic_hits += 1
+        self._entradas.get(self._claves[mejor])  # la promueve en el LRU
+        return entrada.payload
+
+    def set(self, normalized: str, payload: dict, embedding: Optional[List[float]]):
+        self._entradas.set(self.key(normalized), _Entrada(
+            payload=copy.deepcopy(payload),
+            embedding=_unitario(embedding) if embedding is not None else None,
+            expires_at=time.time() + self.ttl_s,
+            version=self.version,
+        ))
+        self._sucia = True
+
+    def invalidate(self):
+        self.version += 1
+        self.invalidations += 1
+        self._entradas.clear()
+        self._matriz = None
+        self._claves = []
+        self._sucia = True
+
+    def stats(self) -> dict:
+        return {
+            **self._entradas.stats(),
+            "semantic_hits": self.semantic_hits,
+            "semantic_misses": self.semantic_misses,
+            "invalidations": self.invalidations,
+            "version": self.version,
+            "ttl_s": self.ttl_s,
+            "threshold": self.threshold,
+        }
+
+
+def _unitario(embedding) -> Optional[np.ndarray]:
+    vec = np.asarray(embedding, dtype=np.float32)
+    norma = float(np.linalg.norm(vec))
+    if not vec.size or norma == 0.0:
+        return None
+    return vec / norma
+
+
+_cache = ResponseCache(
+    maxsize=settings.RESPONSE_CACHE_SIZE,
+    ttl_s=settings.RESPONSE_CACHE_TTL_S,
+    threshold=settings.RESPONSE_CACHE_SIMILARITY,
+)
+
+
+def _semantic_enabled() -> bool:
+    # Los embeddings falsos son aleatorios por texto: la similitud no significa nada
+    return not embedding_service.USE_FAKE_EMBEDDING
+
+
+def _con_sesion(payload: dict, session_id: str, match: str) -> dict:
+    result = copy.deepcopy(payload)
+    structured = result.setdefault("structured_output", {})
+    structured["session_id"] = session_id
+    structured["cache"] = match
+    return result
+
+
+async def get_cached_response(prompt: str, session_id: str = "default") -> Optional[dict]:
+    """Devuelve una copia del payload cacheado (con el session_id actual) o None."""
+    if not settings.RESPONSE_CACHE_ENABLED or not is_cacheable_prompt(prompt):
+        return None
+
+    normalized = normalize_prompt(prompt)
+    payload = _cache.get_exact(normalized)
+    if payload is not None:
+        return _con_sesion(payload, session_id, "exact")
+
+    if not _semantic_enabled():
+        return None
+    try:
+        embedding = await embedding_service.generate_embedding_async(normalized)
+    except Exception as e:
+        print(f"[RESPONSE_CACHE] No se pudo calcular embedding del prompt: {e}")
+        return None
+    payload = _cache.get_similar(embedding)
+    if payload is not None:
+        return _con_sesion(payload, session_id, "semantic")
+    return None
+
+
+def response_cache_version() -> int:
+    """Versión del corpus al iniciar una respuesta; se pasa luego a set_cached_response."""
+    return _cache.version
+
+
+async def set_cached_response(prompt: str, payload: dict, version: int):
+    if not settings.RESPONSE_CACHE_ENABLED or not is_cacheable_prompt(prompt) or not is_cacheable_response(payload):
+        return
+
+    normalized = normalize_prompt(prompt)
+    embedding = None
+    if _semantic_enabled():
+        try:
+            # Ya se calculó en get_cached_response: sale del cache de embeddings
+            embedding = await embedding_service.generate_embedding_async(normalized)
+        except Exception as e:
+            print(f"[RESPONSE_CACHE] Guardando sin embedding: {e}")
+
+    if version != _cache.version:
+        # El corpus cambió mientras se generaba la respuesta: ya podría estar obsoleta
+        return
+    _cache.set(normalized, payload, embedding)
+
+
+def invalidate_response_cache(reason: str = ""):
+    """Se llama cuando cambian filas de McpDocument (ingesta, reportes con archivo)."""
+    _cache.invalidate()
+    print(f"[RESPONSE_CACHE] Invalidada (versión {_cache.version}) {reason}".rstrip())
+
+
+def response_cache_stats() -> dict:
+    return _cache.stats()
@@ -0,0 +1,197 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, List, Optional, Set, Tuple
+
+from sqlmodel import select
+
+from app.config.settings import settings
+from app.db.database import async_session
+from app.db.models import Session as SessionModel
+from app.services.lru_cache import LRUCache
+from app.services.tracing import span
+
+
+def approx_tokens(text: str) -> int:
+    # Misma aproximación que el chunker: palabras separadas por espacios
+    return len(text.split())
+
+
+def _recortar(text: str, max_tokens: int) -> str:
+    palabras = text.split()
+    if len(palabras) <= max_tokens:
+        return text.strip()
+    return " ".join(palabras[:max_tokens]) + " …"
+
+
+@dataclass
+class SessionMemory:
+    """Memoria acotada de una sesión: resumen de lo antiguo + últimos turnos literales."""
+    summary: str = ""
+    turns: Deque[Tuple[str, str]] = field(default_factory=deque)  # (prompt, reply)
+    summarizing: bool = False
+    loaded: bool = True  # False si falló la carga del historial: no se sabe si la sesión está vacía
+
+    @property
+    def empty(self) -> bool:
+        return not self.summary and not self.turns
+
+    def tokens(self) -> int:
+        # Cada turno cuenta como lo que realmente entra al prompt (recortado a SESSION_MEMORY_TURN_TOKENS)
+        tope = settings.SESSION_MEMORY_TURN_TOKENS
+        return approx_tokens(self.summary) + sum(
+            min(approx_tokens(p), tope) + min(approx_tokens(r), tope) for p, r in self.turns
+        )
+
+    def context(self) -> str:
+        """Bloque de contexto para el LLM (vacío si la sesión no tiene historia)."""
+        if self.empty:
+            return ""
+        partes = []
+        if self.summary:
+            partes.append(f"Resumen de la conversación hasta ahora: {self.summary}")
+        # Mientras el resumen se calcula en segundo plano, el presupuesto se respeta igual:
+        # entran los turnos más recientes que quepan (siempre al menos el último)
+        tope = settings.SESSION_MEMORY_TURN_TOKENS
+        disponible = settings.SESSION_MEMORY_TOKEN_BUDGET - approx_tokens(self.summary)
+        recientes = []
+        for p, r in reversed(self.turns):
+            costo = min(approx_tokens(p), tope) + min(approx_tokens(r), tope)
+            if recientes and costo > disponible:
+                break
+            recientes.append(f"Usuario: {_recortar(p, tope)}\nAsistente: {_recortar(r, tope)}")
+            disponible -= costo
+        if recientes:
+            partes.append("Turnos recientes:\n" + "\n".join(reversed(recientes)))
+        return "\n\n".join(partes)
+
+
+_memorias = LRUCache(maxsize=settings.SESSION_MEMORY_SESSIONS)
+_cargando: dict = {}
+_tareas: Set[asyncio.Task] = set()
+
+
+def _key(user_id: str, session_id: str) -> Tuple[str, str]:
+    return (user_id or "anon", session_id or "default")
+
+
+async def _cargar(user_id: str, session_id: str) -> SessionMemory:
+    """Últimos turnos desde Postgres (índice (user_id, session_id, created_at))."""
+    memoria = SessionMemory()
+    with span("db.session_history"):
+        async with async_session() as session:
+            result = await session.execute(
+                select(SessionModel.prompt, SessionModel.reply)
+                .where((SessionModel.user_id == user_id) & (SessionModel.session_id == session_id))
+                .order_by(SessionModel.created_at.desc())
+                .limit(settings.SESSION_MEMORY_LOAD_TURNS)
+            )
+            filas = result.all()
+    for prompt, reply in reversed(filas):
+        memoria.turns.append((prompt, reply))
+    return memoria
+
+
+async def get_session_memory(user_id: str, session_id: str) -> SessionMemory:
+    """Memoria de la sesión: del LRU en proceso o, la primera vez, desde la base de datos."""
+    key = _key(user_id, session_id)
+    memoria = _memorias.get(key)
+    if memoria is not None:
+        return memoria
+
+    # Varias peticiones simultáneas de la misma sesión comparten una sola carga
+    pendiente = _cargando.get(key)
+    if pendiente is None:
+        pendiente = _cargando[key] = asyncio.ensure_future(_cargar(*key))
+    try:
+        memoria = await asyncio.shield(pendiente)
+    except Exception as e:
+        # No se guarda en el LRU: el próximo turno vuelve a intentar la carga
+        print(f"[SESSION_MEMORY] No se pudo cargar historial de {key}: {e}")
+        return SessionMemory(loaded=False)
+    finally:
+        _cargando.pop(key, None)
+
+    existente = _memorias.peek(key)
+    if existente is not None:
+        return existente
+    _memorias.set(key, memoria)
+    _compactar(memoria)
+    return memoria
+
+
+def record_turn(user_id: str, session_id: str, prompt: str, reply: str):
+    """Agrega el turno a la memoria en proceso (si la sesión está cargada) y la mantiene acotada."""
+    memoria = _memorias.peek(_key(user_id, session_id))
+    if memoria is None:
+        # Se cargará desde la base de datos la próxima vez que se necesite
+        return
+    memoria.turns.append((prompt, reply))
+    _compactar(memoria)
+
+
+def _compactar(memoria: SessionMemory):
+    """Si la historia excede el presupuesto, los turnos antiguos se pliegan en el resumen (en segundo plano)."""
+    if memoria.tokens() <= settings.SESSION_MEMORY_TOKEN_BUDGET or memoria.summarizing:
+        return
+    if len(memoria.turns) <= settings.SESSION_MEMORY_RECENT_TURNS:
+        return
+    memoria.summarizing = True
+    tarea = asyncio.ensure_future(_resumir(memoria))
+    _tareas.add(tarea)
+    tarea.add_done_callback(_tareas.discard)
+
+
+async def _resumir(memoria: SessionMemory):
+    try:
+        while (memoria.tokens() > settings.SESSION_MEMORY_TOKEN_BUDGET
+               and len(memoria.turns) > settings.SESSION_MEMORY_RECENT_TURNS):
+            n = len(memoria.turns) - settings.SESSION_MEMORY_RECENT_TURNS
+            antiguos: List[Tuple[str, str]] = [memoria.turns[i] for i in range(n)]
+            try:
+                nuevo = await _resumen_llm(memoria.summary, antiguos)
+            except Exception as e:
+                # Sin resumen disponible, igual se respeta el presupuesto: se descartan los turnos antiguos
+                print(f"[SESSION_MEMORY] Falló el resumen, se descartan {n} turnos antiguos: {e}")
+                nuevo = memoria.summary
+            # Se quitan exactamente los turnos resumidos (pudieron llegar otros mientras tanto)
+            for _ in range(n):
+                memoria.turns.popleft()
+            memoria.summary = _recortar(nuevo, settings.SESSION_SUMMARY_MAX_TOKENS)
+    finally:
+        memoria.summarizing = False
+
+
+async def _resumen_llm(resumen_previo: str, turnos: List[Tuple[str, str]]) -> str:
+    from app.agent.model_router import model_router, EXTRACTION
+
+    conversacion = "\n".join(
+        f"Usuario: {_recortar(p, settings.SESSION_MEMORY_TURN_TOKENS)}\n"
+        f"Asistente: {_recortar(r, settings.SESSION_MEMORY_TURN_TOKENS)}"
+        for p, r in turnos
+    )
+    prompt = f"""
+Eres el sistema de memoria de un asistente municipal. Resume la conversación en español, en no más de
+{settings.SESSION_SUMMARY_MAX_TOKENS} palabras, conservando los datos concretos (nombres, zonas, fechas,
+montos, trámites, números de reporte) y lo que el ciudadano todavía necesita.
+
+Resumen previo: {resumen_previo or "(ninguno)"}
+
+Conversación a incorporar:
+{conversacion}
+
+Resumen actualizado:
+""".strip()
+    with span("session_memory.summarize", turns=len(turnos)):
+        return (await model_router.complete(EXTRACTION, prompt)).strip()
+
+
+def with_history(memoria: Optional[SessionMemory], prompt: str) -> str:
+    """Prompt para el LLM con la historia acotada de la sesión antepuesta (si la hay)."""
+    if memoria is None or memoria.empty:
+        return prompt
+    return f"{memoria.context()}\n\nMensaje actual del usuario:\n{prompt}"
+
+
+def session_memory_stats() -> dict:
+    return {**_memorias.stats(), "summarizing": len(_tareas)}
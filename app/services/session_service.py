@@ -1,13 +1,16 @@
-from app.db.database import async_session
+from datetime import datetime
 from app.db.models import Session as SessionModel
+from app.services.write_behind import write_behind
+from app.services.session_memory import record_turn
 
 async def save_session(user_id: str, session_id: str, prompt: str, reply: str):
-    new_session = SessionModel(
-        user_id=user_id,
-        session_id=session_id,
-        prompt=prompt,
-        reply=reply
-    )
-    async with async_session() as session:
-        session.add(new_session)
-        await session.commit()
+    # Se encola: la respuesta al usuario no espera el INSERT (ver write_behind)
+    write_behind.enqueue(SessionModel, {
+        "user_id": user_id,
+        "session_id": session_id,
+        "prompt": prompt,
+        "reply": reply,
+        "created_at": datetime.utcnow(),
+    })
+    # La memoria en proceso se actualiza ya, sin esperar al flush del write-behind
+    record_turn(user_id, session_id, prompt, reply)
@@ -0,0 +1,237 @@
+import asyncio
+import contextvars
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from app.config.settings import settings
+from app.services.metrics_service import log_stage_latency
+
+# Trazas por etapa del pipeline de chat. Cada span mide siempre su duración y la
+# registra en el histograma de la etapa (costo: dos perf_counter); solo las trazas
+# muestreadas (TRACE_SAMPLE_RATE) se guardan y exportan.
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    sampled: bool
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    events: List[dict] = field(default_factory=list)
+    # Spans terminados de la traza; compartido entre todos los spans de la misma traza
+    finished: Optional[List["Span"]] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes):
+        self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes})
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+_export_queue: "asyncio.Queue[List[Span]]" = asyncio.Queue(maxsize=1000)
+_exporter_task: Optional[asyncio.Task] = None
+dropped_traces = 0
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def use_span(sp: Span):
+    """
+    Hace de `sp` el span actual solo dentro del bloque. En generadores async el bloque no debe
+    contener `yield`: se usa alrededor de cada `await` entre yields para que los spans hijos
+    cuelguen de `sp` sin que el contexto se filtre al consumidor del generador.
+    """
+    token = _current_span.set(sp)
+    try:
+        yield sp
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name: str, activate: bool = True, **attributes):
+    """
+    Span hijo del span actual. Sin traza activa mide igual (histograma de etapa)
+    pero no guarda nada. Funciona en código sync y async (`with span(...)`).
+    Con activate=False no pasa a ser el span actual: es lo que corresponde cuando el bloque
+    contiene `yield` en un generador async (el contexto es el del consumidor entre yields).
+    """
+    parent = _current_span.get()
+    if parent is None:
+        sp = Span(name=name, trace_id="", span_id="", parent_id=None, sampled=False)
+    else:
+        sp = Span(
+            name=name,
+            trace_id=parent.trace_id,
+            span_id=_new_id(64) if parent.sampled else "",
+            parent_id=parent.span_id,
+            sampled=parent.sampled,
+            finished=parent.finished,
+        )
+    sp.attributes.update(attributes)
+    token = _current_span.set(sp) if activate else None
+    start = time.perf_counter()
+    try:
+        yield sp
+    except Exception as e:
+        sp.set_attribute("error", repr(e))
+        raise
+    finally:
+        log_stage_latency(name, (time.perf_counter() - start) * 1000)
+        sp.end_ns = time.time_ns()
+        if token is not None:
+            _current_span.reset(token)
+        if sp.sampled and sp.finished is not None:
+            sp.finished.append(sp)
+
+
+@contextmanager
+def start_trace(name: str, activate: bool = True, **attributes):
+    """
+    Span raíz de una petición. Decide el muestreo y, al cerrar, encola la traza para exportar.
+    En un generador async (streaming) va con activate=False y `use_span(traza)` entre yields.
+    """
+    sampled = random.random() < settings.TRACE_SAMPLE_RATE
+    root = Span(
+        name=name,
+        trace_id=_new_id(128) if sampled else "",
+        span_id=_new_id(64) if sampled else "",
+        parent_id=None,
+        sampled=sampled,
+        finished=[] if sampled else None,
+    )
+    root.attributes.update(attributes)
+    token = _current_span.set(root) if activate else None
+    start = time.perf_counter()
+    try:
+        yield root
+    except Exception as e:
+        root.set_attribute("error", repr(e))
+        raise
+    finally:
+        log_stage_latency(name, (time.perf_counter() - start) * 1000)
+        root.end_ns = time.time_ns()
+        if token is not None:
+            _current_span.reset(token)
+        if sampled:
+            root.finished.append(root)
+            _enqueue(root.finished)
+
+
+def _enqueue(spans: List[Span]):
+    global dropped_traces
+    if not (settings.TRACE_EXPORT_PATH or settings.TRACE_OTLP_ENDPOINT):
+        return
+    try:
+        _export_queue.put_nowait(spans)
+    except asyncio.QueueFull:
+        dropped_traces += 1
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[dict]:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items() if v is not None]
+
+
+def to_otlp(spans: List[Span]) -> dict:
+    """Traza en formato OTLP/HTTP JSON (ExportTraceServiceRequest)."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": settings.TRACE_SERVICE_NAME})},
+            "scopeSpans": [{
+                "scope": {"name": "app.services.tracing"},
+                "spans": [
+                    {
+                        "traceId": sp.trace_id,
+                        "spanId": sp.span_id,
+                        **({"parentSpanId": sp.parent_id} if sp.parent_id else {}),
+                        "name": sp.name,
+                        "kind": 1,
+                        "startTimeUnixNano": str(sp.start_ns),
+                        "endTimeUnixNano": str(sp.end_ns),
+                        "attributes": _otlp_attributes(sp.attributes),
+                        "events": [
+                            {"name": ev["name"], "timeUnixNano": str(ev["time_ns"]), "attributes": _otlp_attributes(ev["attributes"])}
+                            for ev in sp.events
+                        ],
+                    }
+                    for sp in spans
+                ],
+            }],
+        }]
+    }
+
+
+def _append_to_file(path: str, lines: List[str]):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
+async def _export(batch: List[List[Span]]):
+    payloads = [to_otlp(spans) for spans in batch]
+    if settings.TRACE_EXPORT_PATH:
+        lines = [json.dumps(p) + "\n" for p in payloads]
+        await asyncio.to_thread(_append_to_file, settings.TRACE_EXPORT_PATH, lines)
+    if settings.TRACE_OTLP_ENDPOINT:
+        import httpx
+        async with httpx.AsyncClient(timeout=5) as client:
+            for payload in payloads:
+                await client.post(settings.TRACE_OTLP_ENDPOINT, json=payload)
+
+
+async def _run_exporter():
+    while True:
+        batch = [await _export_queue.get()]
+        while not _export_queue.empty() and len(batch) < 100:
+            batch.append(_export_queue.get_nowait())
+        try:
+            await _export(batch)
+        except Exception as e:
+            print(f"[TRACING] Error exportando {len(batch)} trazas: {e}")
+
+
+def start_exporter():
+    global _exporter_task
+    if (settings.TRACE_EXPORT_PATH or settings.TRACE_OTLP_ENDPOINT) and _exporter_task is None:
+        _exporter_task = asyncio.create_task(_run_exporter())
+
+
+async def stop_exporter():
+    global _exporter_task
+    if _exporter_task is not None:
+        _exporter_task.cancel()
+        _exporter_task = None
+    pendientes = []
+    while not _export_queue.empty():
+        pendientes.append(_export_queue.get_nowait())
+    if pendientes:
+        try:
+            await _export(pendientes)
+        except Exception as e:
+            print(f"[TRACING] Error exportando trazas pendientes: {e}")
@@ -0,0 +1,223 @@
+import hashlib
+import os
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from app.config.settings import settings
+from app.services.file_processor import FileSource
+
+# Los campos de texto de un multipart (action, path, ...) son cortos; el archivo va aparte
+_MAX_CAMPOS_BYTES = 64 * 1024
+
+
+# Temporales de subidas volcadas a disco -> referencias vivas (la subida + extracciones en curso).
+# El archivo se borra cuando se suelta la última, no cuando termina la petición que lo subió.
+_temporales: Dict[str, int] = {}
+
+
+def retener_temporal(ruta: str) -> bool:
+    """Toma una referencia al temporal de una subida. False si la ruta no es de una subida."""
+    if ruta not in _temporales:
+        return False
+    _temporales[ruta] += 1
+    return True
+
+
+def liberar_temporal(ruta: str):
+    """Suelta una referencia; con la última se borra el archivo. Ignora rutas que no son de subidas."""
+    if ruta not in _temporales:
+        return
+    _temporales[ruta] -= 1
+    if _temporales[ruta] <= 0:
+        del _temporales[ruta]
+        try:
+            os.unlink(ruta)
+        except FileNotFoundError:
+            pass
+
+
+class UploadDemasiadoGrande(Exception):
+    """El cuerpo excede UPLOAD_MAX_BYTES; se corta la lectura en cuanto se pasa del límite."""
+
+
+class SpooledUpload:
+    """
+    Archivo subido, escrito a medida que llega: en memoria hasta UPLOAD_MEMORY_BYTES y, a partir
+    de ahí, en un temporal con nombre en disco (los workers del pool lo abren por ruta, sin copiar
+    los bytes entre procesos). El sha256 se calcula al vuelo para el cache de extracción.
+    """
+
+    def __init__(self, filename: str, max_bytes: Optional[int] = None, memory_bytes: Optional[int] = None):
+        self.filename = filename
+        self.max_bytes = settings.UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+        self.memory_bytes = settings.UPLOAD_MEMORY_BYTES if memory_bytes is None else memory_bytes
+        self.size = 0
+        self._sha = hashlib.sha256()
+        self._chunks: List[bytes] = []
+        self._bytes: Optional[bytes] = None
+        self._file = None
+        self._cerrado = False
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadDemasiadoGrande(f"El archivo excede {self.max_bytes} bytes")
+        self._sha.update(data)
+
+        if self._file is None and self.size > self.memory_bytes:
+            suffix = os.path.splitext(self.filename)[1].lower()
+            self._file = tempfile.NamedTemporaryFile(prefix="upload_", suffix=suffix, delete=False)
+            _temporales[self._file.name] = 1
+            for chunk in self._chunks:
+                self._file.write(chunk)
+            self._chunks = []
+        if self._file is not None:
+            self._file.write(data)
+        else:
+            self._chunks.append(data)
+
+    def finish(self):
+        if self._file is not None and not self._file.closed:
+            self._file.close()  # delete=False: el temporal queda hasta liberar la última referencia
+
+    @property
+    def digest(self) -> str:
+        return self._sha.hexdigest()
+
+    @property
+    def on_disk(self) -> bool:
+        return self._file is not None
+
+    def source(self) -> FileSource:
+        """Ruta del temporal si se volcó a disco; si no, los bytes (unidos una sola vez)."""
+        if self._file is not None:
+            return self._file.name
+        if self._bytes is None:
+            self._bytes = b"".join(self._chunks)
+            self._chunks = []
+        return self._bytes
+
+    def close(self):
+        if self._file is not None and not self._cerrado:
+            self._file.close()
+            # Si una extracción compartida todavía lo lee, el borrado queda para cuando termine
+            liberar_temporal(self._file.name)
+        self._cerrado = True
+        self._chunks = []
+        self._bytes = None
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _LectorMultipart:
+    """Callbacks de python_multipart: el campo con filename va a un SpooledUpload, el resto a `fields`."""
+
+    def __init__(self, boundary: bytes):
+        self.upload: Optional[SpooledUpload] = None
+        self.fields: Dict[str, str] = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._headers: Dict[bytes, bytes] = {}
+        self._en_archivo = False
+        self._campo: Optional[str] = None
+        self._valor = bytearray()
+        self._campos_bytes = 0
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": self._part_begin,
+            "on_header_field": lambda data, start, end: self._header_field.extend(data[start:end]),
+            "on_header_value": lambda data, start, end: self._header_value.extend(data[start:end]),
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        })
+
+    def _part_begin(self):
+        self._headers = {}
+        self._en_archivo = False
+        self._campo = None
+        self._valor = bytearray()
+
+    def _header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _headers_finished(self):
+        _, params = parse_options_header(self._headers.get(b"content-disposition", b""))
+        filename = params.get(b"filename")
+        if filename is not None:
+            if self.upload is not None:
+                raise ValueError("Solo se admite un archivo por petición")
+            # basename: el nombre lo manda el cliente, no se usa como ruta
+            self.upload = SpooledUpload(os.path.basename(filename.decode("utf-8", "replace")))
+            self._en_archivo = True
+        else:
+            self._campo = params.get(b"name", b"").decode("utf-8", "replace")
+
+    def _part_data(self, data: bytes, start: int, end: int):
+        if self._en_archivo:
+            self.upload.write(data[start:end])
+            return
+        self._campos_bytes += end - start
+        if self._campos_bytes > _MAX_CAMPOS_BYTES:
+            raise UploadDemasiadoGrande("Campos del formulario demasiado grandes")
+        self._valor.extend(data[start:end])
+
+    def _part_end(self):
+        if self._en_archivo:
+            self.upload.finish()
+        elif self._campo:
+            self.fields[self._campo] = self._valor.decode("utf-8", "replace")
+
+
+async def read_upload(request) -> Tuple[SpooledUpload, Dict[str, str]]:
+    """
+    Lee el cuerpo de la petición en streaming, sin base64 ni JSON:
+    - multipart/form-data: un campo de archivo + campos de texto (action, path, ...);
+    - cualquier otro Content-Type: el archivo crudo en el cuerpo, con ?filename= en la URL.
+    Devuelve la subida y los campos (query string + formulario). El tope de tamaño se aplica
+    por Content-Length (si viene) y mientras se lee, así que nunca se guarda más de la cuenta.
+    """
+    length = request.headers.get_first(b"content-length")
+    if length and int(length) > settings.UPLOAD_MAX_BYTES:
+        raise UploadDemasiadoGrande(f"El archivo excede {settings.UPLOAD_MAX_BYTES} bytes")
+
+    fields = {key: values[0] for key, values in request.query.items() if values}
+    content_type, params = parse_options_header(request.headers.get_first(b"content-type") or b"")
+
+    if content_type == b"multipart/form-data":
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise ValueError("multipart/form-data sin boundary")
+        lector = _LectorMultipart(boundary)
+        try:
+            async for chunk in request.stream():
+                lector.parser.write(chunk)
+            lector.parser.finalize()
+        except BaseException:
+            if lector.upload is not None:
+                lector.upload.close()
+            raise
+        if lector.upload is None:
+            raise ValueError("El formulario no trae ningún archivo")
+        fields.update(lector.fields)
+        return lector.upload, fields
+
+    upload = SpooledUpload(os.path.basename(fields.get("filename", "")))
+    try:
+        async for chunk in request.stream():
+            upload.write(chunk)
+        upload.finish()
+    except BaseException:
+        upload.close()
+        raise
+    return upload, fields
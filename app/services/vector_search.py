@@ -0,0 +1,144 @@
+import json
+from typing import List, Optional
+from sqlalchemy import text
+from app.config.settings import settings
+from app.db.database import async_session
+from app.db.vector_types import EMBEDDING_DIM, PG_VECTOR_TYPE
+from app.services.tracing import span
+
+# Todo lo vectorial sale de aquí: el índice HNSW se crea con vector_cosine_ops,
+# así que las consultas deben ordenar con el operador de distancia coseno (<=>).
+# Con <#> (producto interno) Postgres no puede usar el índice y recorre toda la tabla.
+VECTOR_OPCLASS = f"{PG_VECTOR_TYPE}_cosine_ops"
+DISTANCE_OPERATOR = "<=>"
+
+# (nombre del índice, tabla, columna)
+VECTOR_INDEXES = [
+    ("idx_mcpdocument_embedding_pg", "mcpdocument", "embedding_pg"),
+    ("idx_mcpdocumentchunk_embedding_pg", "mcpdocumentchunk", "embedding_pg"),
+    ("idx_document_embedding_pg", "document", "embedding_pg"),
+]
+
+
+def to_vector_literal(embedding: List[float]) -> str:
+    return f"[{', '.join(map(str, embedding))}]"
+
+
+def distance_to_similarity(distance: Optional[float]) -> Optional[float]:
+    """Distancia coseno (0..2) → similitud coseno (1..-1)."""
+    if distance is None:
+        return None
+    return 1.0 - float(distance)
+
+
+async def create_vector_indexes():
+    async with async_session() as session:
+        for index_name, table, column in VECTOR_INDEXES:
+            await session.execute(text(f"""
+                CREATE INDEX IF NOT EXISTS {index_name}
+                ON {table}
+                USING hnsw ({column} {VECTOR_OPCLASS})
+                WITH (m = {int(settings.HNSW_M)}, ef_construction = {int(settings.HNSW_EF_CONSTRUCTION)});
+            """))
+        await session.commit()
+
+
+async def _set_ef_search(session, top_k: int):
+    # ef_search debe ser >= LIMIT o el índice devuelve menos filas de las pedidas
+    ef_search = max(int(settings.HNSW_EF_SEARCH), int(top_k))
+    await session.execute(text(f"SET LOCAL hnsw.ef_search = {ef_search}"))
+
+
+async def buscar_fragmentos(query_embedding: List[float], top_k: int = 4) -> List[dict]:
+    """
+    Fragmentos más cercanos al embedding. Los documentos cargados antes de la ingesta
+    por fragmentos (sin filas en mcpdocumentchunk) participan con su contenido completo.
+    """
+    # La subconsulta ordena por la expresión indexada y corta con LIMIT antes del JOIN,
+    # así el plan es un Index Scan del HNSW.
+    sql_chunks = text(f"""
+        SELECT c.id AS chunk_id, d.id AS document_id, d.filename, d.path, d.created_at, c.page, c.content,
+        c.distance
+        FROM (
+            SELECT id, document_id, page, content,
+            embedding_pg {DISTANCE_OPERATOR} CAST(:query_vector AS {PG_VECTOR_TYPE}) AS distance
+            FROM mcpdocumentchunk
+            ORDER BY embedding_pg {DISTANCE_OPERATOR} CAST(:query_vector AS {PG_VECTOR_TYPE})
+            LIMIT :top_k
+        ) c
+        JOIN mcpdocument d ON d.id = c.document_id
+        ORDER BY c.distance ASC
+    """)
+    sql_legacy = text(f"""
+        SELECT NULL AS chunk_id, d.id AS document_id, d.filename, d.path, d.created_at, NULL AS page, d.content,
+        d.embedding_pg {DISTANCE_OPERATOR} CAST(:query_vector AS {PG_VECTOR_TYPE}) AS distance
+        FROM mcpdocument d
+        WHERE NOT EXISTS (SELECT 1 FROM mcpdocumentchunk c WHERE c.document_id = d.id)
+        AND d.embedding_pg IS NOT NULL
+        ORDER BY d.embedding_pg {DISTANCE_OPERATOR} CAST(:query_vector AS {PG_VECTOR_TYPE})
+        LIMIT :top_k
+    """)
+
+    params = {"query_vector": to_vector_literal(query_embedding), "top_k": top_k}
+    with span("db.vector_search", top_k=top_k):
+        async with async_session() as session:
+            await _set_ef_search(session, top_k)
+            rows = [dict(r) for r in (await session.execute(sql_chunks, params)).mappings().all()]
+            rows += [dict(r) for r in (await session.execute(sql_legacy, params)).mappings().all()]
+
+    for row in rows:
+        row["similarity"] = distance_to_similarity(row["distance"])
+    rows.sort(key=lambda r: r["distance"])
+    return rows[:top_k]
+
+
+async def buscar_documentos_similares(query_embedding: List[float], top_k: int = 3) -> List[dict]:
+    sql = text(f"""
+        SELECT id, title, embedding_pg {DISTANCE_OPERATOR} CAST(:query_vector AS {PG_VECTOR_TYPE}) AS distance
+        FROM document
+        ORDER BY embedding_pg {DISTANCE_OPERATOR} CAST(:query_vector AS {PG_VECTOR_TYPE})
+        LIMIT :top_k
+    """)
+    async with async_session() as session:
+        await _set_ef_search(session, top_k)
+        result = await session.execute(sql, {"query_vector": to_vector_literal(query_embedding), "top_k": top_k})
+        rows = result.mappings().all()
+
+    return [
+        {"id": row["id"], "title": row["title"], "similarity": distance_to_similarity(row["distance"])}
+        for row in rows
+    ]
+
+
+def _plan_uses_index(plan: dict, index_name: str) -> bool:
+    if plan.get("Index Name") == index_name and "Index" in plan.get("Node Type", ""):
+        return True
+    return any(_plan_uses_index(child, index_name) for child in plan.get("Plans", []))
+
+
+async def verify_vector_index_usage():
+    """
+    Falla el arranque si alguna consulta vectorial no puede resolverse con su índice HNSW
+    (operador y opclass desalineados, índice faltante, etc.). Se desactiva el seq scan
+    solo dentro de esta transacción: en tablas pequeñas el planner lo preferiría aunque
+    el índice sea utilizable.
+    """
+    probe = to_vector_literal([1.0] + [0.0] * (EMBEDDING_DIM - 1))
+    async with async_session() as session:
+        await session.execute(text("SET LOCAL enable_seqscan = off"))
+        for index_name, table, column in VECTOR_INDEXES:
+            result = await session.execute(text(f"""
+                EXPLAIN (FORMAT JSON)
+                SELECT id FROM {table}
+                ORDER BY {column} {DISTANCE_OPERATOR} CAST(:probe AS {PG_VECTOR_TYPE})
+                LIMIT 5
+            """), {"probe": probe})
+            raw_plan = result.scalar()
+            plan = (json.loads(raw_plan) if isinstance(raw_plan, str) else raw_plan)[0]["Plan"]
+            if not _plan_uses_index(plan, index_name):
+                raise RuntimeError(
+                    f"La búsqueda vectorial en {table}.{column} no usa el índice {index_name} "
+                    f"(plan: {plan.get('Node Type')}). Revisa operador/opclass."
+                )
+        await session.rollback()
+    print("✅ Plan de búsqueda vectorial verificado: usa índices HNSW.")
@@ -0,0 +1,178 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Awaitable, Callable, Optional
+from app.config.settings import settings
+
+
+class WorkerPoolSaturado(Exception):
+    """El pool ya tiene el máximo de trabajos pendientes; el cliente debe reintentar."""
+
+
+class WorkerTimeout(Exception):
+    """El trabajo no terminó dentro del tiempo permitido."""
+
+
+class PoolAcotado:
+    """
+    Envuelve un executor con una cola acotada (trabajos en ejecución + en espera)
+    y un timeout por trabajo. El event loop solo espera futures.
+    """
+
+    def __init__(self, nombre: str, crear_executor: Callable[[], Executor], workers: int, cola: int, timeout_s: float):
+        self.nombre = nombre
+        self._crear_executor = crear_executor
+        self._executor: Optional[Executor] = None
+        self.max_pendientes = workers + cola
+        self.timeout_s = timeout_s
+        self.pendientes = 0
+        self.rechazados = 0
+        self.timeouts = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = self._crear_executor()
+        return self._executor
+
+    def _liberar(self, _future=None):
+        self.pendientes -= 1
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None) -> Any:
+        if self.pendientes >= self.max_pendientes:
+            self.rechazados += 1
+            raise WorkerPoolSaturado(f"Pool '{self.nombre}' saturado ({self.pendientes} trabajos pendientes)")
+
+        loop = asyncio.get_running_loop()
+        try:
+            cf_future = self._get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            # Un worker murió (p. ej. OOM en OCR); se recrea el pool para el siguiente intento
+            self._executor = None
+            cf_future = self._get_executor().submit(fn, *args)
+
+        # El contador se libera cuando el trabajo termina de verdad, no cuando el cliente deja de esperar
+        self.pendientes += 1
+        cf_future.add_done_callback(lambda f: loop.call_soon_threadsafe(self._liberar, f))
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(cf_future), timeout or self.timeout_s)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            cf_future.cancel()  # solo surte efecto si aún no empezó
+            raise WorkerTimeout(f"Trabajo en pool '{self.nombre}' excedió {timeout or self.timeout_s}s")
+
+    def estado(self) -> dict:
+        return {
+            "pendientes": self.pendientes,
+            "max_pendientes": self.max_pendientes,
+            "rechazados": self.rechazados,
+            "timeouts": self.timeouts,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class CupoAsync:
+    """
+    Mismo contrato que PoolAcotado (tope de pendientes y plazo por trabajo) para llamadas que
+    ya son async, como los embeddings por el cliente HTTP: no necesitan un hilo, solo el límite.
+    """
+
+    def __init__(self, nombre: str, max_pendientes: int, timeout_s: float):
+        self.nombre = nombre
+        self.max_pendientes = max_pendientes
+        self.timeout_s = timeout_s
+        self.pendientes = 0
+        self.rechazados = 0
+        self.timeouts = 0
+
+    async def run(self, trabajo: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        if self.pendientes >= self.max_pendientes:
+            self.rechazados += 1
+            if asyncio.iscoroutine(trabajo):
+                trabajo.close()
+            raise WorkerPoolSaturado(f"Pool '{self.nombre}' saturado ({self.pendientes} trabajos pendientes)")
+
+        self.pendientes += 1
+        try:
+            return await asyncio.wait_for(trabajo, timeout or self.timeout_s)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise WorkerTimeout(f"Trabajo en pool '{self.nombre}' excedió {timeout or self.timeout_s}s")
+        finally:
+            self.pendientes -= 1
+
+    def estado(self) -> dict:
+        return {
+            "pendientes": self.pendientes,
+            "max_pendientes": self.max_pendientes,
+            "rechazados": self.rechazados,
+            "timeouts": self.timeouts,
+        }
+
+
+def _init_ocr_worker():
+    # Corre en cada worker nuevo del pool de OCR: con OCR_WARMUP el lector queda cargado
+    # antes del primer trabajo, también cuando el pool se recrea tras un BrokenProcessPool
+    if settings.OCR_WARMUP:
+        from app.services.file_processor import warm_up_ocr
+        warm_up_ocr()
+
+
+cpu_pool = PoolAcotado(
+    "cpu",
+    lambda: ProcessPoolExecutor(
+        max_workers=settings.OCR_WORKERS,
+        mp_context=multiprocessing.get_context(settings.OCR_POOL_START_METHOD),
+        initializer=_init_ocr_worker,
+    ),
+    workers=settings.OCR_WORKERS,
+    cola=settings.OCR_QUEUE_SIZE,
+    timeout_s=settings.OCR_TIMEOUT_S,
+)
+
+embedding_slots = CupoAsync(
+    "embeddings",
+    max_pendientes=settings.EMBEDDING_MAX_PENDING,
+    timeout_s=settings.EMBEDDING_TIMEOUT_S,
+)
+
+
+bulk_pool = PoolAcotado(
+    "bulk",
+    lambda: ProcessPoolExecutor(
+        max_workers=settings.BULK_WORKERS,
+        mp_context=multiprocessing.get_context(settings.OCR_POOL_START_METHOD),
+    ),
+    workers=settings.BULK_WORKERS,
+    cola=settings.BULK_WORKERS,
+    timeout_s=settings.BULK_TIMEOUT_S,
+)
+
+
+async def run_cpu(fn: Callable[..., Any], *args, timeout: Optional[float] = None) -> Any:
+    """Ejecuta trabajo CPU-bound (OCR, PDF) en el pool de procesos."""
+    return await cpu_pool.run(fn, *args, timeout=timeout)
+
+
+async def run_embedding(trabajo: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """Espera una llamada de embeddings con tope de pendientes (503) y plazo (504)."""
+    return await embedding_slots.run(trabajo, timeout=timeout)
+
+
+async def run_bulk(fn: Callable[..., Any], *args, timeout: Optional[float] = None) -> Any:
+    """Ejecuta extracción de ingesta masiva en su propio pool de procesos."""
+    return await bulk_pool.run(fn, *args, timeout=timeout)
+
+
+def estado_pools() -> dict:
+    return {"cpu": cpu_pool.estado(), "embeddings": embedding_slots.estado(), "bulk": bulk_pool.estado()}
+
+
+def shutdown_pools():
+    cpu_pool.shutdown()
+    bulk_pool.shutdown()
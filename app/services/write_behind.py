@@ -0,0 +1,136 @@
+import asyncio
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple, Type
+from sqlalchemy import insert
+from sqlmodel import SQLModel
+from app.config.settings import settings
+from app.db.database import async_session
+from app.services.tracing import span
+
+
+class WriteBehindBuffer:
+    """
+    Buffer en proceso para escrituras que no necesitan confirmarse antes de responder
+    (sesiones, latencias). Se vacía con INSERT multi-fila cuando junta `batch_size`
+    filas o pasa `flush_interval_s`, y se drena completo al apagar.
+    Si la cola está llena la fila se descarta y se cuenta en `dropped`.
+    """
+
+    def __init__(self, max_queue: int, batch_size: int, flush_interval_s: float):
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self._queue: "asyncio.Queue[Tuple[Type[SQLModel], dict]]" = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._cerrando = asyncio.Event()
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self):
+        if self._cerrando.is_set():
+            return  # tras stop() el engine ya está cerrado: no se reabre el flush
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, model: Type[SQLModel], row: dict) -> bool:
+        if self._cerrando.is_set():
+            self.dropped += 1
+            print(f"[WRITE_BEHIND] Apagando, se descarta fila de {model.__tablename__}")
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait((model, row))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            print(f"[WRITE_BEHIND] Cola llena, se descarta fila de {model.__tablename__}")
+            return False
+        self.enqueued += 1
+        return True
+
+    async def _siguiente(self, timeout: Optional[float]):
+        """Siguiente fila de la cola; None si vence `timeout` o si se pidió el cierre y no queda nada."""
+        try:
+            return self._queue.get_nowait()
+        except asyncio.QueueEmpty:
+            if self._cerrando.is_set():
+                return None
+        get = asyncio.ensure_future(self._queue.get())
+        cierre = asyncio.ensure_future(self._cerrando.wait())
+        try:
+            await asyncio.wait({get, cierre}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            cierre.cancel()
+            get.cancel()
+        if get.done() and not get.cancelled():
+            return get.result()
+        return None
+
+    async def _run(self):
+        # Al pedir el cierre se termina de juntar y escribir el lote en curso y se drena la cola:
+        # nada de lo que ya salió de la cola se pierde por cancelar la tarea a mitad de camino
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self._siguiente(None)
+            if first is None:
+                return
+            batch = [first]
+            deadline = loop.time() + self.flush_interval_s
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0 and not self._cerrando.is_set():
+                    break
+                item = await self._siguiente(max(remaining, 0))
+                if item is None:
+                    break
+                batch.append(item)
+            await self._write(batch)
+
+    async def _write(self, batch: List[Tuple[Type[SQLModel], dict]]):
+        por_modelo: Dict[Type[SQLModel], List[dict]] = defaultdict(list)
+        for model, row in batch:
+            por_modelo[model].append(row)
+
+        try:
+            with span("db.write_behind", rows=len(batch)):
+                async with async_session() as session:
+                    for model, rows in por_modelo.items():
+                        await session.execute(insert(model), rows)
+                    await session.commit()
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"[WRITE_BEHIND] Error escribiendo lote de {len(batch)} filas: {e}")
+
+    async def stop(self):
+        """Detiene el flush periódico y escribe todo lo que quede en cola (incluido el lote en curso)."""
+        self._cerrando.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+        # Por si la tarea nunca llegó a arrancar
+        pendientes = []
+        while not self._queue.empty():
+            pendientes.append(self._queue.get_nowait())
+        for i in range(0, len(pendientes), self.batch_size):
+            await self._write(pendientes[i:i + self.batch_size])
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
+
+
+write_behind = WriteBehindBuffer(
+    max_queue=settings.WRITE_BEHIND_MAX_QUEUE,
+    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+    flush_interval_s=settings.WRITE_BEHIND_FLUSH_MS / 1000,
+)
@@ -6,9 +6,18 @@ from hypercorn.asyncio import serve
 from hypercorn.config import Config
 from app.api.agent_routes import setup_routes
 from sqlmodel import SQLModel
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
-from app.db.database import engine
-from app.db.database import create_pgvector_index
+from app.db.database import engine, dispose_engine
+from app.db.database import create_fulltext_search_columns
+from app.db.migrations import run_schema_migrations, migrate_legacy_embeddings, migrate_vector_storage
+from app.services.vector_search import create_vector_indexes, verify_vector_index_usage
+from app.config.settings import settings
+from app.services.worker_pool import shutdown_pools
+from app.services.write_behind import write_behind
+from app.services.metrics_service import run_snapshot_loop
+from app.services.tracing import start_exporter, stop_exporter
+from app.services.http_client import close_http_client
+from app.services.ocr_warmup import warm_up_ocr_pool
+from app.services.job_queue import start_job_workers, stop_job_workers, watch_completed_ingests
 from blacksheep.server.responses import Response
 from blacksheep.server import Application
 import os
@@ -20,10 +29,6 @@ load_dotenv()
 os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY", "")
 os.environ["OPENROUTER_API_KEY"] = os.getenv("OPENROUTER_API_KEY", "")
 
-# Crear motor async con SQLAlchemy
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine: AsyncEngine = create_async_engine(DATABASE_URL, echo=False)
-
 # Crear app BlackSheep
 app = Application()
 
@@ -38,19 +43,44 @@ app.use_cors(
 
 setup_routes(app)
 
+# Tareas periódicas en segundo plano (se cancelan en on_stop)
+background_tasks = []
+
 # Crear tablas (solo si no existen)
 @app.on_start
 async def on_start():
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
 
-    await create_pgvector_index()
+    await run_schema_migrations()
+    await migrate_legacy_embeddings()
+    await migrate_vector_storage()
+    await create_vector_indexes()
+    await create_fulltext_search_columns()
+    if settings.VECTOR_INDEX_CHECK:
+        await verify_vector_index_usage()
+    write_behind.start()
+    start_exporter()
+    background_tasks.append(asyncio.create_task(run_snapshot_loop()))
+    if settings.OCR_WARMUP:
+        # No bloquea el arranque: /ready reporta cuando el OCR está caliente
+        background_tasks.append(asyncio.create_task(warm_up_ocr_pool()))
+    # Cola de extracción: workers dentro de la web (JOB_WEB_WORKERS) y/o en app/cli/job_worker.py
+    start_job_workers(settings.JOB_WEB_WORKERS)
+    background_tasks.append(asyncio.create_task(watch_completed_ingests()))
     print("✅ Base de datos inicializada y pgvector index asegurado.")
 
 @app.on_stop
 async def on_stop():
-    # Aquí podrías cerrar el engine si necesitas limpieza manual
-    pass
+    for task in background_tasks:
+        task.cancel()
+    # Antes de cerrar los pools: los trabajos en curso vuelven a la cola
+    await stop_job_workers()
+    shutdown_pools()
+    await stop_exporter()
+    await close_http_client()
+    await write_behind.stop()
+    await dispose_engine()
 
 if __name__ == "__main__":
     config = Config()